@@ -1,328 +1,327 @@
-from pathlib import Path
+import time
+
+SCRIPT_START = time.perf_counter()
+
+import functools
+import importlib
+import json
+from collections import namedtuple
+
 import numpy as np
 import pandas as pd
 import streamlit as st
-import altair as alt
-import pydeck as pdk
 
-# ---------------------------------------------------------------
-# Base directory: where app.py and all CSVs live
-# ---------------------------------------------------------------
-BASE_DIR = Path(__file__).resolve().parent
+from ctev import (
+    availability,
+    forecast,
+    instrument,
+    lod,
+    pipeline,
+    pressure,
+    regression,
+    scenarios,
+    shared,
+    siting,
+)
+from ctev.cube import EvCube
+from ctev.gazetteer import for_state, unmatched_report
+from ctev.spatial import charging_deserts, station_access
+from ctev.spec_cache import DeckSpec, SpecCache
 
-HEALTH_PATH = BASE_DIR / "HDPulse_data_export.csv"
-EV_REG_PATH = BASE_DIR / "Electric_Vehicle_Registration_Data.csv"
-CHARGE_PATH = BASE_DIR / "Electric_Vehicle_Charging_Stations.csv"
-POP_PATH = BASE_DIR / "2016cityandcountyenergyprofiles.csv"
 
-# ---------------------------------------------------------------
-# City → county mapping for Connecticut
-# ---------------------------------------------------------------
-CT_CITY_TO_COUNTY = {
-    # Fairfield
-    "BETHEL": "Fairfield",
-    "BRIDGEPORT": "Fairfield",
-    "BROOKFIELD": "Fairfield",
-    "DANBURY": "Fairfield",
-    "DARIEN": "Fairfield",
-    "EASTON": "Fairfield",
-    "FAIRFIELD": "Fairfield",
-    "GREENWICH": "Fairfield",
-    "MONROE": "Fairfield",
-    "NEW CANAAN": "Fairfield",
-    "NEW FAIRFIELD": "Fairfield",
-    "NEWTOWN": "Fairfield",
-    "NORWALK": "Fairfield",
-    "REDDING": "Fairfield",
-    "RIDGEFIELD": "Fairfield",
-    "SHELTON": "Fairfield",
-    "SHERMAN": "Fairfield",
-    "STAMFORD": "Fairfield",
-    "STRATFORD": "Fairfield",
-    "TRUMBULL": "Fairfield",
-    "WESTON": "Fairfield",
-    "WESTPORT": "Fairfield",
-    "WILTON": "Fairfield",
-
-    # Hartford (examples)
-    "AVON": "Hartford",
-    "BERLIN": "Hartford",
-    "BLOOMFIELD": "Hartford",
-    "BRISTOL": "Hartford",
-    "BURLINGTON": "Hartford",
-    "CANTON": "Hartford",
-    "EAST GRANBY": "Hartford",
-    "EAST HARTFORD": "Hartford",
-    "EAST WINDSOR": "Hartford",
-    "ENFIELD": "Hartford",
-    "FARMINGTON": "Hartford",
-    "GLASTONBURY": "Hartford",
-    "GRANBY": "Hartford",
-    "HARTFORD": "Hartford",
-    "MANCHESTER": "Hartford",
-    "MARLBOROUGH": "Hartford",
-    "NEW BRITAIN": "Hartford",
-    "NEWINGTON": "Hartford",
-    "PLAINVILLE": "Hartford",
-    "ROCKY HILL": "Hartford",
-    "SIMSBURY": "Hartford",
-    "SOUTH WINDSOR": "Hartford",
-    "SOUTHINGTON": "Hartford",
-    "SUFFIELD": "Hartford",
-    "WEST HARTFORD": "Hartford",
-    "WETHERSFIELD": "Hartford",
-    "WINDSOR": "Hartford",
-    "WINDSOR LOCKS": "Hartford",
-
-    # New Haven (examples)
-    "ANSONIA": "New Haven",
-    "BEACON FALLS": "New Haven",
-    "BETHANY": "New Haven",
-    "BRANFORD": "New Haven",
-    "CHESHIRE": "New Haven",
-    "DERBY": "New Haven",
-    "EAST HAVEN": "New Haven",
-    "HAMDEN": "New Haven",
-    "MERIDEN": "New Haven",
-    "MIDDLEBURY": "New Haven",
-    "MILFORD": "New Haven",
-    "NAUGATUCK": "New Haven",
-    "NEW HAVEN": "New Haven",
-    "NORTH BRANFORD": "New Haven",
-    "NORTH HAVEN": "New Haven",
-    "ORANGE": "New Haven",
-    "OXFORD": "New Haven",
-    "PROSPECT": "New Haven",
-    "SEYMOUR": "New Haven",
-    "SHELTON": "New Haven",
-    "WALLINGFORD": "New Haven",
-    "WATERBURY": "New Haven",
-    "WEST HAVEN": "New Haven",
-    "WOLCOTT": "New Haven",
-
-    # New London (examples)
-    "COLCHESTER": "New London",
-    "EAST LYME": "New London",
-    "GROTON": "New London",
-    "LEDYARD": "New London",
-    "MONTVILLE": "New London",
-    "NEW LONDON": "New London",
-    "NORWICH": "New London",
-    "OLD LYME": "New London",
-    "OLD SAYBROOK": "Middlesex",
-    "STONINGTON": "New London",
-    "WATERFORD": "New London",
-}
+@st.cache_resource(show_spinner=False)
+def startup_timings():
+    # Cold-start breakdown of this server process (first script run and the
+    # first load of each state), shown under Diagnostics
+    return {}
+
+
+STARTUP = startup_timings()
+STARTUP.setdefault("imports", time.perf_counter() - SCRIPT_START)
+
+
+class LazyModule:
+    """`name` imported on first attribute access.
+
+    altair and pydeck take about half a second to import; deferring them lets
+    the KPIs render before the first chart needs them.
+    """
+
+    def __init__(self, name, setup=None):
+        self._name = name
+        self._setup = setup
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            start = time.perf_counter()
+            with instrument.stage(f"import.{self._name}"):
+                module = importlib.import_module(self._name)
+                if self._setup is not None:
+                    self._setup(module)
+            STARTUP.setdefault(f"import {self._name}", time.perf_counter() - start)
+            self._module = module
+        return getattr(self._module, attr)
+
+
+alt = LazyModule("altair", lambda m: m.data_transformers.disable_max_rows())
+pdk = LazyModule("pydeck")
 
 # ---------------------------------------------------------------
-# Data loading & cleaning
+# Data loading & cleaning (see ctev.pipeline; also runs headless via
+# `python -m ctev`)
 # ---------------------------------------------------------------
-@st.cache_data(show_spinner=True)
-def load_and_clean_data():
-    # ----- Health / income data -----
-    health_raw = pd.read_csv(
-        HEALTH_PATH,
-        skiprows=4,
-        engine="python",
-    )
-    health_raw.columns = health_raw.columns.str.strip()
-    health = health_raw.rename(
-        columns={
-            "County": "county",
-            "FIPS": "fips",
-            "Value (Dollars)": "median_income",
-            "Rank within US (of 3141 counties)": "us_rank",
-        }
+@st.cache_resource(show_spinner="Splitting sources by state…")
+def load_states():
+    # States with a gazetteer and registration/station/energy data
+    start = time.perf_counter()
+    states = pipeline.available_states()
+    STARTUP.setdefault("state partitions", time.perf_counter() - start)
+    return states
+
+
+# With CTEV_BACKEND=sqlite registrations stay in an on-disk SQLite file and
+# the sidebar filters run as SQL; ev_clean / ev_reg are then None.
+SQL_BACKEND = pipeline.BACKEND == "sqlite"
+
+
+@st.cache_resource(show_spinner="Building the SQLite store…")
+def load_sql_store(state):
+    return pipeline.sql_store(state=state)
+
+
+@st.cache_resource(show_spinner=True)
+def load_and_clean_data(state):
+    # One read-only copy per state and process, shared by every session (no
+    # per-session unpickling); ev_clean and ev_reg are the same frame. States
+    # nobody selected are never loaded.
+    session = instrument.active()
+    recorder = instrument.Recorder(memory=session.memory if session else False)
+    instrument.activate(recorder)
+    try:
+        start = time.perf_counter()
+        if SQL_BACKEND:
+            store = load_sql_store(state)
+            frames = (
+                None,
+                store.stations(),
+                store.table("health"),
+                store.table("counties"),
+                None,
+            )
+        else:
+            frames = pipeline.load_and_clean_data(state=state)
+    finally:
+        instrument.activate(session)
+    STARTUP.setdefault("loads", {})[state] = (
+        time.perf_counter() - start,
+        recorder.finished,
     )
-    health["county"] = (
-        health["county"]
-        .astype(str)
-        .str.replace(" County", "", regex=False)
-        .str.strip()
-    )
-    health["median_income"] = pd.to_numeric(health["median_income"], errors="coerce")
-    health["us_rank"] = pd.to_numeric(health["us_rank"], errors="coerce")
-
-    # If state column exists, keep CT only
-    if "State Abbreviation" in health_raw.columns:
-        health["state"] = health_raw["State Abbreviation"].str.strip()
-        health = health[health["state"] == "CT"]
-
-    # ----- EV registration data -----
-    ev_raw = pd.read_csv(EV_REG_PATH)
-    ev = ev_raw.copy()
-    ev.columns = (
-        ev.columns.str.strip()
-        .str.lower()
-        .str.replace(" ", "_")
-        .str.replace(r"[^a-z0-9_]", "", regex=True)
-    )
-
-    # CT only if state column exists
-    if "state" in ev.columns:
-        ev = ev[ev["state"].astype(str).str.upper() == "CT"]
-
-    # Clean text columns when present
-    if "primary_customer_city" in ev.columns:
-        ev["primary_customer_city"] = (
-            ev["primary_customer_city"].astype(str).str.title().str.strip()
-        )
-    if "vehicle_make" in ev.columns:
-        ev["vehicle_make"] = ev["vehicle_make"].astype(str).str.title().str.strip()
-    if "vehicle_model" in ev.columns:
-        ev["vehicle_model"] = ev["vehicle_model"].astype(str).str.title().str.strip()
-
-    # Vehicle year
-    if "model_year" in ev.columns:
-        ev["vehicle_year"] = pd.to_numeric(ev["model_year"], errors="coerce")
-    elif "vehicle_year" in ev.columns:
-        ev["vehicle_year"] = pd.to_numeric(ev["vehicle_year"], errors="coerce")
-
-    ev_clean = ev.copy()
-
-    # Drop duplicates if a unique key exists
-    if "vin" in ev_clean.columns:
-        ev_clean = ev_clean.drop_duplicates(subset=["vin"])
-    elif "id" in ev_clean.columns:
-        ev_clean = ev_clean.drop_duplicates(subset=["id"])
-
-    # EV category from fuel code
-    if "fuel_code" in ev_clean.columns:
-        ev_clean["ev_category"] = ev_clean["fuel_code"].replace(
-            {"E00": "BEV", "H04": "PHEV"}
-        ).fillna("Other")
+    if session is not None:
+        session.adopt(recorder.finished)
+    frozen = {}
+    return tuple(
+        f if f is None else frozen.setdefault(id(f), shared.freeze(f))
+        for f in frames
+    )
+
+
+@st.cache_data(show_spinner=False)
+def load_memory_report(state):
+    return pipeline.memory_report(state=state)
+
+
+@st.cache_resource(show_spinner=False)
+def load_spec_cache():
+    # Serialized chart / deck specs shared by every session
+    return SpecCache()
+
+
+@st.cache_resource(show_spinner=False)
+def load_data_version(state):
+    return pipeline.data_version(state=state)
+
+
+@st.cache_resource(show_spinner=False)
+def load_unmatched_cities(state):
+    # City strings that no town / village / fuzzy match could resolve
+    ev_clean, ch, health, county_full, ev_reg = load_and_clean_data(state)
+    if SQL_BACKEND:
+        ev_unmatched = load_sql_store(state).unmatched_cities()
     else:
-        ev_clean["ev_category"] = "Unknown"
+        ev_unmatched = unmatched_report(ev_reg, "primary_customer_city")
+    return ev_unmatched, unmatched_report(ch, "city")
 
-    ev_clean["ev_count"] = 1
 
-    # ----- Charging station data -----
-    ch_raw = pd.read_csv(CHARGE_PATH)
-    ch = ch_raw.copy()
-    ch.columns = (
-        ch.columns.str.lower()
-        .str.replace(" ", "_")
-        .str.replace(r"[^a-z0-9_]", "", regex=True)
-    )
+def registration_cube(state, group):
+    if SQL_BACKEND:
+        # GROUP BY in SQLite; only the aggregated rows come back
+        counts = load_sql_store(state).group_counts(group)
+        return EvCube.from_frame(counts, group_col=group, count_col="n")
+    return EvCube.from_frame(load_and_clean_data(state)[4], group_col=group)
 
-    if "city" in ch.columns:
-        ch["city"] = ch["city"].astype(str).str.title().str.strip()
 
-    # Charger counts
-    for col in ["ev_level1_evse_num", "ev_level2_evse_num", "ev_dc_fast_count"]:
-        if col in ch.columns:
-            ch[col] = pd.to_numeric(ch[col], errors="coerce").fillna(0).astype(int)
-        else:
-            ch[col] = 0
-
-    ch["total_chargers"] = (
-        ch.get("ev_level1_evse_num", 0)
-        + ch.get("ev_level2_evse_num", 0)
-        + ch.get("ev_dc_fast_count", 0)
-    )
-    ch["has_dc_fast"] = (ch.get("ev_dc_fast_count", 0) > 0).astype(int)
-    ch["has_level2"] = (ch.get("ev_level2_evse_num", 0) > 0).astype(int)
-    ch["has_level1"] = (ch.get("ev_level1_evse_num", 0) > 0).astype(int)
-
-    # Location columns
-    if {"longitude", "latitude"}.issubset(ch.columns):
-        ch["lon"] = ch["longitude"]
-        ch["lat"] = ch["latitude"]
-    elif {"lng", "lat"}.issubset(ch.columns):
-        # already fine
-        pass
-
-    # ----- Map city → county -----
-    ev_reg = ev_clean.copy()
-
-    if "primary_customer_city" in ev_reg.columns:
-        ev_reg["city_clean"] = (
-            ev_reg["primary_customer_city"].astype(str).str.upper().str.strip()
-        )
+@st.cache_resource(show_spinner=False)
+def load_ev_cube(state):
+    # county × ev_category × vehicle_year counts behind the KPIs
+    return registration_cube(state, "county")
+
+
+@st.cache_resource(show_spinner=False)
+def load_town_cube(state):
+    return registration_cube(state, "town")
+
+
+@st.cache_resource(show_spinner=False)
+def load_town_pressure(state):
+    # Town CPI engine: cumulative town counts lined up with per-town chargers
+    ch = load_and_clean_data(state)[1]
+    return pressure.TownPressure(load_town_cube(state), ch, for_state(state).table)
+
+
+@st.cache_resource(show_spinner=False)
+def load_town_forecast_fit(state):
+    # Fitted once per data version; moving the horizon only re-evaluates
+    return forecast.fit_cube(load_town_cube(state))
+
+
+@st.cache_resource(show_spinner=False)
+def load_station_availability(state):
+    # Weekly access bitmaps, parsed once per distinct "Access Days Time" text
+    return availability.StationAvailability(load_and_clean_data(state)[1])
+
+
+@st.cache_resource(show_spinner=False)
+def load_siting_coverage(state, candidate_kind, cell_km, radius_km):
+    # Town centroids, candidate sites and the sparse coverage between them;
+    # filters only change the demand weights
+    points = siting.town_points(for_state(state).table)
+    if candidate_kind == "grid":
+        candidates = siting.grid_candidates(points, cell_km)
     else:
-        ev_reg["city_clean"] = ""
+        candidates = siting.town_candidates(for_state(state).table)
+    return points, candidates, siting.Coverage(candidates, points, radius_km)
 
-    ch["city_clean"] = ch.get("city", "").astype(str).str.upper().str.strip()
 
-    ev_reg["county"] = ev_reg["city_clean"].map(CT_CITY_TO_COUNTY)
-    ch["county"] = ch["city_clean"].map(CT_CITY_TO_COUNTY)
+@st.cache_resource(show_spinner=False)
+def load_station_pyramid(state):
+    # Mappable stations plus their multi-resolution grid bins, built once
+    stations = pipeline.map_stations(load_and_clean_data(state)[1])
+    return shared.freeze(stations), lod.GridPyramid(stations)
 
-    # ----- County EV & charging summaries -----
-    ev_count_by_county = (
-        ev_reg.groupby("county")
-        .size()
-        .reset_index(name="ev_registrations")
-        .sort_values("ev_registrations", ascending=False)
-    )
 
-    ch_summary_by_county = (
-        ch.groupby("county")
-        .agg(
-            total_stations=("station_name", "count") if "station_name" in ch.columns else ("city", "count"),
-            total_chargers=("total_chargers", "sum"),
-            fast_chargers=("has_dc_fast", "sum"),
-            level2_chargers=("has_level2", "sum"),
-            level1_chargers=("has_level1", "sum"),
-        )
-        .reset_index()
-    )
+@st.cache_data(show_spinner=False)
+def load_us_counties():
+    return scenarios.us_counties(pipeline.POP_PATH)
 
-    county_full = (
-        ev_count_by_county
-        .merge(ch_summary_by_county, on="county", how="outer")
-        .merge(health[["county", "median_income"]], on="county", how="left")
-    )
 
-    # EVs per charger
-    county_full["evs_per_charger"] = (
-        county_full["ev_registrations"]
-        / county_full["total_chargers"].replace({0: np.nan})
+@st.cache_data(show_spinner="Running grid scenarios…")
+def run_grid_scenarios(state, us_wide, n_scenarios, horizon_years, growth, peak_share):
+    counties = load_us_counties() if us_wide else load_and_clean_data(state)[3]
+    ranges = scenarios.DEFAULT_RANGES._replace(growth=growth, peak_share=peak_share)
+    return scenarios.simulate(
+        counties.dropna(subset=["county"]),
+        n_scenarios=n_scenarios,
+        horizon_years=horizon_years,
+        ranges=ranges,
     )
 
-    # ----- Population from 2016 city/county energy profiles -----
-    raw_pop = pd.read_csv(POP_PATH, header=None, low_memory=False)
 
-    ct_rows = raw_pop[
-        (raw_pop[1].astype(str).str.upper() == "CT")
-        | (raw_pop[2].astype(str).str.contains(", CT", na=False))
-    ].copy()
+@st.cache_data(show_spinner=False)
+def run_driver_regression(state, level, ev_category, years, n_boot):
+    # Registrations for the EV type / year filters against the drivers
+    if level == "town":
+        table = regression.town_table(load_town_pressure(state), ev_category, years)
+    else:
+        county_full = load_and_clean_data(state)[3]
+        counts = load_ev_cube(state).by_group(ev_category, years)
+        table = county_full.dropna(subset=["county"]).assign(
+            ev_registrations=lambda d: d["county"].map(counts).fillna(0)
+        )
+    return regression.estimate(table, level=level, n_boot=n_boot)
+
+
+@st.cache_data(show_spinner=False)
+def load_town_access(state, radius_km):
+    # Nearest-charger distances and chargers within the radius per town centroid
+    ch = load_and_clean_data(state)[1]
+    return station_access(for_state(state).table, ch, radius_km)
+
+
+# Everything built from the source files; cleared when one of them changes
+SOURCE_CACHES = (
+    load_states,
+    load_sql_store,
+    load_and_clean_data,
+    load_memory_report,
+    load_data_version,
+    load_unmatched_cities,
+    load_ev_cube,
+    load_town_cube,
+    load_town_pressure,
+    load_town_forecast_fit,
+    load_station_availability,
+    load_station_pyramid,
+    load_us_counties,
+    run_grid_scenarios,
+    run_driver_regression,
+    load_town_access,
+)
 
-    # From inspection: col 4 = county name, col 8 = 2016 population
-    ct_county = ct_rows[[4, 8]].copy()
-    ct_county.columns = ["county_raw", "population_2016"]
 
-    ct_county["county"] = (
-        ct_county["county_raw"]
-        .astype(str)
-        .str.replace(" County", "", regex=False)
-        .str.strip()
-    )
-    ct_county["population_2016"] = pd.to_numeric(
-        ct_county["population_2016"], errors="coerce"
-    )
+@st.cache_resource(show_spinner=False)
+def loaded_sources():
+    # Source stamp the process-wide caches were built from
+    return {}
+
 
-    ct_county = ct_county[["county", "population_2016"]]
+def refresh_if_sources_changed():
+    # A stat per rerun: a daily drop shows up without a restart. The reload
+    # then takes the pipeline's delta path and gets a new data_version.
+    stamp = pipeline.source_stamp()
+    seen = loaded_sources()
+    if seen.setdefault("stamp", stamp) != stamp:
+        for cached in SOURCE_CACHES:
+            cached.clear()
+        seen["stamp"] = stamp
 
-    # Merge population into county_full
-    county_full = county_full.merge(ct_county, on="county", how="left")
 
-    # Per-capita metrics
-    county_full["evs_per_1k_people"] = (
-        county_full["ev_registrations"]
-        / (county_full["population_2016"] / 1000.0)
+# ---------------------------------------------------------------
+# Diagnostics (opt-in from the sidebar): per-stage timings of this rerun.
+# Widget values are already in session_state when the script starts.
+# ---------------------------------------------------------------
+diagnostics_recorder = None
+if st.session_state.get("diagnostics", False):
+    diagnostics_recorder = instrument.Recorder(
+        memory=st.session_state.get("diagnostics_memory", False)
     )
-    county_full["chargers_per_1k_people"] = (
-        county_full["total_chargers"]
-        / (county_full["population_2016"] / 1000.0)
+instrument.activate(diagnostics_recorder)
+
+# ---------------------------------------------------------------
+# Load data (one state at a time; switching back is a cache hit)
+# ---------------------------------------------------------------
+with instrument.stage("data.load"):
+    refresh_if_sources_changed()
+    states = load_states()
+    state = st.sidebar.selectbox(
+        "State",
+        states,
+        index=states.index(pipeline.DEFAULT_STATE) if pipeline.DEFAULT_STATE in states else 0,
+        help="States with registration, station and energy-profile data and a town gazetteer.",
     )
+    ev_clean, ch, health, county_full, ev_reg = load_and_clean_data(state)
+    ev_cube = load_ev_cube(state)
+    spec_cache = load_spec_cache()
+    data_version = load_data_version(state)
 
-    return ev_clean, ch, health, county_full, ev_reg
 
+def show_chart(key, build):
+    # Altair chart served from the shared spec cache; build() runs on a miss
+    spec = spec_cache.get_or_build(
+        key + (data_version,), lambda: json.dumps(build().to_dict())
+    )
+    st.vega_lite_chart(json.loads(spec), use_container_width=True)
 
-# ---------------------------------------------------------------
-# Load data
-# ---------------------------------------------------------------
-ev_clean, ch, health, county_full, ev_reg = load_and_clean_data()
 
 # ---------------------------------------------------------------
 # Streamlit page config
@@ -333,8 +332,6 @@ st.set_page_config(
     page_icon="🚗",
 )
 
-alt.data_transformers.disable_max_rows()
-
 st.title("CT EV Infrastructure & Energy Capacity Explorer")
 
 st.markdown(
@@ -354,21 +351,17 @@ The KPIs and visuals will update to reflect your current view.
 # ---------------------------------------------------------------
 st.sidebar.header("Filters")
 
-county_options = ["All CT"] + sorted(
+all_counties = f"All {state}"
+county_options = [all_counties] + sorted(
     county_full["county"].dropna().unique().tolist()
 )
 selected_county = st.sidebar.selectbox("Focus on county", county_options, index=0)
 
-ev_category_options = ["All EV types"] + sorted(
-    ev_clean["ev_category"].dropna().unique().tolist()
-)
+ev_category_options = ["All EV types"] + ev_cube.categories
 selected_ev_cat = st.sidebar.selectbox("EV type", ev_category_options, index=0)
 
-if "vehicle_year" in ev_clean.columns and ev_clean["vehicle_year"].notna().any():
-    year_min, year_max = (
-        int(ev_clean["vehicle_year"].min()),
-        int(ev_clean["vehicle_year"].max()),
-    )
+if ev_cube.year_range is not None and ev_cube.total_rows > 0:
+    year_min, year_max = ev_cube.year_range
 else:
     year_min, year_max = (2000, 2025)
 
@@ -385,50 +378,110 @@ st.sidebar.markdown(
     "- Start on *Overview* for KPIs\n"
     "- Use *County comparison* when writing results\n"
     "- Use *Maps & gaps* to discuss geography\n"
+    "- Use *Charger siting* to place new sites\n"
 )
 
-# ---------------------------------------------------------------
-# Apply filters for EV and charging data
-# ---------------------------------------------------------------
-ev_filtered = ev_clean.copy()
-if selected_ev_cat != "All EV types":
-    ev_filtered = ev_filtered[ev_filtered["ev_category"] == selected_ev_cat]
-
-if "vehicle_year" in ev_filtered.columns:
-    ev_filtered = ev_filtered[
-        (ev_filtered["vehicle_year"] >= year_range[0])
-        & (ev_filtered["vehicle_year"] <= year_range[1])
-    ]
-
-if selected_county != "All CT":
-    if "primary_customer_city" in ev_filtered.columns:
-        ev_filtered["city_clean"] = (
-            ev_filtered["primary_customer_city"].astype(str).str.upper().str.strip()
-        )
-        ev_filtered["county"] = ev_filtered["city_clean"].map(CT_CITY_TO_COUNTY)
-        ev_filtered = ev_filtered[ev_filtered["county"] == selected_county]
-
-    ch_filtered = ch[ch["county"] == selected_county]
-    county_filtered = county_full[county_full["county"] == selected_county]
-else:
-    ch_filtered = ch.copy()
-    county_filtered = county_full.copy()
+st.sidebar.markdown("---")
+st.sidebar.checkbox(
+    "Show diagnostics",
+    key="diagnostics",
+    help="Time every load step and tab render for this session.",
+)
+if st.session_state.get("diagnostics"):
+    st.sidebar.checkbox(
+        "Trace memory (slower)",
+        key="diagnostics_memory",
+        help="Record the peak memory allocated by each stage.",
+    )
 
 # ---------------------------------------------------------------
-# Tabs
+# Current selection, handed to every tab
 # ---------------------------------------------------------------
-tab_overview, tab_docs, tab_county, tab_maps = st.tabs(
-    ["📊 Overview", "📚 Data documentation", "🏛️ County comparison", "🗺️ Maps & gaps"]
+View = namedtuple(
+    "View", ["state", "county", "ev_category", "years", "year_max", "data_version"]
 )
 
+view = View(
+    state=state,
+    county=None if selected_county == all_counties else selected_county,
+    ev_category=None if selected_ev_cat == "All EV types" else selected_ev_cat,
+    years=tuple(year_range),
+    year_max=year_max,
+    data_version=data_version,
+)
+
+
+def view_fragment(stage_name):
+    """`st.fragment` for one view: its widgets rerun only this function.
+
+    Such partial reruns don't pass through the script's diagnostics block, so
+    with diagnostics on they are timed and logged on their own.
+    """
+
+    def decorate(func):
+        @st.fragment
+        @functools.wraps(func)
+        def run(*args):
+            recorder = None
+            if instrument.active() is None and st.session_state.get("diagnostics"):
+                recorder = instrument.Recorder(
+                    memory=st.session_state.get("diagnostics_memory", False)
+                )
+                instrument.activate(recorder)
+            try:
+                with instrument.stage(stage_name):
+                    func(*args)
+            finally:
+                if recorder is not None:
+                    instrument.activate(None)
+                    recorder.write_log()
+
+        return run
+
+    return decorate
+
+
+def filtered_ev_sample(view, n):
+    if SQL_BACKEND:
+        # Filters pushed down as a WHERE clause on the indexed columns
+        return load_sql_store(view.state).sample(
+            n, view.county, view.ev_category, view.years
+        )
+    # Boolean mask over the shared frame; only the first n rows are copied
+    ev_reg = load_and_clean_data(view.state)[4]
+    mask = np.ones(len(ev_reg), dtype=bool)
+    if view.ev_category is not None:
+        mask &= (ev_reg["ev_category"] == view.ev_category).to_numpy()
+    if "vehicle_year" in ev_reg.columns:
+        in_range = ev_reg["vehicle_year"].between(view.years[0], view.years[1])
+        mask &= in_range.to_numpy(dtype=bool, na_value=False)
+    if view.county is not None:
+        mask &= (ev_reg["county"] == view.county).to_numpy()
+    return shared.head_where(ev_reg, mask, n)
+
+
 # ---------------------------------------------------------------
 # TAB 1 – OVERVIEW
 # ---------------------------------------------------------------
-with tab_overview:
+def overview_tab(view):
+    state, county_key = view.state, view.county
+    ev_clean, ch, health, county_full, ev_reg = load_and_clean_data(state)
+    ev_cube = load_ev_cube(state)
+
+    with instrument.stage("filters"):
+        # Counts come from the pre-aggregated cube; only the sample table needs rows
+        total_ev_records = ev_cube.count(county_key, view.ev_category, view.years)
+
+        if county_key is not None:
+            ch_filtered = ch[ch["county"] == county_key]
+            county_filtered = county_full[county_full["county"] == county_key]
+        else:
+            ch_filtered = ch
+            county_filtered = county_full
+
     st.subheader("Big picture")
 
     # KPIs based on filtered data
-    total_ev_records = len(ev_filtered)
     total_charging_stations = len(ch_filtered)
     counties_in_view = county_filtered["county"].nunique()
 
@@ -449,6 +502,8 @@ with tab_overview:
     else:
         c4.metric("Total public chargers", "N/A")
 
+    STARTUP.setdefault("first_kpi", time.perf_counter() - SCRIPT_START)
+
     c5, c6 = st.columns(2)
     if evs_per_charger is not None:
         c5.metric("EVs per public charger", f"{evs_per_charger:,.1f}")
@@ -456,9 +511,11 @@ with tab_overview:
         c5.metric("EVs per public charger", "No chargers in view")
 
     share_of_state = (
-        total_ev_records / len(ev_clean) * 100 if len(ev_clean) > 0 else 0
+        total_ev_records / ev_cube.total_rows * 100 if ev_cube.total_rows > 0 else 0
     )
-    c6.metric("Share of CT EV records in view", f"{share_of_state:,.1f}%")
+    c6.metric(f"Share of {state} EV records in view", f"{share_of_state:,.1f}%")
+
+    availability_view(view)
 
     st.markdown(
         """
@@ -473,12 +530,101 @@ with tab_overview:
     )
 
     st.markdown("#### Sample of filtered EV registrations")
-    st.dataframe(ev_filtered.head(50), use_container_width=True)
+    st.dataframe(filtered_ev_sample(view, 50), use_container_width=True)
+
+
+@view_fragment("overview.availability")
+def availability_view(view):
+    # EVs per charger that is actually open, hour by hour across the week
+    st.markdown("##### EVs per open charger through the week")
+    st.markdown(
+        "Stations only count while their listed access hours are open. "
+        "Tesla-only and other single-make stations are left out; stations "
+        "with vague hours (\"business hours\") get a typical 8am–6pm Mon–Sat "
+        "window and stations without hours count as always open."
+    )
+    stations = load_station_availability(view.state)
+    evs = load_ev_cube(view.state).count(view.county, view.ev_category, view.years)
+
+    a1, a2 = st.columns(2)
+    hour = a1.select_slider(
+        "Hour of the week",
+        options=range(availability.HOURS_PER_WEEK),
+        value=18,
+        format_func=availability.hour_label,
+    )
+    exclude = availability.RESTRICTED
+    if a2.checkbox("Leave out customer / guest-only stations", value=False):
+        exclude |= availability.FLAG_CUSTOMERS_ONLY
+
+    weekly = stations.weekly(exclude)
+    always = stations.chargers_always(exclude)
+    if view.county is not None:
+        weekly = weekly.reindex([view.county], fill_value=0)
+        always = always.reindex([view.county], fill_value=0)
+    open_by_hour = weekly.sum().to_numpy()
+    ratio = availability.evs_per_charger(evs, open_by_hour)
+    ratio_always = availability.evs_per_charger(evs, always.sum())
+
+    label = availability.hour_label(hour)
+    m1, m2 = st.columns(2)
+    m1.metric(f"Chargers open to all makes, {label}", f"{open_by_hour[hour]:,.0f}")
+    if np.isnan(ratio[hour]):
+        m2.metric(f"EVs per open charger, {label}", "No chargers open")
+    else:
+        m2.metric(
+            f"EVs per open charger, {label}",
+            f"{ratio[hour]:,.1f}",
+            delta=f"{ratio[hour] - ratio_always:+,.1f} vs. all hours"
+            if not np.isnan(ratio_always)
+            else None,
+            delta_color="inverse",
+        )
+
+    week = pd.DataFrame(
+        {
+            "hour": np.arange(availability.HOURS_PER_WEEK),
+            "when": [availability.hour_label(h) for h in range(availability.HOURS_PER_WEEK)],
+            "chargers_open": open_by_hour,
+            "evs_per_charger": ratio,
+        }
+    )
+    line = (
+        alt.Chart(week)
+        .mark_line()
+        .encode(
+            x=alt.X(
+                "hour:Q",
+                title="Hour of the week (Mon 0:00 → Sun 24:00)",
+                scale=alt.Scale(domain=[0, availability.HOURS_PER_WEEK]),
+                axis=alt.Axis(values=list(range(0, availability.HOURS_PER_WEEK + 1, 24))),
+            ),
+            y=alt.Y("evs_per_charger:Q", title="EVs per open charger"),
+            tooltip=[
+                "when:N",
+                alt.Tooltip("chargers_open:Q", format=",.0f"),
+                alt.Tooltip("evs_per_charger:Q", format=",.1f"),
+            ],
+        )
+    )
+    rule = alt.Chart(pd.DataFrame({"hour": [hour]})).mark_rule(color="red").encode(x="hour:Q")
+    st.altair_chart(line + rule, use_container_width=True)
+
+    flag_counts = stations.flag_counts()
+    st.caption(
+        "Stations: {tesla_only} Tesla-only, {make_only} other single-make, "
+        "{customers_only} customer-only, {hours_assumed} with assumed hours, "
+        "{hours_unknown} without hours.".format(**flag_counts)
+    )
+
 
 # ---------------------------------------------------------------
 # TAB 2 – DATA DOCUMENTATION
 # ---------------------------------------------------------------
-with tab_docs:
+def docs_tab(view):
+    state = view.state
+    ev_clean, ch, health, county_full, ev_reg = load_and_clean_data(state)
+
     st.subheader("What we cleaned and how")
 
     with st.expander("EV registrations (Electric_Vehicle_Registration_Data.csv)", True):
@@ -486,23 +632,44 @@ with tab_docs:
             """
 - Standardized column names and parsed year fields.  
 - Restricted to **CT registrations only** and removed duplicate IDs.  
-- Cleaned city names, vehicle make, and model text.  
+- Cleaned city names, vehicle make, and model text, merging make / model
+  spellings such as "TESLA INC" into one name (`ctev/data/vehicle_aliases.csv`).  
+- Resolved each city to one of CT's 169 towns (villages, abbreviations and
+  misspellings included) and from there to its county.  
 - Created:
     - `ev_category` from `fuel_code` (BEV / PHEV / Other)  
-    - `ev_count = 1` so each row counts as one vehicle.  
 - Parsed `vehicle_year` from model year.
+- Kept only the columns the views use; repeated text is stored as categories.
 """
         )
-        st.dataframe(ev_clean.head(25), use_container_width=True)
+        if SQL_BACKEND:
+            st.dataframe(load_sql_store(state).sample(25), use_container_width=True)
+        else:
+            st.dataframe(ev_clean.head(25), use_container_width=True)
+
+        ev_unmatched, ch_unmatched = load_unmatched_cities(state)
+        st.caption(
+            f"{int(ev_unmatched.sum()):,} registrations and "
+            f"{int(ch_unmatched.sum()):,} stations could not be matched to a {state} town."
+        )
+        if len(ev_unmatched) or len(ch_unmatched):
+            st.dataframe(
+                pd.concat(
+                    {"registrations": ev_unmatched, "stations": ch_unmatched},
+                    axis=1,
+                ).fillna(0).astype(int).head(25),
+                use_container_width=True,
+            )
 
     with st.expander("Charging stations (Electric_Vehicle_Charging_Stations.csv)", True):
         st.markdown(
             """
 - Standardized column names and cleaned city names.  
+- Resolved each station's city to its town and county.  
 - Converted Level 1, Level 2, and DC fast columns to integers.  
 - Created:
     - `total_chargers`
-    - Boolean flags `has_dc_fast`, `has_level2`, `has_level1`  
+    - `charger_flags`, one byte with DC fast / Level 2 / Level 1 bits  
 - Added latitude/longitude for mapping.
 """
         )
@@ -534,7 +701,8 @@ This table is built by:
 
 1. Aggregating EV registrations by county → `ev_registrations`  
 2. Aggregating charging infrastructure by county → `total_stations`, `total_chargers`, etc.  
-3. Joining with `population_2016` from the DOE city & county energy profiles.  
+3. Joining with `population_2016` and residential / commercial / industrial
+   electricity consumption (`*_mwh`) from the DOE city & county energy profiles.  
 4. Computing:
     - `evs_per_charger`  
     - `evs_per_1k_people`  
@@ -543,10 +711,39 @@ This table is built by:
         )
         st.dataframe(county_full.head(25), use_container_width=True)
 
+    with st.expander("Memory footprint", False):
+        st.markdown(
+            "Columns no view uses are dropped and the rest get compact types "
+            "(categories, small integers, float32 coordinates, packed charger "
+            "flags). `ev_clean` and `ev_reg` share one frame."
+        )
+        if SQL_BACKEND:
+            store = load_sql_store(state)
+            st.caption(
+                f"Registrations are served from `{store.path}` "
+                f"({store.size_bytes() / 2**20:,.1f} MB on disk) and are not held "
+                "in memory."
+            )
+        else:
+            mem = load_memory_report(state)
+            st.dataframe(
+                mem.assign(
+                    mb_before=mem["bytes_before"] / 2**20,
+                    mb_after=mem["bytes_after"] / 2**20,
+                ).drop(columns=["bytes_before", "bytes_after"]),
+                hide_index=True,
+                use_container_width=True,
+            )
+
+
 # ---------------------------------------------------------------
 # TAB 3 – COUNTY COMPARISON
 # ---------------------------------------------------------------
-with tab_county:
+def county_tab(view):
+    ev_cat_key, year_range = view.ev_category, tuple(view.years)
+    county_full = load_and_clean_data(view.state)[3]
+    ev_cube = load_ev_cube(view.state)
+
     st.subheader("EV adoption vs charging capacity across counties")
 
     st.markdown(
@@ -555,181 +752,680 @@ Use these charts when writing about **which counties are better served vs unders
 """
     )
 
-    # Bar: EV registrations by county
+    # Bar: EV registrations by county (follows the EV type / year filters)
     st.markdown("##### EV registrations by county")
-    ev_bar = (
-        alt.Chart(county_full.dropna(subset=["ev_registrations"]))
-        .mark_bar()
-        .encode(
-            x=alt.X("ev_registrations:Q", title="EV registrations"),
-            y=alt.Y("county:N", sort="-x", title="County"),
-            tooltip=["county", "ev_registrations"],
+
+    def ev_bar():
+        ev_by_county = (
+            ev_cube.by_group(ev_cat_key, year_range)
+            .rename_axis("county")
+            .reset_index(name="ev_registrations")
         )
-    )
-    st.altair_chart(ev_bar, use_container_width=True)
+        return (
+            alt.Chart(ev_by_county)
+            .mark_bar()
+            .encode(
+                x=alt.X("ev_registrations:Q", title="EV registrations"),
+                y=alt.Y("county:N", sort="-x", title="County"),
+                tooltip=["county", "ev_registrations"],
+            )
+        )
+
+    show_chart(("ev_bar", ev_cat_key, tuple(year_range)), ev_bar)
 
     # Bar: chargers by county
     st.markdown("##### Total public chargers by county")
-    ch_bar = (
-        alt.Chart(county_full.dropna(subset=["total_chargers"]))
-        .mark_bar()
-        .encode(
-            x=alt.X("total_chargers:Q", title="Total public chargers"),
-            y=alt.Y("county:N", sort="-x", title="County"),
-            tooltip=["county", "total_chargers"],
+
+    def ch_bar():
+        return (
+            alt.Chart(county_full.dropna(subset=["total_chargers"]))
+            .mark_bar()
+            .encode(
+                x=alt.X("total_chargers:Q", title="Total public chargers"),
+                y=alt.Y("county:N", sort="-x", title="County"),
+                tooltip=["county", "total_chargers"],
+            )
         )
-    )
-    st.altair_chart(ch_bar, use_container_width=True)
+
+    show_chart(("ch_bar",), ch_bar)
 
     # Scatter: EVs vs chargers (robust to missing income)
     st.markdown("##### EV registrations vs total public chargers")
 
-    # Check whether we actually have any median_income data
-    has_income = county_full["median_income"].notna().any()
+    def scatter():
+        # Check whether we actually have any median_income data
+        has_income = county_full["median_income"].notna().any()
 
-    if has_income:
-        scatter_data = county_full.dropna(
-            subset=["ev_registrations", "total_chargers", "median_income"]
-        )
-        color_enc = alt.Color(
-            "median_income:Q",
-            title="Median income (HDPulse)",
-        )
-    else:
-        # No income data → still show the relationship, just color by county
-        scatter_data = county_full.dropna(
-            subset=["ev_registrations", "total_chargers"]
+        if has_income:
+            scatter_data = county_full.dropna(
+                subset=["ev_registrations", "total_chargers", "median_income"]
+            )
+            color_enc = alt.Color(
+                "median_income:Q",
+                title="Median income (HDPulse)",
+            )
+        else:
+            # No income data → still show the relationship, just color by county
+            scatter_data = county_full.dropna(
+                subset=["ev_registrations", "total_chargers"]
+            )
+            color_enc = alt.Color("county:N", legend=None)
+
+        return (
+            alt.Chart(scatter_data)
+            .mark_circle(size=150)
+            .encode(
+                x=alt.X("ev_registrations:Q", title="EV registrations"),
+                y=alt.Y("total_chargers:Q", title="Total public chargers"),
+                color=color_enc,
+                tooltip=[
+                    "county:N",
+                    "ev_registrations:Q",
+                    "total_chargers:Q",
+                    "median_income:Q",
+                ],
+            )
+            .interactive()
         )
-        color_enc = alt.Color("county:N", legend=None)
 
-    scatter = (
-        alt.Chart(scatter_data)
-        .mark_circle(size=150)
-        .encode(
-            x=alt.X("ev_registrations:Q", title="EV registrations"),
-            y=alt.Y("total_chargers:Q", title="Total public chargers"),
-            color=color_enc,
-            tooltip=[
-                "county:N",
-                "ev_registrations:Q",
-                "total_chargers:Q",
-                "median_income:Q",
-            ],
+    show_chart(("scatter",), scatter)
+
+    # Bar: 2016 electricity consumption by sector (energy-capacity context)
+    st.markdown("##### Electricity consumption by county (2016, MWh)")
+
+    def energy_bar():
+        energy_cols = [
+            c for c in ["residential_mwh", "commercial_mwh", "industrial_mwh"]
+            if c in county_full.columns
+        ]
+        return (
+            alt.Chart(county_full.dropna(subset=["county"]))
+            .transform_fold(energy_cols, as_=["sector", "mwh"])
+            .mark_bar()
+            .encode(
+                x=alt.X("sum(mwh):Q", title="Electricity consumption (MWh)"),
+                y=alt.Y("county:N", sort="-x", title="County"),
+                color=alt.Color("sector:N", title="Sector"),
+                tooltip=["county:N", "sector:N", "mwh:Q"],
+            )
         )
-        .interactive()
-    )
-    st.altair_chart(scatter, use_container_width=True)
 
-    # Gap table
-    st.markdown("##### EVs per charger by county (gap view)")
+    show_chart(("energy_bar",), energy_bar)
+
+    gap_view(view)
+
+    with st.expander("County totals", False):
+        st.dataframe(pipeline.gap_table(county_full), use_container_width=True)
+
+    drivers_view(view)
+    forecast_view(view)
+
 
-    gap_cols = [
-        "county",
-        "ev_registrations",
-        "total_chargers",
-        "evs_per_charger",
-        "evs_per_1k_people",
-        "chargers_per_1k_people",
-    ]
-    gap_df = (
-        county_full.dropna(subset=["evs_per_charger"])
-        .loc[:, [c for c in gap_cols if c in county_full.columns]]
-        .sort_values("evs_per_charger", ascending=False)
+@view_fragment("county.gaps")
+def gap_view(view):
+    # Gap table: town-level Charger Pressure Index for the current filters
+    st.markdown("##### EVs per charger by town (gap view)")
+
+    st.markdown(
+        "Towns at the top of this table have **more EVs per public charger** "
+        "(the Charger Pressure Index), which can signal potential infrastructure "
+        "gaps. Towns with no charger at all are listed under *Charging deserts*."
+    )
+    g1, g2 = st.columns(2)
+    cpi_weighting = g1.radio(
+        "Count chargers as",
+        ["ports", "capacity"],
+        format_func={
+            "ports": "Ports",
+            "capacity": "Capacity (Level 2 equivalents)",
+        }.get,
+        horizontal=True,
+        help="Capacity weights a DC fast port as 7 Level 2 ports and a Level 1 "
+        "port as 0.2.",
     )
+    top_k = g2.number_input("Towns shown", min_value=5, max_value=100, value=15, step=5)
+    gap_df = load_town_pressure(view.state).top_k(
+        int(top_k), view.ev_category, view.years, cpi_weighting, view.county
+    )
+    st.dataframe(gap_df, hide_index=True, use_container_width=True)
+
 
+@view_fragment("county.drivers")
+def drivers_view(view):
+    # Adoption drivers: OLS with bootstrap intervals for the current filters
+    st.markdown("##### What drives EV adoption")
     st.markdown(
-        "Counties at the top of this table have **more EVs per public charger**, "
-        "which can signal potential infrastructure gaps."
+        "Least-squares fit of EV registrations (for the EV type and years in "
+        "view) on public chargers and, across counties, median income and "
+        "population. The 95% intervals come from refitting on bootstrap "
+        "resamples of the towns or counties."
+    )
+    d1, d2 = st.columns(2)
+    level_names = {"town": "Towns", "county": "Counties"}
+    level = d1.radio(
+        "Fit across",
+        list(level_names),
+        format_func=level_names.get,
+        horizontal=True,
+        help="Income and population are only known per county, so the "
+        "town fit uses chargers alone.",
+    )
+    n_boot = d2.select_slider(
+        "Bootstrap resamples", options=[1000, 2000, 5000, 10000, 50000], value=2000
+    )
+    fit = run_driver_regression(view.state, level, view.ev_category, view.years, n_boot)
+
+    coef = fit.table.set_index("term")
+    r1, r2, r3 = st.columns(3)
+    for col, term in ((r1, "total_chargers"), (r2, "median_income")):
+        if term not in coef.index:
+            col.metric(f"EVs per {regression.DRIVERS[term].label}", "n/a")
+            col.caption("County-level fit only")
+            continue
+        row = coef.loc[term]
+        if np.isnan(row["coefficient"]):
+            col.metric(f"EVs per {regression.DRIVERS[term].label}", "n/a")
+            continue
+        col.metric(f"EVs per {row['per']}", f"{row['coefficient']:+,.1f}")
+        col.caption(f"95% interval {row['ci_low']:+,.1f} to {row['ci_high']:+,.1f}")
+    r3.metric(f"{level_names[level]} in the fit", f"{fit.n_obs:,}")
+    r3.caption(f"R² {fit.r_squared:.2f} · {fit.resamples:,} usable resamples")
+    st.dataframe(fit.table, hide_index=True, use_container_width=True)
+
+
+@view_fragment("county.forecast")
+def forecast_view(view):
+    state, ev_cat_key, year_max = view.state, view.ev_category, view.year_max
+    county_full = load_and_clean_data(state)[3]
+
+    # Adoption forecast: growth curves fitted per town × EV type
+    st.markdown("##### EV adoption forecast")
+    forecast_year = st.slider(
+        "Forecast year", year_max + 1, year_max + 10, value=max(2026, year_max + 1)
+    )
+    town_forecast = forecast.forecast_table(load_town_forecast_fit(state), forecast_year)
+    if ev_cat_key is not None:
+        town_forecast = town_forecast[town_forecast["ev_category"] == ev_cat_key]
+
+    f1, f2 = st.columns(2)
+    f1.metric(
+        f"Projected {state} EVs in {forecast_year}",
+        f"{town_forecast['ev_forecast'].sum():,.0f}",
+        delta=f"{town_forecast['ev_forecast'].sum() - town_forecast['ev_current'].sum():+,.0f}",
     )
-    st.dataframe(gap_df.head(15), use_container_width=True)
+    f2.metric("EVs on the road today", f"{town_forecast['ev_current'].sum():,.0f}")
+
+    county_forecast = forecast.add_county_forecast(
+        county_full, town_forecast, for_state(state).town_to_county, forecast_year
+    )
+    st.dataframe(
+        county_forecast.loc[
+            county_forecast["county"].notna(),
+            ["county", "ev_registrations"]
+            + [c for c in county_forecast.columns if c.startswith("ev_forecast_")],
+        ],
+        use_container_width=True,
+    )
+
+    st.markdown("Towns with the largest projected EV fleets:")
+    town_totals = (
+        town_forecast.dropna(subset=["group"])
+        .groupby("group")[["ev_current", "ev_forecast"]]
+        .sum()
+        .rename_axis("town")
+        .sort_values("ev_forecast", ascending=False)
+        .round()
+    )
+    st.dataframe(town_totals.head(15), use_container_width=True)
+
 
 # ---------------------------------------------------------------
 # TAB 4 – MAPS & GAPS
 # ---------------------------------------------------------------
-with tab_maps:
+def maps_tab(view):
     st.subheader("Spatial distribution of public chargers")
 
     st.markdown(
         """
 Each point is a station; bubble size reflects **total chargers**, and color reflects
 **DC fast availability**. Use this to highlight **geographic gaps** in your narrative.
-"""
+When more than {:,} stations match, nearby stations are merged into grid cells
+(sized to keep the map to a few thousand points) showing their combined chargers.
+""".format(lod.DETAIL_THRESHOLD)
     )
+    station_map(view)
+    deserts_view(view)
+
+
+@view_fragment("maps.stations")
+def station_map(view):
+    # Only the deck layer depends on this slider
+    county_key = view.county
 
     # slider to hide very small sites
     min_chargers = st.slider(
         "Minimum total chargers per station to display", 1, 20, value=1
     )
 
-    # Work on a copy of the filtered charging data
-    ch_map = ch_filtered.copy()
-
-    # Ensure we have lat/lon columns
-    if "lat" not in ch_map.columns or "lon" not in ch_map.columns:
-        # Try to infer from other columns
-        if "latitude" in ch_map.columns and "longitude" in ch_map.columns:
-            ch_map["lat"] = pd.to_numeric(ch_map["latitude"], errors="coerce")
-            ch_map["lon"] = pd.to_numeric(ch_map["longitude"], errors="coerce")
-        elif "new_georeferenced_column" in ch_map.columns:
-            # Example of parsing a WKT-like POINT column if present
-            coords = ch_map["new_georeferenced_column"].astype(str).str.extract(
-                r"POINT\s*\(([-\d\.]+)\s+([-\d\.]+)\)"
-            )
-            ch_map["lon"] = pd.to_numeric(coords[0], errors="coerce")
-            ch_map["lat"] = pd.to_numeric(coords[1], errors="coerce")
+    # Mask over the cached map rows (valid coordinates only); the pyramid
+    # decides between individual stations and grid bins
+    map_rows, pyramid = load_station_pyramid(view.state)
+    map_mask = map_rows["total_chargers"].to_numpy() >= min_chargers
+    if county_key is not None:
+        map_mask &= (map_rows["county"] == county_key).to_numpy(dtype=bool, na_value=False)
+    lod_level, bins = lod.map_features(pyramid, map_mask)
 
-    # Keep only rows with valid coordinates and above the charger threshold
-    ch_map = ch_map.dropna(subset=["lat", "lon"]).copy()
-    ch_map = ch_map[ch_map["total_chargers"] >= min_chargers]
-
-    if ch_map.empty:
+    if not map_mask.any():
         st.warning("No stations meet the filter criteria or have valid coordinates.")
     else:
-        avg_lat = ch_map["lat"].mean()
-        avg_lon = ch_map["lon"].mean()
-
-        layer = pdk.Layer(
-            "ScatterplotLayer",
-            data=ch_map,
-            get_position="[lon, lat]",  
-            get_radius="total_chargers * 400",
-            get_fill_color="[has_dc_fast * 255, has_level2 * 180, 120, 180]",
-            pickable=True,
-        )
-
-        view_state = pdk.ViewState(
-            longitude=avg_lon,
-            latitude=avg_lat,
-            zoom=7,
-            pitch=35,
-        )
-
-        deck = pdk.Deck(
-            layers=[layer],
-            initial_view_state=view_state,
-            tooltip={
+        if lod_level is None:
+            ch_map = map_rows[map_mask]
+            tooltip = {
                 "text": "{station_name}\n{city}, {county}\n"
                         "Total chargers: {total_chargers}\n"
                         "DC fast: {ev_dc_fast_count}"
-            },
-        )
+            }
+        else:
+            tooltip = {
+                "text": "{stations} stations (~{cell_km} km cell)\n"
+                        "Total chargers: {total_chargers}\n"
+                        "DC fast: {dc_fast}  Level 2: {level2}"
+            }
+
+        def build_deck():
+            if lod_level is None:
+                points = ch_map
+                layer = pdk.Layer(
+                    "ScatterplotLayer",
+                    data=ch_map.to_dict(orient="records"),
+                    get_position="[lon, lat]",
+                    get_radius="total_chargers * 400",
+                    get_fill_color="[has_dc_fast * 255, has_level2 * 180, 120, 180]",
+                    pickable=True,
+                )
+            else:
+                # Radius scales with the cell size and the bin's charger share
+                points = bins.assign(
+                    cell_km=bins["cell_km"].round(1),
+                    radius=bins["cell_km"] * 500
+                    * np.sqrt(bins["total_chargers"] / bins["total_chargers"].max()),
+                    dc_share=bins["dc_fast_sites"] / bins["stations"],
+                )
+                layer = pdk.Layer(
+                    "ScatterplotLayer",
+                    data=points.to_dict(orient="records"),
+                    get_position="[lon, lat]",
+                    get_radius="radius",
+                    radius_min_pixels=2,
+                    get_fill_color="[dc_share * 255, 140, 120, 180]",
+                    pickable=True,
+                )
+
+            view = lod.fit_view(points["lat"], points["lon"])
+            view_state = pdk.ViewState(
+                longitude=view.longitude,
+                latitude=view.latitude,
+                zoom=view.zoom,
+                pitch=35,
+            )
+
+            deck = pdk.Deck(
+                layers=[layer],
+                initial_view_state=view_state,
+                tooltip=tooltip,
+            )
+            return deck.to_json()
 
-        st.pydeck_chart(deck)
+        n_features = int(map_mask.sum()) if lod_level is None else len(bins)
+        with instrument.stage("maps.deck_render", rows=n_features):
+            deck_json = spec_cache.get_or_build(
+                ("deck", county_key, min_chargers, view.data_version), build_deck
+            )
+            st.pydeck_chart(DeckSpec(deck_json, tooltip))
+        if lod_level is not None:
+            st.caption(
+                f"{int(map_mask.sum()):,} stations shown as {len(bins):,} grid cells "
+                f"of ~{pyramid.cell_deg(lod_level) * lod.KM_PER_DEG:.1f} km."
+            )
 
         with st.expander("Stations shown on the map"):
+            if lod_level is None:
+                station_table = ch_map
+            else:
+                # Largest sites only, so the table stays a light payload too
+                station_table = map_rows[map_mask].nlargest(
+                    lod.DETAIL_THRESHOLD, "total_chargers"
+                )
+                st.caption(f"Largest {lod.DETAIL_THRESHOLD:,} stations by total chargers.")
             st.dataframe(
-                ch_map[
-                    [
-                        "station_name",
-                        "city",
-                        "county",
-                        "total_chargers",
-                        "ev_dc_fast_count",
-                        "ev_level2_evse_num",
-                        "ev_level1_evse_num",
-                        "lat",
-                        "lon",
-                    ]
-                ],
+                station_table[list(pipeline.MAP_COLUMNS)],
                 use_container_width=True,
             )
+
+
+@view_fragment("maps.deserts")
+def deserts_view(view):
+    state, county_key = view.state, view.county
+
+    # Charging deserts: town centroids vs the station spatial index
+    st.markdown("##### Charging deserts")
+    st.markdown(
+        f"For every {state} town centroid we compute the distance to the nearest "
+        "DC fast and Level 2 site and the chargers reachable within the radius. "
+        "Towns with EVs but too few reachable chargers are flagged as **charging deserts**."
+    )
+
+    d1, d2 = st.columns(2)
+    desert_radius = d1.slider("Access radius (km)", 2, 30, value=8)
+    desert_threshold = d2.slider(
+        "Flag above this many EVs per reachable charger", 10, 500, value=100, step=10
+    )
+
+    town_evs = load_town_cube(state).by_group(view.ev_category, view.years)
+    deserts = charging_deserts(
+        load_town_access(state, desert_radius), town_evs, desert_threshold
+    )
+    if county_key is not None:
+        deserts = deserts[deserts["county"] == county_key]
+
+    st.metric("Charging-desert towns in view", int(deserts["charging_desert"].sum()))
+    st.dataframe(
+        deserts.loc[
+            deserts["charging_desert"],
+            [
+                "town",
+                "county",
+                "ev_registrations",
+                "chargers_within_r",
+                "evs_per_nearby_charger",
+                "nearest_dc_fast_km",
+                "nearest_level2_km",
+            ],
+        ].head(25),
+        use_container_width=True,
+    )
+
+
+# ---------------------------------------------------------------
+# TAB 5 – CHARGER SITING
+# ---------------------------------------------------------------
+@view_fragment("tab.siting")
+def siting_tab(view):
+    st.subheader("Where new chargers would cover the most unserved EVs")
+
+    st.markdown(
+        """
+Each town's EVs count as **unserved** when existing ports of the chosen type
+within the drive radius can't cover them (at the given EVs per port). New sites
+are then picked one at a time, each covering the most unserved EVs not already
+covered by an earlier pick. Candidates are town centres or the cells of a grid.
+"""
+    )
+
+    s1, s2, s3 = st.columns(3)
+    site_type = s1.radio(
+        "Site type",
+        list(siting.SITE_TYPES),
+        format_func={"level2": "Level 2", "dc_fast": "DC fast"}.get,
+        horizontal=True,
+    )
+    defaults = siting.SITE_TYPES[site_type]
+    budget = s1.number_input("New sites", min_value=1, max_value=100, value=10)
+    radius_km = s2.slider(
+        "Drive radius (km)", 1, 50, value=int(defaults.radius_km), key=f"siting_radius_{site_type}"
+    )
+    evs_per_port = s2.number_input(
+        "EVs one port serves",
+        min_value=1,
+        max_value=1000,
+        value=int(defaults.evs_per_port),
+        key=f"siting_evs_per_port_{site_type}",
+    )
+    candidate_kind = s3.radio(
+        "Candidate sites",
+        ["towns", "grid"],
+        format_func={"towns": "Town centres", "grid": "Grid cells"}.get,
+        horizontal=True,
+    )
+    cell_km = s3.slider(
+        "Grid cell (km)", 1.0, 10.0, value=2.0, step=0.5, disabled=candidate_kind != "grid"
+    )
+
+    points, candidates, coverage = load_siting_coverage(
+        view.state, candidate_kind, cell_km, radius_km
+    )
+    town_evs = load_town_cube(view.state).by_group(view.ev_category, view.years)
+    evs = points["town"].map(town_evs).fillna(0).to_numpy()
+    if view.county is not None:
+        # Only this county's EVs count; sites may still sit across the line
+        evs = np.where(points["county"].to_numpy() == view.county, evs, 0)
+
+    with instrument.stage("siting.plan", rows=len(candidates)):
+        plan = siting.plan_sites(
+            points,
+            evs,
+            candidates,
+            load_and_clean_data(view.state)[1],
+            int(budget),
+            site_type,
+            radius_km,
+            evs_per_port,
+            coverage=coverage,
+        )
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("EVs in view", f"{plan.evs:,.0f}")
+    k2.metric("Not served by existing ports", f"{plan.unserved_evs:,.0f}")
+    k3.metric(
+        f"Covered by {len(plan.sites)} new sites",
+        f"{plan.covered_evs:,.0f}",
+        delta=f"{plan.covered_evs / plan.unserved_evs:.0%} of unserved"
+        if plan.unserved_evs > 0
+        else None,
+    )
+    if plan.sites.empty:
+        st.info("Existing ports already serve every EV in view at these settings.")
+        return
+
+    stations = pipeline.map_stations(load_and_clean_data(view.state)[1])
+    stations = stations[stations[defaults.port_column] > 0]
+    site_view = lod.fit_view(plan.sites["lat"], plan.sites["lon"])
+    deck = pdk.Deck(
+        layers=[
+            pdk.Layer(
+                "ScatterplotLayer",
+                data=stations[["station_name", "lat", "lon"]]
+                .rename(columns={"station_name": "label"})
+                .to_dict(orient="records"),
+                get_position="[lon, lat]",
+                get_radius=300,
+                get_fill_color="[90, 90, 90, 160]",
+                pickable=True,
+            ),
+            pdk.Layer(
+                "ScatterplotLayer",
+                data=plan.sites.assign(
+                    label=[
+                        f"#{rank} {site}: {evs:,.0f} EVs"
+                        for rank, site, evs in plan.sites[["rank", "site", "evs_covered"]].itertuples(index=False)
+                    ]
+                ).to_dict(orient="records"),
+                get_position="[lon, lat]",
+                get_radius=radius_km * 1000,
+                get_fill_color="[230, 60, 40, 60]",
+                get_line_color="[230, 60, 40, 220]",
+                stroked=True,
+                line_width_min_pixels=1,
+                pickable=True,
+            ),
+        ],
+        initial_view_state=pdk.ViewState(
+            latitude=site_view.latitude,
+            longitude=site_view.longitude,
+            zoom=max(site_view.zoom - 1, 6),
+        ),
+        tooltip={"text": "{label}"},
+    )
+    st.pydeck_chart(deck)
+    st.dataframe(plan.sites, hide_index=True, use_container_width=True)
+
+
+# ---------------------------------------------------------------
+# TAB 6 – GRID HEADROOM
+# ---------------------------------------------------------------
+@view_fragment("tab.grid")
+def grid_tab(view):
+    state, county_key = view.state, view.county
+
+    st.subheader("Added EV peak load vs grid headroom")
+
+    st.markdown(
+        """
+Each scenario draws an EV growth rate, the share of EVs charging at the system
+peak, the Level 2 / DC fast mix and charging power, the county load factor and
+the capacity reserve margin. Baseline peak load is derived from 2016
+electricity consumption (MWh / 8760 / load factor); **headroom** is the reserve
+capacity left after the added EV peak.
+"""
+    )
+
+    g1, g2, g3 = st.columns(3)
+    horizon_years = g1.slider("Years ahead", 1, 10, value=3)
+    n_scenarios = g1.select_slider(
+        "Scenarios", options=[500, 1000, 2000, 5000, 10000], value=2000
+    )
+    growth_pct = g2.slider("Annual EV growth (%)", 0, 80, value=(10, 35))
+    peak_pct = g2.slider("EVs charging at system peak (%)", 1, 50, value=(5, 20))
+    us_wide = g3.checkbox(
+        "All US counties (EV counts estimated from population)", value=False
+    )
+
+    grid = run_grid_scenarios(
+        state,
+        us_wide,
+        n_scenarios,
+        horizon_years,
+        (growth_pct[0] / 100, growth_pct[1] / 100),
+        (peak_pct[0] / 100, peak_pct[1] / 100),
+    )
+    if not us_wide and county_key is not None:
+        grid = grid[grid["county"] == county_key]
+
+    k1, k2, k3 = st.columns(3)
+    k1.metric("Counties simulated", f"{len(grid):,}")
+    k2.metric("Median added peak (MW, total)", f"{grid['added_peak_mw_p50'].sum():,.1f}")
+    k3.metric(
+        "Counties with >10% overload risk",
+        int((grid["prob_overload"] > 0.10).sum()),
+    )
+
+    grid_view = grid.sort_values("headroom_mw_p10").head(25)
+    headroom_chart = (
+        alt.Chart(grid_view)
+        .mark_bar()
+        .encode(
+            x=alt.X("headroom_mw_p10:Q", title="Headroom, pessimistic (P10, MW)"),
+            x2="headroom_mw_p90:Q",
+            y=alt.Y("county:N", sort="x", title="County"),
+            tooltip=[
+                "county:N",
+                alt.Tooltip("added_peak_mw_p50:Q", format=",.1f"),
+                alt.Tooltip("headroom_mw_p10:Q", format=",.1f"),
+                alt.Tooltip("headroom_mw_p50:Q", format=",.1f"),
+                alt.Tooltip("headroom_mw_p90:Q", format=",.1f"),
+                alt.Tooltip("prob_overload:Q", format=".0%"),
+            ],
+        )
+    )
+    st.altair_chart(headroom_chart, use_container_width=True)
+    st.dataframe(grid_view, use_container_width=True)
+
+
+# ---------------------------------------------------------------
+# Tabs: only the open one runs (switching tabs reruns the script, with every
+# input cached), and widgets inside a view's fragment rerun just that view
+# ---------------------------------------------------------------
+tab_overview, tab_docs, tab_county, tab_maps, tab_siting, tab_grid = st.tabs(
+    [
+        "📊 Overview",
+        "📚 Data documentation",
+        "🏛️ County comparison",
+        "🗺️ Maps & gaps",
+        "🧭 Charger siting",
+        "⚡ Grid headroom",
+    ],
+    key="tab",
+    on_change="rerun",
+)
+
+if tab_overview.open:
+    with tab_overview, instrument.stage("tab.overview"):
+        overview_tab(view)
+if tab_docs.open:
+    with tab_docs, instrument.stage("tab.docs"):
+        docs_tab(view)
+if tab_county.open:
+    with tab_county, instrument.stage("tab.county"):
+        county_tab(view)
+if tab_maps.open:
+    with tab_maps, instrument.stage("tab.maps"):
+        maps_tab(view)
+if tab_siting.open:
+    with tab_siting:
+        siting_tab(view)
+if tab_grid.open:
+    with tab_grid:
+        grid_tab(view)
+
+# ---------------------------------------------------------------
+# Diagnostics panel
+# ---------------------------------------------------------------
+if diagnostics_recorder is not None:
+    instrument.activate(None)
+    diagnostics_recorder.write_log()
+    with st.sidebar.expander("Diagnostics", expanded=True):
+        diag = pd.DataFrame(diagnostics_recorder.finished)
+        diag["stage"] = [
+            "\u2003" * d + name for d, name in zip(diag["depth"], diag["stage"])
+        ]
+        st.dataframe(
+            diag[["stage", "seconds", "peak_mb", "rows"]],
+            hide_index=True,
+            use_container_width=True,
+        )
+        cache_stats = spec_cache.stats()
+        st.caption(
+            f"Chart cache: {cache_stats.hits:,} hits, {cache_stats.misses:,} misses, "
+            f"{cache_stats.evictions:,} evictions, {cache_stats.entries} specs "
+            f"({cache_stats.bytes / 2**20:.1f} of {cache_stats.max_bytes / 2**20:.0f} MB)"
+        )
+        st.caption(
+            "Load steps only show up on a cache miss; the cold start of this "
+            "server is broken down below. Log: "
+            f"`{instrument.LOG_PATH}`"
+        )
+
+        startup = [
+            (name, STARTUP[name])
+            for name in ("imports", "state partitions")
+            if name in STARTUP
+        ]
+        for loaded_state, (seconds, records) in STARTUP.get("loads", {}).items():
+            startup.append((f"data load ({loaded_state})", seconds))
+            startup += [
+                ("\u2003" * (r["depth"] + 1) + r["stage"], r["seconds"])
+                for r in records
+                if r["depth"] <= 1
+            ]
+        if "first_kpi" in STARTUP:
+            startup.append(("first KPI on screen (since start)", STARTUP["first_kpi"]))
+        startup += [
+            (name, STARTUP[name])
+            for name in ("import altair", "import pydeck")
+            if name in STARTUP
+        ]
+        st.dataframe(
+            pd.DataFrame(startup, columns=["cold start", "seconds"]),
+            hide_index=True,
+            use_container_width=True,
+        )
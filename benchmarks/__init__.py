@@ -0,0 +1 @@
+"""Synthetic-data benchmarks for the ingestion and filter pipeline."""
@@ -0,0 +1,381 @@
+"""Time and memory-profile each pipeline stage on synthetic data.
+
+    python -m benchmarks.run --registrations 10k,1m,10m --stations 400,8k,80k
+
+Sizes are paired in order (a single station size applies to every
+registration size). Each stage is timed with `perf_counter`; with memory
+profiling on (the default) `tracemalloc` records the peak allocation above
+the stage's starting point, which also slows the stages down somewhat — use
+`--no-memory` for clean timings. Results go to a JSON file; pass an earlier
+file as `--baseline` to print per-stage ratios.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from ctev import (
+    availability,
+    dtypes,
+    ingest,
+    lod,
+    pipeline,
+    pressure,
+    regression,
+    siting,
+)
+from ctev.cube import EvCube
+from ctev.gazetteer import CT_GAZETTEER
+
+DEFAULT_DATA_DIR = Path(tempfile.gettempdir()) / "ctev-bench"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+# Sidebar selections replayed by the filter stage: every county x EV type,
+# full and narrow year ranges
+FILTER_YEARS = [None, (2018, 2022)]
+
+
+class StageTimer:
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = []
+
+    def run(self, name, func, *args, rows_in=None, **kwargs):
+        """Call `func` as stage `name` and record time, peak memory and rows."""
+        if self.memory:
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak_mb = None
+        if self.memory:
+            peak_mb = (tracemalloc.get_traced_memory()[1] - base) / 2**20
+            tracemalloc.stop()
+
+        self.stages.append(
+            {
+                "stage": name,
+                "seconds": round(seconds, 6),
+                "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+                "rows_in": rows_in,
+                "rows_out": _rows(result),
+            }
+        )
+        return result
+
+
+def _rows(result):
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return len(result)
+    if isinstance(result, tuple) and result and hasattr(result[0], "__len__"):
+        return len(result[0])
+    return None
+
+
+def _registration_stages(timer, path):
+    if ingest.streaming_chunksize(path):
+        # Chunked reader: parse, clean, dedup and mapping are interleaved
+        ev_clean, ev_reg, counts = timer.run(
+            "registrations.stream",
+            ingest.read_registrations,
+            path,
+            CT_GAZETTEER,
+            chunksize=ingest.streaming_chunksize(path),
+        )
+        return ev_reg, counts
+
+    raw = timer.run(
+        "registrations.parse",
+        lambda: ingest.normalize_columns(ingest.read_csv(path)),
+    )
+    ev = timer.run(
+        "registrations.clean_text", ingest.clean_registrations, raw, rows_in=len(raw)
+    )
+    del raw
+    key = ingest._key_column(ev.columns)
+    ev = timer.run(
+        "registrations.dedup", ev.drop_duplicates, subset=[key], rows_in=len(ev)
+    )
+    ev = timer.run("registrations.categorize", ingest.add_ev_category, ev)
+    ev_reg = timer.run(
+        "registrations.county_map",
+        ingest.add_county,
+        ev,
+        CT_GAZETTEER,
+        rows_in=len(ev),
+    )
+    counts = timer.run(
+        "registrations.count_by_county",
+        lambda: ingest.count_by_county(ev_reg["county"].value_counts()),
+        rows_in=len(ev_reg),
+    )
+    return ev_reg, counts
+
+
+def _apply_filters(cube, ch, county_full, ev_reg):
+    """Replay the app's per-rerun filter block for every sidebar selection."""
+    counties = [None] + cube.groups
+    categories = [None] + cube.categories
+    n = 0
+    for county in counties:
+        for category in categories:
+            for years in FILTER_YEARS:
+                cube.count(county, category, years)
+                if county is not None:
+                    ch[ch["county"] == county]
+                    county_full[county_full["county"] == county]
+                mask = pd.Series(True, index=ev_reg.index)
+                if category is not None:
+                    mask &= ev_reg["ev_category"] == category
+                if years is not None:
+                    mask &= ev_reg["vehicle_year"].between(*years).fillna(False)
+                if county is not None:
+                    mask &= ev_reg["county"] == county
+                ev_reg[mask].head(100)
+                n += 1
+    return n
+
+
+def _town_gaps(engine, counties):
+    """Replay the town gap view (top 15) for every sidebar selection."""
+    n = 0
+    for county in counties:
+        for category in [None] + engine.categories:
+            for years in FILTER_YEARS:
+                for weights in pressure.CHARGER_WEIGHTS:
+                    engine.top_k(15, category, years, weights, county)
+                    n += 1
+    return n
+
+
+def _driver_fits(engine):
+    """Replay the town adoption-driver fit (2,000 resamples) per EV type."""
+    n = 0
+    for category in [None] + engine.categories:
+        table = regression.town_table(engine, category)
+        regression.estimate(table, level="town", n_boot=2000)
+        n += 1
+    return n
+
+
+def _weekly_availability(stations):
+    """Replay the week view: each exclusion setting, then every hour."""
+    n = 0
+    for exclude in (
+        availability.RESTRICTED,
+        availability.RESTRICTED | availability.FLAG_CUSTOMERS_ONLY,
+    ):
+        stations.weekly(exclude)
+        for hour in range(availability.HOURS_PER_WEEK):
+            stations.chargers_open(hour, exclude)
+            n += 1
+    return n
+
+
+def _siting_plans(points, town_cube, candidates, coverage, ch):
+    """Replay the siting tab (10 Level 2 sites) for every EV-type filter."""
+    n = 0
+    for category in [None] + town_cube.categories:
+        evs = points["town"].map(town_cube.by_group(category)).fillna(0).to_numpy()
+        siting.plan_sites(points, evs, candidates, ch, 10, coverage=coverage)
+        n += 1
+    return n
+
+
+def _map_payload(stations, pyramid):
+    """JSON the map would ship to the browser for the unfiltered view."""
+    level, bins = lod.map_features(pyramid)
+    if level is None:
+        cols = [
+            "station_name",
+            "city",
+            "county",
+            "total_chargers",
+            "ev_dc_fast_count",
+            "has_dc_fast",
+            "has_level2",
+            "lat",
+            "lon",
+        ]
+        payload = stations[[c for c in cols if c in stations.columns]]
+    else:
+        payload = bins
+    return level, len(payload), len(payload.to_json(orient="records"))
+
+
+def run_case(paths, memory=True):
+    """All stages for one set of source files; returns the stage records."""
+    timer = StageTimer(memory)
+    health = timer.run("health.load", pipeline.load_health, paths["health"])
+    ev_reg, counts = _registration_stages(timer, paths["ev_reg"])
+    ch = timer.run("stations.load", pipeline.load_stations, paths["charge"])
+    ev_reg = timer.run(
+        "registrations.compact",
+        dtypes.apply_plan,
+        ev_reg,
+        dtypes.REGISTRATION_PLAN,
+        rows_in=len(ev_reg),
+    )
+    ch = timer.run(
+        "stations.compact", dtypes.apply_plan, ch, dtypes.STATION_PLAN, rows_in=len(ch)
+    )
+    population = timer.run(
+        "population.load", pipeline.load_population, paths["pop"]
+    )
+    county_full = timer.run(
+        "county.merge",
+        pipeline.build_county_table,
+        counts,
+        ch,
+        health,
+        population,
+    )
+    timer.run("towns.merge", pipeline.town_table, ev_reg, ch, rows_in=len(ev_reg))
+    cube = timer.run("filter.cube_build", EvCube.from_frame, ev_reg, rows_in=len(ev_reg))
+    n_selections = timer.run(
+        "filter.apply", _apply_filters, cube, ch, county_full, ev_reg
+    )
+    timer.stages[-1]["selections"] = n_selections
+    town_cube = timer.run(
+        "towns.cube_build", EvCube.from_frame, ev_reg, group_col="town", rows_in=len(ev_reg)
+    )
+    engine = timer.run(
+        "towns.pressure", pressure.TownPressure, town_cube, ch, CT_GAZETTEER.table
+    )
+    n_selections = timer.run("towns.top_k", _town_gaps, engine, [None] + cube.groups)
+    timer.stages[-1]["selections"] = n_selections
+    n_selections = timer.run("towns.drivers", _driver_fits, engine)
+    timer.stages[-1]["selections"] = n_selections
+    stations = timer.run(
+        "stations.availability", availability.StationAvailability, ch, rows_in=len(ch)
+    )
+    n_selections = timer.run("availability.week", _weekly_availability, stations)
+    timer.stages[-1]["selections"] = n_selections
+    points = siting.town_points(CT_GAZETTEER.table)
+    candidates = timer.run("siting.candidates", siting.grid_candidates, points, 2.0)
+    coverage = timer.run(
+        "siting.coverage",
+        siting.Coverage,
+        candidates,
+        points,
+        siting.SITE_TYPES["level2"].radius_km,
+        rows_in=len(candidates),
+    )
+    n_selections = timer.run(
+        "siting.plan", _siting_plans, points, town_cube, candidates, coverage, ch
+    )
+    timer.stages[-1]["selections"] = n_selections
+    ch_map = timer.run("map.stations", pipeline.map_stations, ch, rows_in=len(ch))
+    pyramid = timer.run("map.pyramid", lod.GridPyramid, ch_map, rows_in=len(ch_map))
+    level, features, payload_bytes = timer.run(
+        "map.prepare", _map_payload, ch_map, pyramid, rows_in=len(ch_map)
+    )
+    timer.stages[-1].update(
+        lod_level=level, features=features, payload_bytes=payload_bytes
+    )
+    return timer.stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=pipeline.BASE_DIR,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment():
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "pipeline_version": pipeline.PIPELINE_VERSION,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results, baseline):
+    """Per-stage time ratios against an earlier results file (>1 = slower)."""
+    before = {
+        (c["registrations"], c["stations"], s["stage"]): s["seconds"]
+        for c in baseline["cases"]
+        for s in c["stages"]
+    }
+    rows = []
+    for case in results["cases"]:
+        for s in case["stages"]:
+            old = before.get((case["registrations"], case["stations"], s["stage"]))
+            if old:
+                rows.append(
+                    {
+                        "registrations": case["registrations"],
+                        "stations": case["stations"],
+                        "stage": s["stage"],
+                        "before_s": old,
+                        "after_s": s["seconds"],
+                        "ratio": round(s["seconds"] / old, 3),
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run")
+    parser.add_argument("--registrations", default="10k,1m")
+    parser.add_argument("--stations", default="400,8k")
+    parser.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR))
+    parser.add_argument("--out", help="results JSON (default: benchmarks/results/)")
+    parser.add_argument("--baseline", help="earlier results JSON to compare with")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    reg_sizes = [synthetic.parse_size(s) for s in args.registrations.split(",")]
+    station_sizes = [synthetic.parse_size(s) for s in args.stations.split(",")]
+    if len(station_sizes) == 1:
+        station_sizes *= len(reg_sizes)
+    if len(station_sizes) != len(reg_sizes):
+        parser.error("--stations needs one size or one per registration size")
+
+    results = {"environment": environment(), "cases": []}
+    for n_reg, n_st in zip(reg_sizes, station_sizes):
+        print(f"generating {n_reg:,} registrations / {n_st:,} stations")
+        paths = synthetic.generate(args.data_dir, n_reg, n_st, seed=args.seed)
+        print("running stages")
+        stages = run_case(paths, memory=not args.no_memory)
+        results["cases"].append(
+            {"registrations": n_reg, "stations": n_st, "stages": stages}
+        )
+        print(pd.DataFrame(stages).to_string(index=False))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / (
+        "bench_{}.json".format(datetime.now().strftime("%Y%m%d_%H%M%S"))
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, indent=2))
+    print(f"results written to {out}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        print(compare(results, baseline).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
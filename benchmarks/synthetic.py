@@ -0,0 +1,255 @@
+"""Schema-faithful synthetic source files at arbitrary sizes.
+
+Registrations follow the DMV export header and its quirks (mixed-case and
+misspelled city names, villages, out-of-state rows, duplicate IDs). Stations
+are resampled from the checked-in AFDC file, so the free-text columns and the
+odd rows stay realistic, with new towns and jittered coordinates. The energy
+profile and HDPulse files keep the real header rows.
+
+    python -m benchmarks.synthetic --registrations 1m --stations 8k --out DIR
+"""
+import argparse
+import csv
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ctev import energy_profiles, pipeline
+from ctev.gazetteer import CT_GAZETTEER, DATA_DIR
+
+REGISTRATION_HEADER = [
+    "ID",
+    "Plate Type",
+    "Primary Customer City",
+    "Primary Customer State",
+    "Registration Start Date",
+    "Registration Expiration Date",
+    "Registration Usage",
+    "Vehicle Type",
+    "Vehicle Weight",
+    "Vehicle Year",
+    "Vehicle Make",
+    "Vehicle Model",
+    "Vehicle Body",
+    "Primary Color",
+    "Vehicle Declared Gross Weight",
+    "Fuel Code",
+    "Vehicle Recorded GVWR",
+    "Vehicle Name",
+    "Type",
+    "Vehicle Category",
+]
+
+# (make, model, fuel code, body, weight) — fuel codes as in the DMV export
+VEHICLES = [
+    ("TESLA", "MODEL Y", "E00", "SU", 4400),
+    ("TESLA", "MODEL 3", "E00", "4D", 3900),
+    ("Tesla Inc", "Model S", "E00", "4D", 4800),
+    ("JEEP", "WRANGLER SAHARA 4XE", "H04", "SU", 5100),
+    ("HYUNDAI", "IONIQ 5 LIMITED", "E00", "SU", 4600),
+    ("TOYOTA", "RAV4 PRIME", "H04", "SU", 4300),
+    ("FORD", "MUSTANG MACH-E", "E00", "SU", 4900),
+    ("CHEVROLET", "BOLT EV", "E00", "HB", 3600),
+    ("VOLVO", "XC60 RECHARGE", "H04", "SU", 4700),
+    ("BMW", "X5 XDRIVE45E", "H04", "SU", 5500),
+    ("NISSAN", "LEAF", "E00", "HB", 3500),
+    ("RIVIAN", "R1T", "E00", "PK", 7100),
+    ("KIA", "NIRO", "X", "SU", 3500),
+]
+
+OUT_OF_STATE = ["NY", "MA", "RI", "NJ", "FL"]
+OUT_OF_STATE_CITIES = ["NEW YORK", "BROOKLYN", "SPRINGFIELD", "PROVIDENCE", "BOCA RATON"]
+
+COLORS = ["BLACK", "WHITE", "GRAY", "SILVER", "BLUE", "RED"]
+
+
+def parse_size(text):
+    """`10k` / `1m` / `2.5M` / `80000` -> int."""
+    text = str(text).strip().lower().replace("_", "")
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    if scale > 1:
+        text = text[:-1]
+    return int(float(text) * scale)
+
+
+def _misspell(rng, name):
+    i = int(rng.integers(1, max(len(name) - 1, 2)))
+    return name[:i] + name[i + 1 :]
+
+
+def city_pool(rng, n_variants=400):
+    """Raw city spellings with sampling weights (towns, aliases, noise)."""
+    towns = CT_GAZETTEER.table
+    aliases = pd.read_csv(DATA_DIR / "ct_aliases.csv")["alias"].tolist()
+    names = [t.upper() for t in towns["town"]]
+    # Bigger towns register more vehicles: Zipf-like weights over a shuffle
+    weights = 1.0 / np.arange(1, len(names) + 1)
+    rng.shuffle(weights)
+    weights = list(weights)
+
+    alias_w = 0.02
+    names += [a.upper() for a in aliases]
+    weights += [alias_w] * len(aliases)
+
+    # Case/whitespace/abbreviation variants and typos of real towns
+    picks = rng.choice(len(towns), n_variants)
+    for k, i in enumerate(picks):
+        town = towns["town"].iat[i]
+        variant = (
+            town.lower(),
+            town + " ",
+            town.upper().replace("WEST ", "W "),
+            _misspell(rng, town.upper()),
+        )[k % 4]
+        names.append(variant)
+        weights.append(0.01)
+
+    weights = np.asarray(weights, dtype=np.float64)
+    return np.asarray(names, dtype=object), weights / weights.sum()
+
+
+def write_registrations(path, n_rows, seed=0, chunk_rows=1_000_000):
+    """Write `n_rows` registrations in chunks (bounded memory at 10M+ rows)."""
+    rng = np.random.default_rng(seed)
+    cities, city_w = city_pool(rng)
+    vehicles = pd.DataFrame(
+        VEHICLES, columns=["make", "model", "fuel", "body", "weight"]
+    )
+
+    with open(path, "w", newline="") as f:
+        for start in range(0, n_rows, chunk_rows):
+            n = min(chunk_rows, n_rows - start)
+            ct = rng.random(n) < 0.96
+            state = np.where(ct, "CT", rng.choice(OUT_OF_STATE, n))
+            city = np.where(
+                ct, cities[rng.choice(len(cities), n, p=city_w)],
+                rng.choice(OUT_OF_STATE_CITIES, n),
+            )
+            v = vehicles.iloc[rng.integers(0, len(vehicles), n)]
+            year = rng.integers(2011, 2026, n)
+            start_day = pd.Timestamp("2020-01-01") + pd.to_timedelta(
+                rng.integers(0, 1800, n), unit="D"
+            )
+            # ~3% of rows repeat an earlier ID (renewals, re-registrations)
+            ids = np.arange(start + 1, start + n + 1)
+            dup = rng.random(n) < 0.03
+            ids[dup] = rng.integers(1, start + n + 1, int(dup.sum()))
+            chunk = pd.DataFrame(
+                {
+                    "ID": ids,
+                    "Plate Type": "Passenger",
+                    "Primary Customer City": city,
+                    "Primary Customer State": state,
+                    "Registration Start Date": start_day.strftime("%m/%d/%Y"),
+                    "Registration Expiration Date": (
+                        start_day + pd.Timedelta(days=730)
+                    ).strftime("%m/%d/%Y"),
+                    "Registration Usage": "Regular",
+                    "Vehicle Type": "Passenger",
+                    "Vehicle Weight": v["weight"].to_numpy(),
+                    "Vehicle Year": year,
+                    "Vehicle Make": v["make"].to_numpy(),
+                    "Vehicle Model": v["model"].to_numpy(),
+                    "Vehicle Body": v["body"].to_numpy(),
+                    "Primary Color": rng.choice(COLORS, n),
+                    "Vehicle Declared Gross Weight": 0,
+                    "Fuel Code": v["fuel"].to_numpy(),
+                    "Vehicle Recorded GVWR": v["weight"].to_numpy() + 1000,
+                    "Vehicle Name": (v["make"] + " " + v["model"]).to_numpy(),
+                    "Type": np.where(v["fuel"] == "E00", "BEV", "PHEV"),
+                    "Vehicle Category": "Light-Duty (Class 1-2)",
+                },
+                columns=REGISTRATION_HEADER,
+            )
+            chunk.to_csv(f, index=False, header=start == 0)
+
+
+def write_stations(path, n_rows, template=pipeline.CHARGE_PATH, seed=0):
+    """Resample the real station file into `n_rows` stations across CT towns."""
+    rng = np.random.default_rng(seed)
+    real = pd.read_csv(template, dtype=str, keep_default_na=False)
+    out = real.iloc[rng.integers(0, len(real), n_rows)].reset_index(drop=True)
+
+    # Keep the odd rows (repeated header, shifted columns) as they are
+    normal = out["New Georeferenced Column"].str.startswith("POINT").to_numpy()
+    towns = CT_GAZETTEER.table
+    pick = rng.integers(0, len(towns), n_rows)[normal]
+    lon = towns["lon"].to_numpy()[pick] + rng.normal(0, 0.03, len(pick))
+    lat = towns["lat"].to_numpy()[pick] + rng.normal(0, 0.02, len(pick))
+    out.loc[normal, "City"] = towns["town"].to_numpy()[pick]
+    out.loc[normal, "New Georeferenced Column"] = [
+        f"POINT ({x:.6f} {y:.6f})" for x, y in zip(lon, lat)
+    ]
+    suffix = " #" + np.arange(n_rows).astype(str)
+    out.loc[normal, "Station Name"] = out.loc[normal, "Station Name"] + suffix[normal]
+    out.to_csv(path, index=False)
+
+
+def write_energy_profiles(path, n_counties=None, template=pipeline.POP_PATH, seed=0):
+    """Energy profiles with the real five header rows.
+
+    Every CT county is kept; the remaining rows are resampled from the real
+    file up to `n_counties` (default: the real row count).
+    """
+    rng = np.random.default_rng(seed)
+    with open(template, newline="", encoding=energy_profiles.ENCODING) as f:
+        rows = list(csv.reader(f))
+    header, body = rows[: energy_profiles.HEADER_ROWS], rows[energy_profiles.HEADER_ROWS :]
+    state_pos = header[-1].index("state_abbr")
+    ct = [r for r in body if len(r) > state_pos and r[state_pos].strip() == "CT"]
+    other = [r for r in body if r not in ct]
+    n_other = max((n_counties or len(body)) - len(ct), 0)
+    sample = [other[i] for i in rng.integers(0, len(other), n_other)]
+
+    with open(path, "w", newline="", encoding=energy_profiles.ENCODING) as f:
+        writer = csv.writer(f)
+        writer.writerows(header)
+        writer.writerows(ct + sample)
+
+
+def generate(out_dir, n_registrations, n_stations, n_counties=None, seed=0):
+    """Write a full set of source files; returns a `SOURCE_PATHS`-style dict."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = {
+        "health": out_dir / pipeline.HEALTH_PATH.name,
+        "ev_reg": out_dir / f"registrations_{n_registrations}_{seed}.csv",
+        "charge": out_dir / f"stations_{n_stations}_{seed}.csv",
+        "pop": out_dir / pipeline.POP_PATH.name,
+    }
+    # Generated files are deterministic per size and seed, so reuse them
+    if not paths["ev_reg"].exists():
+        write_registrations(paths["ev_reg"], n_registrations, seed=seed)
+    if not paths["charge"].exists():
+        write_stations(paths["charge"], n_stations, seed=seed)
+    if not paths["pop"].exists():
+        write_energy_profiles(paths["pop"], n_counties, seed=seed)
+    if not paths["health"].exists():
+        shutil.copyfile(pipeline.HEALTH_PATH, paths["health"])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.synthetic")
+    parser.add_argument("--registrations", default="10k")
+    parser.add_argument("--stations", default="400")
+    parser.add_argument("--counties", type=int, help="energy profile rows")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmarks/data")
+    args = parser.parse_args(argv)
+
+    paths = generate(
+        args.out,
+        parse_size(args.registrations),
+        parse_size(args.stations),
+        args.counties,
+        args.seed,
+    )
+    for name, path in paths.items():
+        print(f"{name:>8}  {path}")
+
+
+if __name__ == "__main__":
+    main()
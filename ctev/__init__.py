@@ -0,0 +1 @@
+"""Data pipeline helpers for the CT EV Infrastructure & Energy Capacity Explorer."""
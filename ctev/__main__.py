@@ -0,0 +1,96 @@
+"""Headless batch run: `python -m ctev --out exports/`.
+
+Cleans the source CSVs exactly as the Streamlit app does and writes the county
+summary, town summary, gap ranking and map-ready station table for one state.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from ctev import instrument, pipeline
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m ctev",
+        description="Run the EV data pipeline without Streamlit.",
+    )
+    parser.add_argument(
+        "--out", default="exports", help="output directory (default: exports)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=pipeline.EXPORT_FORMATS,
+        default="csv",
+        help="output file format (default: csv)",
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="directory holding the source CSVs (default: repository root)",
+    )
+    parser.add_argument(
+        "--state",
+        default=pipeline.DEFAULT_STATE,
+        type=str.upper,
+        help=f"state to export (default: {pipeline.DEFAULT_STATE})",
+    )
+    parser.add_argument(
+        "--min-chargers",
+        type=int,
+        default=1,
+        help="minimum chargers per station in the map table (default: 1)",
+    )
+    parser.add_argument(
+        "--sqlite",
+        action="store_true",
+        help="also build the state's SQLite store (see CTEV_BACKEND=sqlite)",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="print per-stage time/memory and append them to the JSON log",
+    )
+    args = parser.parse_args(argv)
+
+    paths = pipeline.SOURCE_PATHS
+    if args.data_dir:
+        paths = {k: Path(args.data_dir) / p.name for k, p in paths.items()}
+    missing = [str(p) for p in paths.values() if not Path(p).exists()]
+    if missing:
+        parser.error("missing source file(s): " + ", ".join(missing))
+    states = pipeline.available_states(paths)
+    if args.state not in states:
+        parser.error(f"no data for state {args.state} (available: {', '.join(states)})")
+
+    recorder = instrument.Recorder(memory=True) if args.diagnostics else None
+    instrument.activate(recorder)
+    start = time.perf_counter()
+    written = pipeline.run(
+        args.out,
+        paths,
+        fmt=args.format,
+        min_chargers=args.min_chargers,
+        state=args.state,
+    )
+    if args.sqlite:
+        written["sqlite"] = pipeline.sql_store(paths, args.state).path
+    for name, path in written.items():
+        print(f"{name:>15}  {path}")
+    if recorder is not None:
+        instrument.activate(None)
+        for rec in recorder.finished:
+            label = "  " * rec["depth"] + rec["stage"]
+            rows = "" if rec["rows"] is None else f"{rec['rows']:>10,} rows"
+            # Worker-thread stages (and stages overlapping another trace) have no peak
+            peak = "" if rec["peak_mb"] is None else f"{rec['peak_mb']:>10.1f} MB"
+            print(f"{label:<34}{rec['seconds']:>9.3f}s{peak:>13}  {rows}")
+        recorder.write_log()
+        print(f"diagnostics appended to {instrument.LOG_PATH}")
+        print(pipeline.memory_report(paths, args.state).to_string(index=False))
+    print(f"done in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+"""Weekly access windows of charging stations as hour-of-week bitmaps.
+
+`Access Days Time` is free text ("24 hours daily", "8am-10pm daily; for
+customer use only", "MO: 12:00am-12:00am; TU: ..."). `parse_access` compiles
+one string into 168 open/closed hours (Monday 0:00 first) plus restriction
+flags. `StationAvailability` parses each distinct string once, packs every
+station's week into three uint64 words and answers "chargers open at hour h"
+for all counties with a shift, a mask and one `bincount`.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from ctev import textnorm
+
+HOURS_PER_WEEK = 168
+N_WORDS = 3  # 168 bits in 3 x 64
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Bits of the per-station access flags
+FLAG_TESLA_ONLY = 1
+FLAG_MAKE_ONLY = 2  # another make's drivers only ("Ford use only")
+FLAG_CUSTOMERS_ONLY = 4  # customers / guests / members
+FLAG_HOURS_ASSUMED = 8  # "business hours" etc.: a typical window is assumed
+FLAG_HOURS_UNKNOWN = 16  # no hours given: counted as always open
+
+ACCESS_FLAGS = {
+    "tesla_only": FLAG_TESLA_ONLY,
+    "make_only": FLAG_MAKE_ONLY,
+    "customers_only": FLAG_CUSTOMERS_ONLY,
+    "hours_assumed": FLAG_HOURS_ASSUMED,
+    "hours_unknown": FLAG_HOURS_UNKNOWN,
+}
+
+# Chargers a driver of any make can plug into
+RESTRICTED = FLAG_TESLA_ONLY | FLAG_MAKE_ONLY
+
+# Windows assumed for descriptions without times: (open, close, days)
+ASSUMED_HOURS = {
+    "dawn to dusk": (6, 20, "daily"),
+    "school": (7, 16, "m-f"),
+    "hours": (8, 18, "m-sat"),  # dealership / garage / store / lot hours
+}
+
+_CUSTOMERS = {
+    "customer", "customers", "guest", "guests", "member", "members",
+    "employee", "employees", "resident", "residents", "tenant", "tenants",
+    "patron", "patrons", "visitor", "visitors", "fleet", "staff",
+}
+
+# Makes besides those in `data/vehicle_aliases.csv` that a station may be
+# reserved for ("Rivian drivers only")
+_MAKES = {
+    "audi", "buick", "cadillac", "chrysler", "dodge", "fisker", "genesis",
+    "honda", "jaguar", "jeep", "lexus", "lincoln", "lucid", "mazda",
+    "mitsubishi", "nissan", "polestar", "porsche", "rivian", "subaru",
+    "volvo",
+}
+
+
+def _make_words():
+    """Lower-case words naming a vehicle make: the built-in list, canonical
+    names from the alias file (last word, so "Land Rover" -> "rover") and
+    its one-word aliases ("chevy", "vw")."""
+    words = set(_MAKES)
+    for alias, name in textnorm.load_aliases().get("make", {}).items():
+        words.add(name.lower().split()[-1])
+        if " " not in alias:
+            words.add(alias.lower())
+    return words
+
+
+_MAKE_WORDS = _make_words()
+
+# Day spellings, Monday = 0. Two-letter codes ("we", "sa") double as words,
+# so they only count as a "WE:" label or a range end ("m-th")
+_DAY_SPELLINGS = {
+    0: ["m", "mon", "monday"],
+    1: ["t", "tue", "tues", "tuesday"],
+    2: ["w", "wed", "weds", "wednesday"],
+    3: ["r", "thu", "thur", "thurs", "thursday"],
+    4: ["f", "fri", "friday"],
+    5: ["s", "sat", "saturday"],
+    6: ["u", "sun", "sunday"],
+}
+_DAYS = {name: day for day, names in _DAY_SPELLINGS.items() for name in names}
+_DAY_CODES = {"mo": 0, "tu": 1, "we": 2, "th": 3, "fr": 4, "sa": 5, "su": 6}
+
+_TIME = r"(\d{1,2})(?::(\d{2}))?\s*([ap])\.?m\.?"
+_RANGE = re.compile(_TIME + r"\s*(?:-|–|to)\s*" + _TIME)
+_AFTER = re.compile(r"after\s+" + _TIME)
+_DAY_LABEL = re.compile(r"([a-z]{2,9})\s*:")
+_ONLY = re.compile(r"([\w-]+) (?:use |users |vehicles |drivers )?only")
+
+
+# ---------------------------------------------------------------
+# Parsing
+# ---------------------------------------------------------------
+def _day(token, codes=False):
+    token = token.strip(". ")
+    if codes and token in _DAY_CODES:
+        return _DAY_CODES[token]
+    return _DAYS.get(token)
+
+
+def _days(spec):
+    """Day numbers named by `spec` ("daily", "m-f", "sat", "m-th"); every
+    day when it names none."""
+    spec = spec.strip(" .:")
+    if "weekday" in spec:
+        return list(range(5))
+    if "weekend" in spec:
+        return [5, 6]
+    days = []
+    for token in re.split(r"[\s&/]+|\band\b", spec):
+        first, dash, last = token.partition("-")
+        a, b = _day(first, codes=bool(dash)), _day(last, codes=True) if last else None
+        if a is None:
+            continue
+        if b is None:
+            days.append(a)
+        else:
+            days.extend((a + i) % 7 for i in range((b - a) % 7 + 1))
+    return days or list(range(7))
+
+
+def _hour(h, minute, ampm, end=False):
+    hour = int(h) % 12 + (12 if ampm == "p" else 0)
+    # A window closing at 4:30 is open during the 16:00 hour
+    return hour + (1 if end and minute and int(minute) else 0)
+
+
+def _window(clause):
+    """(open hour, close hour, day spec, flags) named by one clause, or None."""
+    if "not specified" in clause:
+        return 0, 24, "", FLAG_HOURS_UNKNOWN
+    if "24 hours" in clause or "24/7" in clause:
+        return 0, 24, clause.replace("24 hours", ""), 0
+    m = _RANGE.search(clause)
+    if m:
+        start = _hour(m[1], m[2], m[3])
+        end = _hour(m[4], m[5], m[6], end=True)
+        if end <= start:
+            end += 24  # through midnight ("6am-12am", "12:00am-12:00am")
+        return start, end, clause[m.end():], 0
+    m = _AFTER.search(clause)
+    if m:
+        return _hour(m[1], m[2], m[3]), 24, clause[m.end():], 0
+    for words, (start, end, days) in ASSUMED_HOURS.items():
+        if words in clause:
+            return start, end, days, FLAG_HOURS_ASSUMED
+    return None
+
+
+def _restrictions(clause):
+    """Flags of an "... only" note; only known makes count as single-make.
+
+    >>> _restrictions("tesla only") == FLAG_TESLA_ONLY
+    True
+    >>> _restrictions("ford use only") == FLAG_MAKE_ONLY
+    True
+    >>> _restrictions("mercedes-benz drivers only") == FLAG_MAKE_ONLY
+    True
+    >>> _restrictions("for customer use only") == FLAG_CUSTOMERS_ONLY
+    True
+    >>> _restrictions("fleet use only") == FLAG_CUSTOMERS_ONLY
+    True
+    >>> [_restrictions(c) for c in ("electric vehicles only", "public use only", "call only")]
+    [0, 0, 0]
+    """
+    m = _ONLY.search(clause)
+    if m is None:
+        return 0
+    if m[1] == "tesla":
+        return FLAG_TESLA_ONLY
+    if m[1] in _CUSTOMERS:
+        return FLAG_CUSTOMERS_ONLY
+    if m[1] in _MAKE_WORDS:
+        return FLAG_MAKE_ONLY
+    return 0
+
+
+def parse_access(text, other_info=None):
+    """Open hours (bool array of 168, Monday 0:00 first) and flags for one
+    station's `Access Days Time` (and `EV Other Info`) text."""
+    week = np.zeros(HOURS_PER_WEEK, dtype=bool)
+    flags = 0
+    found = False
+    text = "" if pd.isna(text) else re.sub(r"\(.*?\)", "", str(text).lower())
+    # Clauses: "; " and " | " separate notes and days, ", " day groups
+    for clause in re.split(r"[;|,]", text):
+        clause = clause.strip()
+        if not clause:
+            continue
+        flags |= _restrictions(clause)
+        days = None
+        label = _DAY_LABEL.match(clause)
+        if label and _day(label[1], codes=True) is not None:
+            days = [_day(label[1], codes=True)]
+            clause = clause[label.end():]
+        window = _window(clause)
+        if window is None:
+            continue
+        start, end, spec, window_flags = window
+        flags |= window_flags
+        found = True
+        for day in days if days is not None else _days(spec):
+            week[(day * 24 + np.arange(start, end)) % HOURS_PER_WEEK] = True
+    if not found:
+        week[:] = True
+        flags |= FLAG_HOURS_UNKNOWN
+    if not pd.isna(other_info) and "tesla" in str(other_info).lower():
+        flags |= FLAG_TESLA_ONLY  # Tesla-only connector
+    return week, flags
+
+
+def pack_hours(week):
+    """168 booleans (or rows of them) -> `N_WORDS` uint64 words each."""
+    week = np.asarray(week, dtype=bool)
+    pad = np.zeros(week.shape[:-1] + (N_WORDS * 64 - HOURS_PER_WEEK,), dtype=bool)
+    packed = np.packbits(np.concatenate([week, pad], axis=-1), axis=-1, bitorder="little")
+    return packed.view("<u8")
+
+
+def unpack_hours(words):
+    """Inverse of `pack_hours`: (..., 168) uint8 of 0/1."""
+    bits = np.ascontiguousarray(words, dtype="<u8").view(np.uint8)
+    return np.unpackbits(bits, axis=-1, bitorder="little")[..., :HOURS_PER_WEEK]
+
+
+def hour_label(hour):
+    """Label such as "Mon 18:00" for an hour of the week."""
+    return f"{DAY_NAMES[hour // 24]} {hour % 24:02d}:00"
+
+
+def _parse_column(values):
+    """Parse each distinct value once; (stations, N_WORDS) words and flags."""
+    cat = pd.Categorical(values)
+    parsed = [parse_access(v) for v in cat.categories] + [parse_access(None)]
+    words = pack_hours(np.stack([week for week, _ in parsed]))
+    flags = np.array([f for _, f in parsed], dtype=np.uint8)
+    # Missing values have code -1, i.e. the trailing "no hours given" row
+    return words[cat.codes], flags[cat.codes]
+
+
+# ---------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------
+class StationAvailability:
+    def __init__(self, ch, group="county"):
+        """`ch` is the cleaned station frame; results are per `group` value."""
+        self.words, self.flags = _parse_column(ch["access_days_time"])
+        if "ev_other_info" in ch.columns:
+            other = pd.Categorical(ch["ev_other_info"])
+            tesla = np.array(
+                [parse_access(None, v)[1] & FLAG_TESLA_ONLY for v in other.categories] + [0],
+                dtype=np.uint8,
+            )
+            self.flags |= tesla[other.codes]
+        self.chargers = ch["total_chargers"].to_numpy(dtype=np.float64)
+        codes, groups = pd.factorize(ch[group].astype(object))
+        self.groups = pd.Index(groups, name=group)
+        self._codes = codes
+        self._grouped = codes >= 0
+
+    def __len__(self):
+        return len(self.flags)
+
+    def usable(self, exclude=RESTRICTED):
+        """Stations whose flags include none of `exclude`."""
+        return (self.flags & exclude) == 0
+
+    def open_at(self, hour):
+        """Stations open during hour-of-week `hour`."""
+        word = self.words[:, hour // 64]
+        return ((word >> np.uint64(hour % 64)) & np.uint64(1)).astype(bool)
+
+    def _per_group(self, weights):
+        return np.bincount(
+            self._codes[self._grouped],
+            weights[self._grouped],
+            minlength=len(self.groups),
+        )
+
+    def chargers_open(self, hour, exclude=RESTRICTED):
+        """Chargers open at `hour` per group, leaving out stations flagged
+        with any of `exclude`."""
+        weights = self.chargers * (self.open_at(hour) & self.usable(exclude))
+        return pd.Series(self._per_group(weights), index=self.groups)
+
+    def chargers_always(self, exclude=RESTRICTED):
+        """Chargers per group if every usable station were always open."""
+        weights = self.chargers * self.usable(exclude)
+        return pd.Series(self._per_group(weights), index=self.groups)
+
+    def weekly(self, exclude=RESTRICTED):
+        """Chargers open per group (rows) and hour of the week (columns)."""
+        keep = self._grouped & self.usable(exclude)
+        hours = unpack_hours(self.words[keep])
+        # One bincount over (group, hour) cells for the whole week
+        cells = self._codes[keep, None] * HOURS_PER_WEEK + np.arange(HOURS_PER_WEEK)
+        counts = np.bincount(
+            cells.ravel(),
+            (hours * self.chargers[keep, None]).ravel(),
+            minlength=len(self.groups) * HOURS_PER_WEEK,
+        )
+        return pd.DataFrame(
+            counts.reshape(len(self.groups), HOURS_PER_WEEK), index=self.groups
+        )
+
+    def flag_counts(self):
+        """Stations carrying each flag."""
+        return pd.Series(
+            {name: int(((self.flags & bit) > 0).sum()) for name, bit in ACCESS_FLAGS.items()}
+        )
+
+
+def evs_per_charger(evs, chargers):
+    """EVs per open charger; NaN where nothing is open."""
+    chargers = np.asarray(chargers, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(chargers > 0, evs / chargers, np.nan)
@@ -0,0 +1,121 @@
+"""Pre-aggregated registration counts behind the sidebar filters.
+
+`EvCube` holds a dense group x `ev_category` x `vehicle_year` count array with
+prefix sums along the year axis, so any (group, category, year range) count
+is a constant-time lookup instead of a scan of the registration table.
+"""
+import numpy as np
+import pandas as pd
+
+
+class EvCube:
+    def __init__(self, groups, categories, first_year, counts, total_rows):
+        # `counts` has one extra trailing group slot for rows without a group.
+        # `first_year` is None when the data has no year column.
+        self.groups = list(groups)
+        self.categories = list(categories)
+        self.first_year = first_year
+        self.total_rows = int(total_rows)
+        self._group_pos = {g: i for i, g in enumerate(self.groups)}
+        self._cat_pos = {c: i for i, c in enumerate(self.categories)}
+
+        n_groups, n_cats, n_years = counts.shape
+        prefix = np.zeros((n_groups, n_cats, n_years + 1), dtype=np.int64)
+        np.cumsum(counts, axis=2, out=prefix[:, :, 1:])
+        self._prefix = prefix
+        self._prefix_by_group = prefix.sum(axis=1)
+        self._prefix_by_cat = prefix.sum(axis=0)
+        self._prefix_all = prefix.sum(axis=(0, 1))
+
+    @classmethod
+    def from_frame(
+        cls,
+        df,
+        group_col="county",
+        category_col="ev_category",
+        year_col="vehicle_year",
+        count_col=None,
+    ):
+        """Cube over `df`; with `count_col` each row is a pre-aggregated
+        group with that many registrations (e.g. a SQL `GROUP BY`)."""
+        group_codes, groups = pd.factorize(df[group_col], sort=True)
+        group_codes = np.where(group_codes < 0, len(groups), group_codes)
+        cat_codes, categories = pd.factorize(df[category_col], sort=True)
+        valid = cat_codes >= 0
+
+        first_year = None
+        n_years = 1
+        year_codes = np.zeros(len(df), dtype=np.int64)
+        if year_col in df.columns:
+            # Rows without a year never pass the year-range filter
+            years = pd.to_numeric(df[year_col], errors="coerce").to_numpy(
+                dtype=np.float64, na_value=np.nan
+            )
+            valid &= ~np.isnan(years)
+            if valid.any():
+                first_year = int(years[valid].min())
+                n_years = int(years[valid].max()) - first_year + 1
+                year_codes[valid] = years[valid].astype(np.int64) - first_year
+            else:
+                first_year = 0
+
+        shape = (len(groups) + 1, len(categories), n_years)
+        flat = np.ravel_multi_index(
+            (group_codes[valid], cat_codes[valid], year_codes[valid]), shape
+        )
+        if count_col is None:
+            weights, total_rows = None, len(df)
+        else:
+            weights = df[count_col].to_numpy(dtype=np.int64)
+            total_rows = int(weights.sum())
+            weights = weights[valid]
+        counts = np.bincount(flat, weights, minlength=int(np.prod(shape)))
+        counts = counts.astype(np.int64).reshape(shape)
+        return cls(groups, categories, first_year, counts, total_rows)
+
+    @property
+    def year_range(self):
+        if self.first_year is None:
+            return None
+        return self.first_year, self.first_year + self._prefix.shape[2] - 2
+
+    def _year_bounds(self, years):
+        n_years = self._prefix.shape[2] - 1
+        if years is None or self.first_year is None:
+            return 0, n_years
+        lo = min(max(int(years[0]) - self.first_year, 0), n_years)
+        hi = min(max(int(years[1]) - self.first_year + 1, lo), n_years)
+        return lo, hi
+
+    def count(self, group=None, category=None, years=None):
+        """Registrations for one group/category (None = all) in a year range."""
+        lo, hi = self._year_bounds(years)
+        if group is not None and group not in self._group_pos:
+            return 0
+        if category is not None and category not in self._cat_pos:
+            return 0
+
+        if group is None and category is None:
+            p = self._prefix_all
+        elif group is None:
+            p = self._prefix_by_cat[self._cat_pos[category]]
+        elif category is None:
+            p = self._prefix_by_group[self._group_pos[group]]
+        else:
+            p = self._prefix[self._group_pos[group], self._cat_pos[category]]
+        return int(p[hi] - p[lo])
+
+    def by_group(self, category=None, years=None):
+        """Registrations per group (rows without a group excluded)."""
+        lo, hi = self._year_bounds(years)
+        if category is None:
+            p = self._prefix_by_group
+        elif category in self._cat_pos:
+            p = self._prefix[:, self._cat_pos[category]]
+        else:
+            return pd.Series(0, index=self.groups, dtype="int64")
+        return pd.Series(p[:-1, hi] - p[:-1, lo], index=self.groups, dtype="int64")
+
+    def dense_counts(self):
+        """(groups + 1, categories, years) counts; the last group is unassigned."""
+        return np.diff(self._prefix, axis=2)
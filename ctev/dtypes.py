@@ -0,0 +1,128 @@
+"""Column projection and compact dtypes for the cleaned frames.
+
+Repeated text (city, make, model, county, ...) becomes categorical, years and
+charger counts become small integers, coordinates float32 and the three
+"has charger type" flags are packed into one `charger_flags` byte. Columns no
+view reads are dropped. `memory_report` compares the deep size of each frame
+before and after.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Registration columns kept after cleaning, with their dtypes. The key column
+# (`id` or `vin`) stays for de-duplication of later refreshes.
+REGISTRATION_PLAN = {
+    "id": "key",
+    "vin": "key",
+    "primary_customer_city": "category",
+    "vehicle_make": "category",
+    "vehicle_model": "category",
+    "vehicle_type": "category",
+    "vehicle_year": "Int16",
+    "fuel_code": "category",
+    "ev_category": "category",
+    "town": "category",
+    "county": "category",
+}
+
+STATION_PLAN = {
+    "station_name": "object",
+    "street_address": "object",
+    "city": "category",
+    "access_days_time": "category",
+    "ev_other_info": "category",
+    "ev_level1_evse_num": "int16",
+    "ev_level2_evse_num": "int16",
+    "ev_dc_fast_count": "int16",
+    "total_chargers": "int16",
+    "charger_flags": "uint8",
+    "lat": "float32",
+    "lon": "float32",
+    "town": "category",
+    "county": "category",
+}
+
+# Bits of `charger_flags`
+FLAG_DC_FAST = 1
+FLAG_LEVEL2 = 2
+FLAG_LEVEL1 = 4
+
+CHARGER_FLAGS = {
+    "has_dc_fast": FLAG_DC_FAST,
+    "has_level2": FLAG_LEVEL2,
+    "has_level1": FLAG_LEVEL1,
+}
+
+
+def pack_flags(dc_fast, level2, level1):
+    """One uint8 per station from three charger-count columns."""
+    return (
+        (np.asarray(dc_fast) > 0) * FLAG_DC_FAST
+        | (np.asarray(level2) > 0) * FLAG_LEVEL2
+        | (np.asarray(level1) > 0) * FLAG_LEVEL1
+    ).astype(np.uint8)
+
+
+def has_flag(ch, flag):
+    """Boolean array: stations whose `charger_flags` include `flag`."""
+    return (ch["charger_flags"].to_numpy() & flag) > 0
+
+
+def _convert(col, dtype):
+    if dtype == "key":
+        # Numeric IDs shrink to the smallest integer type; VINs stay text
+        if pd.api.types.is_numeric_dtype(col):
+            return pd.to_numeric(col, downcast="integer")
+        return col
+    if dtype == "Int16":
+        return pd.to_numeric(col, errors="coerce").round().astype("Int16")
+    if dtype == "category":
+        return col if isinstance(col.dtype, pd.CategoricalDtype) else col.astype("category")
+    return col.astype(dtype)
+
+
+def apply_plan(df, plan):
+    """Keep only the planned columns (in plan order) with their dtypes."""
+    return pd.DataFrame(
+        {c: _convert(df[c], dtype) for c, dtype in plan.items() if c in df.columns},
+        index=df.index,
+    )
+
+
+def concat(frames):
+    """Row-wise concat of planned frames that keeps categorical columns
+    categorical (the union of their categories) instead of falling back to
+    object."""
+    frames = [f for f in frames if len(f)] or frames[:1]
+    index = frames[0].index.append([f.index for f in frames[1:]])
+    out = {}
+    for col in frames[0].columns:
+        parts = [f[col] for f in frames]
+        if all(isinstance(p.dtype, pd.CategoricalDtype) for p in parts):
+            out[col] = pd.Series(union_categoricals(parts, ignore_order=True), index=index)
+        else:
+            out[col] = pd.concat(parts, ignore_index=True).set_axis(index)
+    return pd.DataFrame(out, index=index)
+
+
+def memory_report(before, after):
+    """Deep bytes per frame before/after; both map frame name -> DataFrame."""
+    rows = []
+    for name, df in before.items():
+        new = after.get(name)
+        rows.append(
+            {
+                "frame": name,
+                "rows": len(df),
+                "columns_before": df.shape[1],
+                "columns_after": None if new is None else new.shape[1],
+                "bytes_before": int(df.memory_usage(deep=True).sum()),
+                "bytes_after": 0 if new is None else int(new.memory_usage(deep=True).sum()),
+            }
+        )
+    report = pd.DataFrame(rows)
+    report["ratio"] = (
+        report["bytes_before"] / report["bytes_after"].replace({0: np.nan})
+    ).round(2)
+    return report
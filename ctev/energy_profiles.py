@@ -0,0 +1,143 @@
+"""Parser for the DOE 2016 city & county energy profiles CSV.
+
+The file has five header rows — calibration band, sector, fuel, NAICS code and
+field name — followed by ~150 columns of quoted, thousands-separated numbers
+such as `" 315,398 "`. `read_schema` turns the header rows into a
+(sector, fuel, metric, variant) MultiIndex; `read_profiles` reads only the
+requested columns for the requested states and converts them in bulk.
+"""
+import numpy as np
+import pandas as pd
+
+HEADER_ROWS = 5
+ENCODING = "utf-8-sig"
+
+# Identity columns that stay as text
+TEXT_FIELDS = {
+    "state_abbr",
+    "county_state_name",
+    "county_name",
+    "consolidated_city-county",
+    "egrid_primary_subregion",
+}
+
+# Commonly used measures, keyed by the names they get on county tables
+ELECTRICITY_FIELDS = {
+    "residential_mwh": ("Residential", "Electricity", "consumption (MWh)"),
+    "commercial_mwh": ("Commercial", "Electricity", "consumption (MWh)"),
+    "industrial_mwh": ("Industry", "Electricity", "consumption (MWh)"),
+}
+
+
+def _variant(calibration, naics):
+    calibration = calibration.strip().lower()
+    if calibration.startswith("by naics"):
+        return naics.strip()
+    if calibration:
+        return calibration.split()[0]
+    return ""
+
+
+def read_schema(path):
+    """Column schema as a MultiIndex in file order.
+
+    Levels are `sector`, `fuel`, `metric` and `variant`; `variant` is
+    "local"/"state" for calibrated measures, the NAICS code for the industry
+    breakdown and empty otherwise. Identity columns only have a `metric`.
+    """
+    head = pd.read_csv(
+        path, header=None, nrows=HEADER_ROWS, dtype=str, encoding=ENCODING
+    ).fillna("")
+    calibration, sector, fuel, naics, metric = (head.iloc[i] for i in range(5))
+    return pd.MultiIndex.from_arrays(
+        [
+            sector.str.strip(),
+            fuel.str.strip(),
+            metric.str.strip(),
+            [_variant(c, n) for c, n in zip(calibration, naics)],
+        ],
+        names=["sector", "fuel", "metric", "variant"],
+    )
+
+
+def _locate(schema, key):
+    """Column position for an identity name or a (sector, fuel, metric[, variant]) key."""
+    if isinstance(key, str):
+        key = ("", "", key)
+    matches = np.flatnonzero(
+        np.all(
+            [schema.get_level_values(i) == part for i, part in enumerate(key)],
+            axis=0,
+        )
+    )
+    if not len(matches):
+        raise KeyError(f"energy profile column not found: {key!r}")
+    # Without an explicit variant prefer the uncalibrated / local measure
+    return int(matches[0])
+
+
+def to_number(values):
+    """Vectorized parse of `" 3,184,501 "`-style strings (`-` means zero)."""
+    text = values.astype(str).str.replace(",", "", regex=False).str.strip()
+    text = text.mask(text == "-", "0")
+    return pd.to_numeric(text, errors="coerce")
+
+
+def _state_rows(path, state_pos, states):
+    abbr = pd.read_csv(
+        path,
+        header=None,
+        skiprows=HEADER_ROWS,
+        usecols=[state_pos],
+        dtype=str,
+        encoding=ENCODING,
+    )[state_pos].str.strip().str.upper()
+    return np.flatnonzero(abbr.isin({s.upper() for s in states}).to_numpy())
+
+
+def read_profiles(path, fields, states=None, schema=None):
+    """Read selected energy-profile columns.
+
+    `fields` is either a list of keys (the result keeps MultiIndex columns) or
+    a dict mapping output names to keys. Keys are identity column names such
+    as "population" or (sector, fuel, metric[, variant]) tuples. Only rows
+    whose `state_abbr` is in `states` are materialized.
+    """
+    if schema is None:
+        schema = read_schema(path)
+    named = isinstance(fields, dict)
+    keys = list(fields.values()) if named else list(fields)
+    positions = [_locate(schema, k) for k in keys]
+
+    read_kwargs = {"skiprows": HEADER_ROWS}
+    if states is not None:
+        rows = _state_rows(path, _locate(schema, "state_abbr"), states)
+        if not len(rows):
+            read_kwargs = {"skiprows": HEADER_ROWS, "nrows": 0}
+        elif rows[-1] - rows[0] + 1 == len(rows):
+            # States are stored contiguously: one seek, no per-row callback
+            read_kwargs = {"skiprows": HEADER_ROWS + rows[0], "nrows": len(rows)}
+        else:
+            keep = set((rows + HEADER_ROWS).tolist())
+            read_kwargs = {"skiprows": lambda i: i not in keep}
+
+    raw = pd.read_csv(
+        path,
+        header=None,
+        usecols=sorted(set(positions)),
+        dtype=str,
+        encoding=ENCODING,
+        **read_kwargs,
+    )
+
+    out = pd.DataFrame(index=raw.index)
+    for i, pos in enumerate(positions):
+        metric = schema[pos][2]
+        col = raw[pos]
+        out[i] = col.str.strip() if metric in TEXT_FIELDS else to_number(col)
+
+    if named:
+        out.columns = list(fields.keys())
+    else:
+        out.columns = schema[positions]
+    return out.reset_index(drop=True)
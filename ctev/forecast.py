@@ -0,0 +1,105 @@
+"""Batch EV adoption forecasts per town and EV category.
+
+The cumulative fleet by model year is fitted with a log-linear (exponential)
+growth curve over the most recent `window` years. All town x category series
+are fitted at once from the closed-form weighted least-squares sums. A
+`GrowthFit` holds only the fitted parameters, so a caller that keeps it (the
+app does, per state and data version) re-evaluates the curves when the
+forecast horizon changes instead of refitting.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Cap on the fitted annual growth rate so very young series don't explode
+MAX_ANNUAL_GROWTH = 0.6
+
+GrowthFit = namedtuple(
+    "GrowthFit", ["intercept", "slope", "last_year", "last_value", "groups", "categories"]
+)
+
+
+def fit_growth(counts, first_year, window=6, groups=None, categories=None):
+    """Fit every (group, category) series in a (G, C, Y) count array."""
+    n_groups, n_cats, n_years = counts.shape
+    cumulative = np.cumsum(counts, axis=2).reshape(-1, n_years).astype(np.float64)
+
+    window = min(window, n_years)
+    y = cumulative[:, -window:]
+    t = np.arange(-window + 1, 1, dtype=np.float64)  # 0 = last observed year
+    w = (y > 0).astype(np.float64)
+    logy = np.log(np.where(y > 0, y, 1.0))
+
+    sw = w.sum(axis=1)
+    st = w @ t
+    stt = w @ (t * t)
+    sy = (w * logy).sum(axis=1)
+    sty = (w * logy) @ t
+
+    denom = sw * stt - st * st
+    ok = (sw >= 2) & (denom > 0)
+    slope = np.where(ok, (sw * sty - st * sy) / np.where(ok, denom, 1.0), 0.0)
+    slope = np.clip(slope, 0.0, np.log1p(MAX_ANNUAL_GROWTH))
+    intercept = np.where(sw > 0, (sy - slope * st) / np.where(sw > 0, sw, 1.0), 0.0)
+
+    shape = (n_groups, n_cats)
+    return GrowthFit(
+        intercept.reshape(shape),
+        slope.reshape(shape),
+        first_year + n_years - 1,
+        cumulative[:, -1].reshape(shape),
+        groups,
+        categories,
+    )
+
+
+def fit_cube(cube, window=6):
+    """Fit the growth curves for an `EvCube`."""
+    return fit_growth(
+        cube.dense_counts(),
+        cube.first_year or 0,
+        window,
+        groups=cube.groups + [None],
+        categories=cube.categories,
+    )
+
+
+def evaluate(fit, horizon_year):
+    """Forecast fleet size in `horizon_year` as a (G, C) array."""
+    steps = max(int(horizon_year) - fit.last_year, 0)
+    projected = np.exp(fit.intercept + fit.slope * steps)
+    # Never forecast below the fleet already on the road
+    return np.where(fit.last_value > 0, np.maximum(projected, fit.last_value), 0.0)
+
+
+def forecast_table(fit, horizon_year):
+    """Long table of group, `ev_category`, current fleet and forecast."""
+    values = evaluate(fit, horizon_year)
+    g, c = np.meshgrid(
+        np.arange(len(fit.groups)), np.arange(len(fit.categories)), indexing="ij"
+    )
+    return pd.DataFrame(
+        {
+            "group": np.asarray(fit.groups, dtype=object)[g.ravel()],
+            "ev_category": np.asarray(fit.categories, dtype=object)[c.ravel()],
+            "ev_current": fit.last_value.ravel(),
+            "ev_forecast": values.ravel(),
+        }
+    )
+
+
+def add_county_forecast(county_full, town_forecast, town_to_county, horizon_year):
+    """Copy of `county_full` with `ev_forecast_<year>` columns (total and per category)."""
+    table = town_forecast.dropna(subset=["group"]).copy()
+    table["county"] = table["group"].map(town_to_county)
+    wide = table.pivot_table(
+        index="county", columns="ev_category", values="ev_forecast", aggfunc="sum"
+    )
+    wide.columns = [f"ev_forecast_{horizon_year}_{c.lower()}" for c in wide.columns]
+    wide[f"ev_forecast_{horizon_year}"] = wide.sum(axis=1)
+
+    out = county_full.drop(
+        columns=[c for c in county_full.columns if c.startswith("ev_forecast_")]
+    )
+    return out.merge(wide.round().reset_index(), on="county", how="left")
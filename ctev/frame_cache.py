@@ -0,0 +1,200 @@
+"""Persistent on-disk cache for the cleaned data frames.
+
+Frames are stored as Arrow IPC (Feather v2) files in a directory named after a
+content hash of the source CSVs. A restart with unchanged inputs reads the
+stored frames back (every column is materialised as pandas; the app's tables
+show whole rows) instead of re-parsing and re-cleaning the raw files. Each
+entry can carry metadata (e.g. source fingerprints), and `latest` remembers
+the newest entry per tag so a caller can update it incrementally.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from ctev import refresh
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - pickle fallback below
+    pa = None
+
+CACHE_DIR = Path(
+    os.environ.get(
+        "CTEV_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache"
+    )
+)
+CACHE_ENABLED = os.environ.get("CTEV_DISABLE_CACHE", "") == ""
+
+_DIGESTS_FILE = "digests.json"
+_MANIFEST_FILE = "manifest.json"
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's bytes."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_digest_memo(cache_dir):
+    try:
+        return json.loads((cache_dir / _DIGESTS_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def source_digests(paths, cache_dir=CACHE_DIR):
+    """Content hash of every source file.
+
+    Hashes are memoised by (size, mtime) so an untouched multi-GB export is not
+    re-read on every start. Any other file is hashed in full (with its
+    `refresh.fingerprint`, which is stored alongside): head/tail checks
+    cannot tell an edit in the middle of a same-size file from a touch.
+    """
+    memo = _load_digest_memo(cache_dir)
+    digests = {}
+    changed = False
+    for name, path in paths.items():
+        if path is None or not Path(path).exists():
+            digests[name] = None
+            continue
+        path = Path(path)
+        stat = path.stat()
+        entry = memo.get(str(path))
+        if (
+            entry
+            # Memos from before whole-file fingerprints may hold a stale digest
+            and "sha256" in entry.get("fingerprint", {})
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+        ):
+            digests[name] = entry["digest"]
+            continue
+        fingerprint = refresh.fingerprint(path)
+        digests[name] = fingerprint["sha256"]
+        memo[str(path)] = {
+            "size": fingerprint["size"],
+            "mtime_ns": fingerprint["mtime_ns"],
+            "digest": digests[name],
+            "fingerprint": fingerprint,
+        }
+        changed = True
+
+    if changed:
+        try:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            (cache_dir / _DIGESTS_FILE).write_text(json.dumps(memo, indent=2))
+        except OSError:
+            pass
+    return digests
+
+
+def cache_key(paths, version, cache_dir=CACHE_DIR):
+    """Cache key for a set of sources and a pipeline version."""
+    payload = json.dumps(
+        {"version": version, "sources": source_digests(paths, cache_dir)},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+def _write_frame(df, path):
+    if pa is not None:
+        try:
+            table = pa.Table.from_pandas(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed-type object columns can't be expressed in Arrow
+            pass
+        else:
+            with pa.OSFile(str(path.with_suffix(".arrow")), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            return
+    df.to_pickle(path.with_suffix(".pkl"))
+
+
+def _read_frame(path):
+    arrow_path = path.with_suffix(".arrow")
+    if arrow_path.exists() and pa is not None:
+        source = pa.memory_map(str(arrow_path), "r")
+        return pa.ipc.open_file(source).read_all().to_pandas()
+    return pd.read_pickle(path.with_suffix(".pkl"))
+
+
+def load_meta(key, cache_dir=CACHE_DIR):
+    """Metadata stored with entry `key` ({} when missing)."""
+    try:
+        manifest = json.loads((cache_dir / key / _MANIFEST_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("meta", {})
+
+
+def latest(tag, cache_dir=CACHE_DIR):
+    """Key of the newest entry stored for `tag`, if it still exists."""
+    if not CACHE_ENABLED:
+        return None
+    try:
+        key = json.loads((cache_dir / f"latest-{tag}.json").read_text())["key"]
+    except (OSError, ValueError, KeyError):
+        return None
+    return key if (cache_dir / key / _MANIFEST_FILE).exists() else None
+
+
+def load(key, names, cache_dir=CACHE_DIR):
+    """Return the cached frames for `key` in `names` order, or None on a miss."""
+    if not CACHE_ENABLED:
+        return None
+    entry = cache_dir / key
+    if not (entry / _MANIFEST_FILE).exists():
+        return None
+    try:
+        return tuple(_read_frame(entry / name) for name in names)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def store(key, frames, cache_dir=CACHE_DIR, keep=3, meta=None, tag=None):
+    """Write `frames` (name -> DataFrame) under `key` and prune old entries.
+
+    `meta` is kept in the entry's manifest; with a `tag` the entry becomes
+    that tag's `latest`.
+    """
+    if not CACHE_ENABLED:
+        return
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=cache_dir))
+        for name, df in frames.items():
+            _write_frame(df, tmp / name)
+        (tmp / _MANIFEST_FILE).write_text(
+            json.dumps({"frames": list(frames), "meta": meta or {}}, indent=2)
+        )
+        entry = cache_dir / key
+        if entry.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, entry)
+        if tag is not None:
+            (cache_dir / f"latest-{tag}.json").write_text(json.dumps({"key": key}))
+    except OSError:
+        return
+    prune(cache_dir, keep=keep)
+
+
+def prune(cache_dir=CACHE_DIR, keep=3):
+    """Remove all but the `keep` most recently written cache entries."""
+    entries = sorted(
+        (p for p in cache_dir.iterdir() if (p / _MANIFEST_FILE).exists()),
+        key=lambda p: (p / _MANIFEST_FILE).stat().st_mtime,
+        reverse=True,
+    )
+    for stale in entries[keep:]:
+        shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,231 @@
+"""Town -> county resolution for free-text city names.
+
+One gazetteer per state, loaded on first use from `data/{state}_towns.csv`
+(plus optional `data/{state}_aliases.csv`) or plugged in with `register`.
+The CT one covers all 169 towns plus villages, post-office names and common
+misspellings. Each distinct city string is resolved once — exact town, then
+alias, then a fuzzy match — and the result is applied to whole columns as
+categorical codes.
+"""
+import difflib
+import re
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+
+# Leading abbreviations seen in the DMV and AFDC exports ("W Hartford", ...)
+_PREFIXES = {
+    "E": "EAST",
+    "W": "WEST",
+    "N": "NORTH",
+    "NO": "NORTH",
+    "S": "SOUTH",
+    "SO": "SOUTH",
+}
+# Trailing state markers ("Stamford CT", "Avon, Conn.")
+_SUFFIXES = {"CT", "CONN", "CONNECTICUT"}
+
+STATE_NAMES = {
+    "AL": "Alabama", "AK": "Alaska", "AZ": "Arizona", "AR": "Arkansas",
+    "CA": "California", "CO": "Colorado", "CT": "Connecticut",
+    "DE": "Delaware", "DC": "District of Columbia", "FL": "Florida",
+    "GA": "Georgia", "HI": "Hawaii", "ID": "Idaho", "IL": "Illinois",
+    "IN": "Indiana", "IA": "Iowa", "KS": "Kansas", "KY": "Kentucky",
+    "LA": "Louisiana", "ME": "Maine", "MD": "Maryland",
+    "MA": "Massachusetts", "MI": "Michigan", "MN": "Minnesota",
+    "MS": "Mississippi", "MO": "Missouri", "MT": "Montana",
+    "NE": "Nebraska", "NV": "Nevada", "NH": "New Hampshire",
+    "NJ": "New Jersey", "NM": "New Mexico", "NY": "New York",
+    "NC": "North Carolina", "ND": "North Dakota", "OH": "Ohio",
+    "OK": "Oklahoma", "OR": "Oregon", "PA": "Pennsylvania",
+    "RI": "Rhode Island", "SC": "South Carolina", "SD": "South Dakota",
+    "TN": "Tennessee", "TX": "Texas", "UT": "Utah", "VT": "Vermont",
+    "VA": "Virginia", "WA": "Washington", "WV": "West Virginia",
+    "WI": "Wisconsin", "WY": "Wyoming",
+}
+
+# Extra abbreviations people append to city names
+_STATE_ABBREVIATIONS = {
+    "CT": {"CONN"},
+    "MA": {"MASS"},
+    "NH": {"N H"},
+    "RI": {"R I"},
+    "VT": {"VERM"},
+}
+
+FUZZY_CUTOFF = 0.85
+
+TownMatch = namedtuple("TownMatch", ["town", "county", "unmatched"])
+
+
+def state_suffixes(state):
+    """Trailing markers stripped from city names in `state`."""
+    state = state.upper()
+    return {state, STATE_NAMES.get(state, state).upper()} | _STATE_ABBREVIATIONS.get(
+        state, set()
+    )
+
+
+def _strip_suffixes(words, suffixes):
+    # Suffixes may span words ("NEW HAMPSHIRE", "R I")
+    tails = [s.split() for s in suffixes]
+    stripped = True
+    while words and stripped:
+        stripped = False
+        for tail in tails:
+            if len(words) >= len(tail) and words[-len(tail):] == tail:
+                del words[-len(tail):]
+                stripped = True
+                break
+    return words
+
+
+def normalize_place(name, suffixes=_SUFFIXES):
+    """Upper-case, strip punctuation and expand direction abbreviations."""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ""
+    words = _strip_suffixes(re.sub(r"[^A-Z ]+", " ", str(name).upper()).split(), suffixes)
+    if len(words) > 1 and words[0] in _PREFIXES:
+        words[0] = _PREFIXES[words[0]]
+    return " ".join(words)
+
+
+class Gazetteer:
+    def __init__(self, towns, aliases=None, suffixes=_SUFFIXES):
+        # `towns`: DataFrame with `town`, `county` and optionally `lat`/`lon`
+        # centroids; `aliases`: alias -> town
+        self.suffixes = suffixes
+        towns = towns.sort_values("town").reset_index(drop=True)
+        self.table = towns
+        self.towns = towns["town"].tolist()
+        self.counties = sorted(towns["county"].unique().tolist())
+
+        town_pos = {t: i for i, t in enumerate(self.towns)}
+        county_pos = {c: i for i, c in enumerate(self.counties)}
+        self._town_county = np.array(
+            [county_pos[c] for c in towns["county"]], dtype=np.int16
+        )
+
+        self._lookup = {
+            normalize_place(t, suffixes): i for i, t in enumerate(self.towns)
+        }
+        for alias, town in (aliases or {}).items():
+            self._lookup.setdefault(normalize_place(alias, suffixes), town_pos[town])
+        self._keys = list(self._lookup)
+        self._memo = {}
+
+    @classmethod
+    def from_csv(cls, towns_path, aliases_path=None, suffixes=_SUFFIXES):
+        towns = pd.read_csv(towns_path)
+        aliases = None
+        if aliases_path is not None and Path(aliases_path).exists():
+            alias_df = pd.read_csv(aliases_path)
+            aliases = dict(zip(alias_df["alias"], alias_df["town"]))
+        return cls(towns, aliases, suffixes)
+
+    @property
+    def town_to_county(self):
+        return {
+            t: self.counties[c] for t, c in zip(self.towns, self._town_county)
+        }
+
+    def _resolve_key(self, key):
+        if not key:
+            return -1
+        if key in self._lookup:
+            return self._lookup[key]
+        if len(key) < 4:
+            return -1
+        close = difflib.get_close_matches(key, self._keys, n=1, cutoff=FUZZY_CUTOFF)
+        return self._lookup[close[0]] if close else -1
+
+    def resolve_name(self, name):
+        """Town index for one raw city string (-1 when unmatched)."""
+        if name not in self._memo:
+            self._memo[name] = self._resolve_key(normalize_place(name, self.suffixes))
+        return self._memo[name]
+
+    def resolve(self, values):
+        """Resolve a column of city strings.
+
+        Returns a `TownMatch` of categorical `town` and `county` arrays aligned
+        with `values`, plus the row counts of the raw strings left unmatched.
+        """
+        codes, uniques = pd.factorize(values)
+        unique_towns = np.array(
+            [self.resolve_name(u) for u in uniques], dtype=np.int32
+        )
+        town_codes = np.full(len(codes), -1, dtype=np.int32)
+        present = codes >= 0
+        town_codes[present] = unique_towns[codes[present]]
+
+        matched = town_codes >= 0
+        county_codes = np.full(len(codes), -1, dtype=np.int16)
+        county_codes[matched] = self._town_county[town_codes[matched]]
+
+        miss = np.bincount(codes[present & ~matched], minlength=len(uniques))
+        unmatched = pd.Series(miss, index=pd.Index(uniques, name="city"))
+        unmatched = unmatched[unmatched > 0].sort_values(ascending=False)
+
+        return TownMatch(
+            pd.Categorical.from_codes(town_codes, categories=self.towns),
+            pd.Categorical.from_codes(county_codes, categories=self.counties),
+            unmatched,
+        )
+
+
+def unmatched_report(df, raw_col, town_col="town"):
+    """Raw city strings (with row counts) that did not resolve to a town."""
+    if raw_col not in df.columns or town_col not in df.columns:
+        return pd.Series(dtype="int64")
+    missing = df.loc[df[town_col].isna(), raw_col]
+    counts = missing.value_counts()
+    # Categorical columns also list the categories that never went missing
+    return counts[counts > 0]
+
+
+# ---------------------------------------------------------------
+# Per-state registry
+# ---------------------------------------------------------------
+_REGISTRY = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def register(state, gazetteer):
+    """Use `gazetteer` for `state` instead of (or in the absence of) a data file."""
+    with _REGISTRY_LOCK:
+        _REGISTRY[state.upper()] = gazetteer
+
+
+def _towns_path(state):
+    return DATA_DIR / f"{state.lower()}_towns.csv"
+
+
+def available_states():
+    """States with a registered gazetteer or a `data/{state}_towns.csv` file."""
+    shipped = {p.name.split("_")[0].upper() for p in DATA_DIR.glob("*_towns.csv")}
+    return sorted(shipped | set(_REGISTRY))
+
+
+def for_state(state):
+    """The gazetteer for `state`, loaded from `DATA_DIR` on first use."""
+    state = state.upper()
+    with _REGISTRY_LOCK:
+        if state not in _REGISTRY:
+            path = _towns_path(state)
+            if not path.exists():
+                raise KeyError(f"no town gazetteer for state {state!r} ({path.name})")
+            _REGISTRY[state] = Gazetteer.from_csv(
+                path,
+                DATA_DIR / f"{state.lower()}_aliases.csv",
+                state_suffixes(state),
+            )
+        return _REGISTRY[state]
+
+
+CT_GAZETTEER = for_state("CT")
@@ -0,0 +1,238 @@
+"""Loading and cleaning of the DMV EV registration export.
+
+`read_registrations` either parses the whole file at once or, with a
+`chunksize`, streams it in fixed-size chunks: the state filter and the column
+projection are applied per chunk, duplicates are dropped across chunks using
+hashed keys, and the per-county counts are accumulated incrementally. Peak
+memory then depends on the chunk size rather than on the size of the export.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from ctev import dtypes, instrument, textnorm
+
+try:
+    import pyarrow  # noqa: F401 - enables pandas' Arrow CSV engine
+except ImportError:  # pragma: no cover - C engine below
+    pyarrow = None
+
+# Columns kept when streaming (normalised names); everything else is dropped
+# at parse time.
+REGISTRATION_COLUMNS = (
+    "id",
+    "vin",
+    "state",
+    "primary_customer_state",
+    "primary_customer_city",
+    "vehicle_make",
+    "vehicle_model",
+    "model_year",
+    "vehicle_year",
+    "vehicle_type",
+    "fuel_code",
+)
+
+DEFAULT_CHUNKSIZE = 250_000
+
+# Exports larger than this are streamed automatically
+STREAM_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+# Whole-file parses use the multithreaded Arrow reader when pyarrow is there
+CSV_ENGINE = os.environ.get("CTEV_CSV_ENGINE", "pyarrow" if pyarrow else "c")
+
+
+def normalize_name(name):
+    name = str(name).strip().lower().replace(" ", "_")
+    return re.sub(r"[^a-z0-9_]", "", name)
+
+
+def normalize_columns(df):
+    df.columns = [normalize_name(c) for c in df.columns]
+    return df
+
+
+def read_csv(path, **kwargs):
+    """`pd.read_csv` of a whole plain CSV with the fastest available engine.
+
+    Files the Arrow reader rejects (ragged rows, odd quoting) are re-read with
+    the C engine.
+    """
+    if CSV_ENGINE == "pyarrow":
+        try:
+            return pd.read_csv(path, engine="pyarrow", **kwargs)
+        except (ValueError, TypeError):
+            # ParserError for malformed rows, ValueError for unsupported options
+            pass
+    return pd.read_csv(path, low_memory=False, **kwargs)
+
+
+def streaming_chunksize(path):
+    """Chunk size to stream `path` with, or None to parse it in one go.
+
+    `CTEV_STREAM_CHUNKSIZE` forces streaming (or `0` disables it); otherwise
+    files above `STREAM_THRESHOLD_BYTES` are streamed.
+    """
+    env = os.environ.get("CTEV_STREAM_CHUNKSIZE")
+    if env is not None:
+        return int(env) or None
+    if os.path.exists(path) and os.path.getsize(path) > STREAM_THRESHOLD_BYTES:
+        return DEFAULT_CHUNKSIZE
+    return None
+
+
+def _state_column(columns):
+    for col in ("state", "primary_customer_state"):
+        if col in columns:
+            return col
+    return None
+
+
+def _key_column(columns):
+    for col in ("vin", "id"):
+        if col in columns:
+            return col
+    return None
+
+
+def clean_registrations(ev, state="CT"):
+    """State filter, text clean-up and `vehicle_year` parsing for one frame."""
+    state_col = _state_column(ev.columns)
+    if state_col is not None:
+        ev = ev[textnorm.unique_mask(ev[state_col], lambda s: str(s).strip().upper() == state)]
+
+    ev = ev.copy()
+    for col, field in textnorm.REGISTRATION_FIELDS.items():
+        if col in ev.columns:
+            # Cleaned once per distinct value, stored as categorical codes
+            ev[col] = textnorm.normalize_column(ev[col], field)
+
+    if "model_year" in ev.columns:
+        ev["vehicle_year"] = pd.to_numeric(ev["model_year"], errors="coerce")
+    elif "vehicle_year" in ev.columns:
+        ev["vehicle_year"] = pd.to_numeric(ev["vehicle_year"], errors="coerce")
+    return ev
+
+
+def add_ev_category(ev):
+    if "fuel_code" in ev.columns:
+        ev["ev_category"] = ev["fuel_code"].replace(
+            {"E00": "BEV", "H04": "PHEV"}
+        ).fillna("Other")
+    else:
+        ev["ev_category"] = "Unknown"
+    return ev
+
+
+def add_county(ev, gazetteer):
+    """Categorical `town` and `county` columns resolved from the city name."""
+    if "primary_customer_city" in ev.columns:
+        city = ev["primary_customer_city"]
+    else:
+        city = pd.Series("", index=ev.index)
+    match = gazetteer.resolve(city)
+    ev["town"] = match.town
+    ev["county"] = match.county
+    return ev
+
+
+def hash_keys(values):
+    """uint64 hashes of registration keys (VIN / ID), compared as text."""
+    return pd.util.hash_array(values.astype(str).to_numpy())
+
+
+def seen_before(seen, hashes):
+    """Boolean array: which `hashes` are in the sorted array `seen`."""
+    if not len(seen):
+        return np.zeros(len(hashes), dtype=bool)
+    pos = np.searchsorted(seen, hashes).clip(max=len(seen) - 1)
+    return seen[pos] == hashes
+
+
+def count_by_county(counts):
+    """Turn a county -> count Series into the `ev_count_by_county` table."""
+    counts = counts[counts > 0]
+    counts.index = pd.Index(counts.index.astype(str))
+    return (
+        counts.rename_axis("county")
+        .reset_index(name="ev_registrations")
+        .sort_values("ev_registrations", ascending=False)
+        .reset_index(drop=True)
+    )
+
+
+def read_registrations(path, gazetteer, chunksize=None, state="CT"):
+    """Load the registration export.
+
+    Returns `(ev_clean, ev_reg, ev_count_by_county)`. `ev_clean` and `ev_reg`
+    are the same frame (it already carries `town` and `county`) so no second
+    copy is held; when streaming it is also projected at parse time.
+    """
+    if not chunksize:
+        with instrument.stage("registrations.parse") as s:
+            ev = normalize_columns(read_csv(path))
+            s.rows = len(ev)
+        with instrument.stage("registrations.clean_text") as s:
+            ev_clean = clean_registrations(ev, state)
+            s.rows = len(ev_clean)
+        with instrument.stage("registrations.dedup") as s:
+            key = _key_column(ev_clean.columns)
+            if key is not None:
+                ev_clean = ev_clean.drop_duplicates(subset=[key])
+            ev_clean = add_ev_category(ev_clean)
+            s.rows = len(ev_clean)
+
+        with instrument.stage("registrations.county_map", rows=len(ev_clean)):
+            ev_reg = add_county(ev_clean, gazetteer)
+            counts = ev_reg["county"].value_counts()
+        return ev_reg, ev_reg, count_by_county(counts)
+
+    with instrument.stage("registrations.stream") as s:
+        frames = _stream_registrations(path, gazetteer, chunksize, state)
+        s.rows = len(frames[1])
+    return frames
+
+
+def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    """Raw registration chunks with only `REGISTRATION_COLUMNS` parsed."""
+    wanted = set(REGISTRATION_COLUMNS)
+    return pd.read_csv(
+        path,
+        usecols=lambda c: normalize_name(c) in wanted,
+        chunksize=chunksize,
+        low_memory=False,
+    )
+
+
+def _stream_registrations(path, gazetteer, chunksize, state):
+    reader = iter_chunks(path, chunksize)
+
+    seen = np.empty(0, dtype=np.uint64)
+    counts = np.zeros(len(gazetteer.counties), dtype=np.int64)
+    parts = []
+    for chunk in reader:
+        ev = clean_registrations(normalize_columns(chunk), state)
+        key = _key_column(ev.columns)
+        if key is not None:
+            # Dedupe within the chunk, then against every key seen so far
+            hashes = hash_keys(ev[key])
+            fresh = ~pd.Series(hashes).duplicated().to_numpy()
+            fresh &= ~seen_before(seen, hashes)
+            ev = ev[fresh]
+            seen = np.union1d(seen, hashes[fresh])
+
+        ev = add_county(add_ev_category(ev), gazetteer)
+        codes = ev["county"].cat.codes.to_numpy()
+        counts += np.bincount(codes[codes >= 0], minlength=len(counts))
+        parts.append(ev)
+
+    if parts:
+        # Chunk categoricals (text, town, county) stay categorical
+        ev_reg = dtypes.concat(parts).reset_index(drop=True)
+    else:
+        ev_reg = pd.DataFrame(columns=list(REGISTRATION_COLUMNS))
+        ev_reg = add_county(add_ev_category(ev_reg), gazetteer)
+    counts = pd.Series(counts, index=gazetteer.counties)
+    return ev_reg, ev_reg, count_by_county(counts)
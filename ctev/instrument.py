@@ -0,0 +1,216 @@
+"""Opt-in per-stage timing and memory instrumentation.
+
+Code marks stages with `with instrument.stage("registrations.parse") as s:`
+and may set `s.rows`. Nothing is recorded unless a `Recorder` is active on
+the current thread (`activate`), so with diagnostics off a stage costs one
+thread-local lookup. Each Streamlit session runs in its own thread, which
+keeps recordings from different sessions apart.
+
+tracemalloc is process-wide, so threads that trace memory share it: it is
+started by the first and stopped by the last, and peaks are only reset while a
+single thread traces. A stage that overlapped tracing on another thread gets
+`peak_mb=None`, as its peak would include that session's allocations.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from ctev import frame_cache
+
+LOG_PATH = Path(
+    os.environ.get("CTEV_DIAGNOSTICS_LOG", frame_cache.CACHE_DIR / "diagnostics.jsonl")
+)
+
+_local = threading.local()
+
+# Open traced stages per thread, and the peak seen before each reset (a stage
+# started at reset i has the peak max(_reset_peaks[i:], current peak))
+_trace_lock = threading.Lock()
+_tracing_threads = {}
+_trace_starts = 0
+_reset_peaks = []
+_owns_trace = False
+
+
+def _start_trace():
+    """Count one more traced stage on this thread; (current bytes, reset
+    index, start count)."""
+    global _trace_starts, _owns_trace
+    with _trace_lock:
+        if not _tracing_threads and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _owns_trace = True
+        tid = threading.get_ident()
+        if tid not in _tracing_threads:
+            _trace_starts += 1
+        _tracing_threads[tid] = _tracing_threads.get(tid, 0) + 1
+        if len(_tracing_threads) == 1:
+            _reset_peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0], len(_reset_peaks), _trace_starts
+
+
+def _stop_trace():
+    """Close one traced stage on this thread; (peak since `start`, shared)."""
+    global _owns_trace
+    with _trace_lock:
+        tid = threading.get_ident()
+        shared = len(_tracing_threads) > 1
+        _tracing_threads[tid] -= 1
+        if not _tracing_threads[tid]:
+            del _tracing_threads[tid]
+        peak = tracemalloc.get_traced_memory()[1]
+        if not _tracing_threads:
+            _reset_peaks.clear()
+            if _owns_trace:
+                tracemalloc.stop()
+                _owns_trace = False
+        return peak, shared
+
+
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+    def __init__(self, recorder, name, rows):
+        self.recorder = recorder
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.recorder._enter(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.recorder._exit(self, seconds)
+        return False
+
+
+class Recorder:
+    """Collects stage records; `memory=True` also traces peak allocations."""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.run_id = uuid.uuid4().hex[:8]
+        self.records = []
+        self._stack = []
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self):
+        """Records of the stages that have completed, in start order."""
+        return [r for r in self.records if r is not None]
+
+    def stage(self, name, rows=None):
+        return _Stage(self, name, rows)
+
+    def _enter(self, st):
+        st.parent = self._stack[-1].name if self._stack else None
+        st.depth = len(self._stack)
+        if self.memory:
+            st.base, st.reset, st.starts = _start_trace()
+        # Reserve the slot now so records stay in start order
+        st.slot = len(self.records)
+        self.records.append(None)
+        self._stack.append(st)
+
+    def _exit(self, st, seconds):
+        self._stack.pop()
+        peak_mb = None
+        if self.memory:
+            with _trace_lock:
+                earlier = max(_reset_peaks[st.reset:], default=0)
+                shared = len(_tracing_threads) > 1 or st.starts != _trace_starts
+            peak, shared_now = _stop_trace()
+            if not (shared or shared_now):
+                peak_mb = (max(peak, earlier) - st.base) / 2**20
+        self.records[st.slot] = {
+            "stage": st.name,
+            "parent": st.parent,
+            "depth": st.depth,
+            "seconds": round(seconds, 6),
+            "peak_mb": None if peak_mb is None else round(peak_mb, 3),
+            "rows": None if st.rows is None else int(st.rows),
+        }
+
+    def adopt(self, records):
+        """Add finished `records` of another recorder (a worker thread's)
+        below the stage currently open here."""
+        with self._lock:
+            parent = self._stack[-1].name if self._stack else None
+            depth = len(self._stack)
+            for rec in records:
+                self.records.append(
+                    dict(
+                        rec,
+                        parent=rec["parent"] or parent,
+                        depth=rec["depth"] + depth,
+                    )
+                )
+
+    def write_log(self, path=LOG_PATH):
+        """Append this run's finished records to a JSON-lines log."""
+        ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            for rec in self.finished:
+                f.write(json.dumps({"ts": ts, "run": self.run_id, **rec}) + "\n")
+
+
+def activate(recorder):
+    """Record this thread's stages into `recorder` (None turns recording off)."""
+    _local.recorder = recorder
+
+
+def active():
+    return getattr(_local, "recorder", None)
+
+
+def in_worker(func):
+    """Wrap `func` to run on a worker thread with its stages recorded.
+
+    The worker records into its own `Recorder` and hands the records to
+    this thread's recorder when `func` returns. It records times only
+    (`peak_mb=None`): tracemalloc cannot tell threads apart, so with memory
+    tracing on the worker's allocations show up in the enclosing stage's peak.
+    """
+    recorder = active()
+    if recorder is None:
+        return func
+
+    def run(*args, **kwargs):
+        worker = Recorder()
+        activate(worker)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            activate(None)
+            recorder.adopt(worker.finished)
+
+    return run
+
+
+def stage(name, rows=None):
+    """Context manager timing one named stage (no-op when nothing is active)."""
+    recorder = getattr(_local, "recorder", None)
+    if recorder is None:
+        return _NULL
+    return recorder.stage(name, rows)
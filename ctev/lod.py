@@ -0,0 +1,121 @@
+"""Level-of-detail grid pyramid for the station map.
+
+Level 0 bins stations into `BASE_CELL_DEG` squares; every further level
+doubles the cell size. Each station's bin at every level is computed once, so
+the bins for any filter (a boolean mask over the stations) are one
+`bincount` per level. The map sends individual stations while they are few
+and otherwise the finest level whose non-empty bins fit the feature budget.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+BASE_CELL_DEG = 0.005  # ~550 m north-south
+N_LEVELS = 12  # coarsest cells ~10 degrees
+DETAIL_THRESHOLD = 2000  # draw stations individually up to this many
+MAX_FEATURES = 2000
+
+KM_PER_DEG = 111.32
+
+MapView = namedtuple("MapView", ["latitude", "longitude", "zoom"])
+
+
+class GridPyramid:
+    def __init__(self, stations, base_cell_deg=BASE_CELL_DEG, n_levels=N_LEVELS):
+        # `stations` needs lat, lon, total_chargers, ev_dc_fast_count and
+        # ev_level2_evse_num (e.g. `pipeline.map_stations`)
+        self.base_cell_deg = base_cell_deg
+        self.lat = stations["lat"].to_numpy(np.float64)
+        self.lon = stations["lon"].to_numpy(np.float64)
+        dc_fast = stations["ev_dc_fast_count"].to_numpy(np.float64)
+        self.weights = {
+            "total_chargers": stations["total_chargers"].to_numpy(np.float64),
+            "dc_fast": dc_fast,
+            "level2": stations["ev_level2_evse_num"].to_numpy(np.float64),
+            "dc_fast_sites": (dc_fast > 0).astype(np.float64),
+        }
+
+        # Level-0 cell of every station; a coarser cell is the finer one
+        # shifted right (floor division by 2 per level, also for negatives)
+        row0 = np.floor(self.lat / base_cell_deg).astype(np.int64)
+        col0 = np.floor(self.lon / base_cell_deg).astype(np.int64)
+
+        # Per level: station -> bin code, and each bin's (row, col) cell
+        self.codes = []
+        self.cells = []
+        for level in range(n_levels):
+            key = ((row0 >> level) << 32) + ((col0 >> level) + 2**31)
+            uniq, codes = np.unique(key, return_inverse=True)
+            self.codes.append(codes.astype(np.int32))
+            self.cells.append(np.stack([uniq >> 32, (uniq & 0xFFFFFFFF) - 2**31], axis=1))
+
+    @property
+    def n_levels(self):
+        return len(self.codes)
+
+    def cell_deg(self, level):
+        return self.base_cell_deg * 2**level
+
+    def _mask(self, mask):
+        if mask is None:
+            return np.ones(len(self.lat), dtype=bool)
+        return np.asarray(mask, dtype=bool)
+
+    def bin_counts(self, mask=None):
+        """Number of non-empty bins at every level."""
+        mask = self._mask(mask)
+        return [
+            int(np.count_nonzero(np.bincount(c[mask], minlength=len(cells))))
+            for c, cells in zip(self.codes, self.cells)
+        ]
+
+    def choose_level(self, mask=None, max_features=MAX_FEATURES):
+        """Finest level whose non-empty bins fit `max_features`."""
+        for level, n in enumerate(self.bin_counts(mask)):
+            if n <= max_features:
+                return level
+        return self.n_levels - 1
+
+    def aggregate(self, level, mask=None):
+        """Non-empty bins at `level`: station-weighted centroid and totals."""
+        mask = self._mask(mask)
+        codes = self.codes[level][mask]
+        n_bins = len(self.cells[level])
+        stations = np.bincount(codes, minlength=n_bins)
+        keep = stations > 0
+
+        out = pd.DataFrame({"stations": stations[keep]})
+        out["lat"] = np.bincount(codes, self.lat[mask], n_bins)[keep] / out["stations"]
+        out["lon"] = np.bincount(codes, self.lon[mask], n_bins)[keep] / out["stations"]
+        for name, w in self.weights.items():
+            out[name] = np.bincount(codes, w[mask], n_bins)[keep].astype(np.int64)
+        out["cell_km"] = self.cell_deg(level) * KM_PER_DEG
+        return out
+
+
+def fit_view(lat, lon, padding=1.2):
+    """Center and zoom that show every point (Web Mercator zoom levels)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if not len(lat):
+        return MapView(41.6, -72.7, 7)
+    span_lat = max(float(lat.max() - lat.min()), 0.01) * padding
+    span_lon = max(float(lon.max() - lon.min()), 0.01) * padding
+    mid_lat = float(lat.min() + lat.max()) / 2
+    # Longitude degrees shrink with latitude
+    span = max(span_lon * math.cos(math.radians(mid_lat)), span_lat)
+    zoom = math.log2(360.0 / span)
+    return MapView(mid_lat, float(lon.min() + lon.max()) / 2, round(min(max(zoom, 2), 13), 1))
+
+
+def map_features(pyramid, mask=None, detail_threshold=DETAIL_THRESHOLD,
+                 max_features=MAX_FEATURES):
+    """`(level, bins)` for the current filter, or `(None, None)` when the
+    stations are few enough to draw individually."""
+    n = int(np.count_nonzero(pyramid._mask(mask)))
+    if n <= detail_threshold:
+        return None, None
+    level = pyramid.choose_level(mask, max_features)
+    return level, pyramid.aggregate(level, mask)
@@ -0,0 +1,343 @@
+"""State partitions of the source files.
+
+Each source is split into `CACHE_DIR/partitions/<key>/<STATE>/<source>.csv`,
+streaming the large files in chunks (through pyarrow's CSV reader and writer
+when it is installed). Loading a state then parses and cleans only its own
+partition, and states nobody selected cost disk but no memory.
+When the registration or station file only grew (see `ctev.refresh`), just
+the appended rows are split and appended to the partitions; any other change
+re-splits that source. Splits are written to a staging directory and moved
+into place with `os.replace`, and a lock file serialises updates across
+processes sharing the cache, so a reader never sees a half-written partition.
+
+Sources with a state column (registrations, the energy profiles, a national
+AFDC station list) are split on it; single-state exports (the HDPulse income
+table, the CT open-data station list) go to the state named in their title or
+to `DEFAULT_STATE`.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from ctev import energy_profiles, frame_cache, ingest, refresh
+from ctev.gazetteer import STATE_NAMES
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - pandas split below
+    pa = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: threads only, see _locked
+    fcntl = None
+
+DEFAULT_STATE = "CT"
+PARTITIONS_DIR = frame_cache.CACHE_DIR / "partitions"
+# Bump when the split logic changes
+PARTITION_VERSION = 2
+CHUNKSIZE = 250_000
+
+# Sources a state needs before it can be selected; health is optional
+REQUIRED_SOURCES = ("ev_reg", "charge", "pop")
+# Plain CSV sources whose appended rows can be split on their own
+APPENDABLE_SOURCES = ("ev_reg", "charge")
+
+_STATE_BY_NAME = {name.upper(): abbr for abbr, name in STATE_NAMES.items()}
+_lock = threading.Lock()
+
+
+def _state_column(columns):
+    for col in columns:
+        if ingest.normalize_name(col) in ("state", "primary_customer_state"):
+            return col
+    return None
+
+
+def _clean_states(values):
+    return values.fillna("").astype(str).str.strip().str.upper()
+
+
+def _split_arrow(source, out_dir, name, state_col, states, header=None, **read):
+    """Arrow version of the splits below: rows are read as text (empty fields
+    stay empty) and written back without a pandas round trip.
+
+    With `header` (raw bytes) the partitions get those lines and no column
+    names; otherwise they start with the CSV header row.
+    """
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(block_size=1 << 24, **read),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={c: pa.string() for c in read.get("column_names", ())},
+            strings_can_be_null=False,
+        ),
+    )
+    for batch in reader:
+        text = batch.column(state_col).cast(pa.string())
+        codes = pc.utf8_upper(pc.utf8_trim_whitespace(text))
+        for state in pc.unique(codes).to_pylist():
+            if not state:
+                continue
+            rows = batch.filter(pc.equal(codes, state))
+            target = out_dir / state / f"{name}.csv"
+            target.parent.mkdir(exist_ok=True)
+            new = state not in states
+            with open(target, "wb" if new and header is not None else "ab") as f:
+                if new and header is not None:
+                    f.write(header)
+                pa_csv.write_csv(
+                    rows,
+                    f,
+                    pa_csv.WriteOptions(
+                        include_header=new and header is None,
+                        quoting_style="needed",
+                    ),
+                )
+            states.add(state)
+    return states
+
+
+def _split_csv(path, out_dir, name, offset=0, existing=()):
+    """Split a plain CSV (from byte `offset` on) on its state column, appending
+    to the partitions of `existing` states; None if it has no state column."""
+    header = pd.read_csv(path, nrows=0).columns
+    state_col = _state_column(header)
+    if state_col is None:
+        return None
+    source = refresh.read_appended(path, offset) if offset else path
+    states = set(existing)
+    if pa is not None:
+        # Raw header names (pandas renames duplicates)
+        with open(path, "rb") as f:
+            names = pa_csv.read_csv(
+                io.BytesIO(f.readline()),
+                read_options=pa_csv.ReadOptions(autogenerate_column_names=True),
+            ).to_pylist()[0]
+        names = [str(n) for n in names.values()]
+        if len(set(names)) == len(names):
+            return _split_arrow(
+                source,
+                out_dir,
+                name,
+                list(header).index(state_col),
+                states,
+                column_names=names,
+                skip_rows=1,
+            )
+    reader = pd.read_csv(
+        source, dtype=str, keep_default_na=False, chunksize=CHUNKSIZE
+    )
+    for chunk in reader:
+        codes = _clean_states(chunk[state_col])
+        for state, rows in chunk.groupby(codes.to_numpy(), sort=False):
+            if not state:
+                continue
+            target = out_dir / state / f"{name}.csv"
+            target.parent.mkdir(exist_ok=True)
+            rows.to_csv(target, mode="a", header=state not in states, index=False)
+            states.add(state)
+    return states
+
+
+def _split_profiles(path, out_dir, name):
+    """Split the energy profiles on `state_abbr`, keeping the header rows."""
+    state_pos = energy_profiles._locate(energy_profiles.read_schema(path), "state_abbr")
+    with open(path, "rb") as f:
+        header = b"".join(f.readline() for _ in range(energy_profiles.HEADER_ROWS))
+    states = set()
+    if pa is not None:
+        width = len(energy_profiles.read_schema(path))
+        return _split_arrow(
+            path,
+            out_dir,
+            name,
+            state_pos,
+            states,
+            header=header,
+            column_names=[f"c{i}" for i in range(width)],
+            skip_rows=energy_profiles.HEADER_ROWS,
+        )
+    reader = pd.read_csv(
+        path,
+        header=None,
+        skiprows=energy_profiles.HEADER_ROWS,
+        dtype=str,
+        keep_default_na=False,
+        encoding=energy_profiles.ENCODING,
+        chunksize=CHUNKSIZE,
+    )
+    for chunk in reader:
+        codes = _clean_states(chunk[state_pos])
+        for state, rows in chunk.groupby(codes.to_numpy(), sort=False):
+            if not state:
+                continue
+            target = out_dir / state / f"{name}.csv"
+            target.parent.mkdir(exist_ok=True)
+            if state not in states:
+                target.write_bytes(header)
+            rows.to_csv(target, mode="a", header=False, index=False)
+            states.add(state)
+    return states
+
+
+def title_state(path):
+    """State named in an HDPulse-style title ("... for Connecticut by County")."""
+    with open(path, encoding="utf-8-sig") as f:
+        title = f.readline()
+    match = re.search(r"\bfor (.+?) by County", title)
+    if match:
+        return _STATE_BY_NAME.get(match.group(1).strip().upper())
+    return None
+
+
+def _copy_whole(path, out_dir, name, state, offset=0):
+    target = out_dir / state / f"{name}.csv"
+    target.parent.mkdir(exist_ok=True)
+    if offset:
+        # Header-less tail of a single-state file
+        with open(path, "rb") as src, open(target, "ab") as dst:
+            src.seek(offset)
+            shutil.copyfileobj(src, dst)
+    else:
+        shutil.copyfile(path, target)
+    return {state}
+
+
+def split_source(name, path, out_dir, offset=0, existing=()):
+    """Write (or, from `offset`, extend) one source's state partitions under
+    `out_dir`; returns the set of states it covers."""
+    out_dir = Path(out_dir)
+    if name == "pop":
+        return _split_profiles(path, out_dir, name)
+    if name == "health":
+        return _copy_whole(path, out_dir, name, title_state(path) or DEFAULT_STATE)
+    states = _split_csv(path, out_dir, name, offset, existing)
+    if states is None:
+        states = _copy_whole(path, out_dir, name, DEFAULT_STATE, offset)
+    return states
+
+
+def _partition_key(paths):
+    # One directory per set of source locations; their contents are tracked
+    # in its manifest
+    payload = json.dumps(
+        {
+            "version": PARTITION_VERSION,
+            "paths": {k: str(Path(p).resolve()) for k, p in paths.items()},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+@contextmanager
+def _locked(root):
+    """Hold the partition lock of `root` across threads and processes."""
+    with _lock:
+        if fcntl is None:
+            yield
+            return
+        root.mkdir(parents=True, exist_ok=True)
+        with open(root / ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _update_source(entry, name, path, digest, old):
+    """Bring `name`'s partitions up to date; returns its manifest record.
+
+    The split runs in a staging directory (an append on copies of the current
+    partitions) whose files then replace the live ones one by one.
+    """
+    offset = None
+    old_states = (old or {}).get("states", [])
+    if old and name in APPENDABLE_SOURCES:
+        offset = refresh.appended_offset(path, old["fingerprint"])
+    staging = Path(tempfile.mkdtemp(prefix=f".{name}-", dir=entry))
+    try:
+        if offset is not None:
+            for state in old_states:
+                (staging / state).mkdir()
+                live = entry / state / f"{name}.csv"
+                shutil.copyfile(live, staging / state / live.name)
+            states = split_source(name, path, staging, offset, old_states)
+        else:
+            states = split_source(name, path, staging)
+        for state in states:
+            (entry / state).mkdir(exist_ok=True)
+            os.replace(staging / state / f"{name}.csv", entry / state / f"{name}.csv")
+        for state in set(old_states) - set(states):
+            (entry / state / f"{name}.csv").unlink(missing_ok=True)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return {
+        "digest": digest,
+        "fingerprint": refresh.fingerprint(path),
+        "states": sorted(states),
+    }
+
+
+def partition(paths, root=None):
+    """Manifest {state: {source: path}}, splitting new or changed sources."""
+    root = Path(root or PARTITIONS_DIR)
+    with _locked(root):
+        entry = root / _partition_key(paths)
+        manifest_path = entry / "manifest.json"
+        try:
+            sources = json.loads(manifest_path.read_text())["sources"]
+        except (OSError, ValueError, KeyError):
+            sources = {}
+
+        digests = frame_cache.source_digests(paths)
+        updated = dict(sources)
+        for name, path in paths.items():
+            old = sources.get(name)
+            if digests[name] is None:
+                updated.pop(name, None)
+            elif not old or old["digest"] != digests[name]:
+                entry.mkdir(parents=True, exist_ok=True)
+                updated[name] = _update_source(entry, name, path, digests[name], old)
+
+        if updated != sources or not manifest_path.exists():
+            entry.mkdir(parents=True, exist_ok=True)
+            tmp = entry / "manifest.json.tmp"
+            tmp.write_text(json.dumps({"sources": updated}, indent=2, sort_keys=True))
+            os.replace(tmp, manifest_path)
+            frame_cache.prune(root, keep=2)
+
+    manifest = {}
+    for name, record in updated.items():
+        for state in record["states"]:
+            manifest.setdefault(state, {})[name] = entry / state / f"{name}.csv"
+    return manifest
+
+
+def complete_states(manifest):
+    """States that have every `REQUIRED_SOURCES` partition."""
+    return sorted(
+        s for s, sources in manifest.items() if set(REQUIRED_SOURCES) <= set(sources)
+    )
+
+
+def state_paths(paths, state, root=None):
+    """Source paths for `state`: its partitions, or the raw files (filtered by
+    state at load time) when the on-disk cache is disabled."""
+    if not frame_cache.CACHE_ENABLED:
+        return dict(paths)
+    sources = partition(paths, root).get(state.upper(), {})
+    return {name: sources.get(name) for name in paths}
@@ -0,0 +1,683 @@
+"""Source loading and cleaning shared by the Streamlit app and the CLI.
+
+Every stage is a plain function of file paths and DataFrames, so the whole
+pipeline runs headless (`python -m ctev`) and the app only wraps
+`load_and_clean_data` in its own cache. Everything is per state: the sources
+are split into state partitions (`ctev.partitions`) and a state's frames are
+cleaned from its partition with its own gazetteer. When a state's
+registration or station partition only grew since its last cached frames,
+the appended rows are cleaned on their own and added to those frames and to
+the county aggregates (`refresh_frames`).
+"""
+import io
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ctev import dtypes, energy_profiles, frame_cache, ingest, instrument, partitions
+from ctev import refresh, sqlstore, textnorm
+from ctev.gazetteer import CT_GAZETTEER, for_state
+from ctev.gazetteer import available_states as gazetteer_states
+from ctev.partitions import DEFAULT_STATE
+
+# Repository root: where app.py and all CSVs live
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+HEALTH_PATH = BASE_DIR / "HDPulse_data_export.csv"
+EV_REG_PATH = BASE_DIR / "Electric_Vehicle_Registration_Data.csv"
+CHARGE_PATH = BASE_DIR / "Electric_Vehicle_Charging_Stations.csv"
+POP_PATH = BASE_DIR / "2016cityandcountyenergyprofiles.csv"
+
+SOURCE_PATHS = {
+    "health": HEALTH_PATH,
+    "ev_reg": EV_REG_PATH,
+    "charge": CHARGE_PATH,
+    "pop": POP_PATH,
+}
+
+# Bump whenever the cleaning logic changes so stale on-disk caches are ignored
+PIPELINE_VERSION = 12
+# Cached frame sets kept on disk (a few source versions of several states)
+CACHE_KEEP = 12
+# Threads parsing independent sources on a cold load (1 = sequential)
+LOAD_WORKERS = int(os.environ.get("CTEV_LOAD_WORKERS", min(4, os.cpu_count() or 1)))
+FRAME_NAMES = ("ev_clean", "ch", "health", "county_full", "ev_reg")
+# ev_clean is the same frame as ev_reg, so it is cached once; key_hashes (the
+# sorted hashes of every registration key) de-duplicates appended rows
+LOADED_FRAMES = ("ch", "health", "county_full", "ev_reg")
+CACHED_FRAMES = LOADED_FRAMES + ("key_hashes", "memory_report")
+
+# Station columns the map layer, its tooltip and the station table read
+MAP_COLUMNS = [
+    "station_name",
+    "city",
+    "county",
+    "total_chargers",
+    "ev_dc_fast_count",
+    "ev_level2_evse_num",
+    "ev_level1_evse_num",
+    "lat",
+    "lon",
+]
+
+# County columns that are sums over stations
+STATION_COUNT_COLUMNS = [
+    "total_stations",
+    "total_chargers",
+    "fast_chargers",
+    "level2_chargers",
+    "level1_chargers",
+]
+
+GAP_COLUMNS = [
+    "county",
+    "ev_registrations",
+    "total_chargers",
+    "evs_per_charger",
+    "evs_per_1k_people",
+    "chargers_per_1k_people",
+]
+
+
+HEALTH_COLUMNS = ["county", "fips", "median_income", "us_rank"]
+
+
+def load_health(path, state=DEFAULT_STATE):
+    """Median household income per county from the HDPulse export.
+
+    The export is per state; without one for `state` the table is empty.
+    """
+    if path is None or not Path(path).exists():
+        return pd.DataFrame(columns=HEALTH_COLUMNS).astype({"median_income": float})
+    # The table sits between a 4-line title and free-text notes; hand only
+    # those lines to the C parser (the notes have ragged rows)
+    with open(path, encoding="utf-8-sig") as f:
+        lines = f.readlines()[4:]
+    end = next((i for i, line in enumerate(lines) if not line.strip()), len(lines))
+    health_raw = pd.read_csv(io.StringIO("".join(lines[:end])))
+    health_raw.columns = health_raw.columns.str.strip()
+    health = health_raw.rename(
+        columns={
+            "County": "county",
+            "FIPS": "fips",
+            "Value (Dollars)": "median_income",
+            "Rank within US (of 3141 counties)": "us_rank",
+        }
+    )
+    health["county"] = (
+        health["county"]
+        .astype(str)
+        .str.replace(" County", "", regex=False)
+        .str.strip()
+    )
+    # Values are quoted with thousands separators ("114,462")
+    income = energy_profiles.to_number(health["median_income"])
+    health["median_income"] = income.astype(float)
+    health["us_rank"] = pd.to_numeric(health["us_rank"], errors="coerce")
+
+    # If state column exists, keep the requested state only
+    if "State Abbreviation" in health_raw.columns:
+        health["state"] = health_raw["State Abbreviation"].str.strip()
+        health = health[health["state"] == state]
+    return health
+
+
+def load_registrations(path, gazetteer=CT_GAZETTEER, state=DEFAULT_STATE):
+    """(ev_clean, ev_reg, ev_count_by_county); large exports are streamed."""
+    return ingest.read_registrations(
+        path,
+        gazetteer,
+        chunksize=ingest.streaming_chunksize(path),
+        state=state,
+    )
+
+
+def load_stations(path, gazetteer=CT_GAZETTEER, state=DEFAULT_STATE):
+    """Charging stations with charger counts, coordinates, town and county."""
+    ch = ingest.read_csv(path)
+    ch.columns = (
+        ch.columns.str.lower()
+        .str.replace(" ", "_")
+        .str.replace(r"[^a-z0-9_]", "", regex=True)
+    )
+    # National station lists carry a state column
+    if "state" in ch.columns:
+        ch = ch[textnorm.unique_mask(ch["state"], lambda s: str(s).strip().upper() == state)].copy()
+
+    if "city" in ch.columns:
+        ch["city"] = textnorm.normalize_column(ch["city"], "city")
+
+    # Charger counts
+    for col in ["ev_level1_evse_num", "ev_level2_evse_num", "ev_dc_fast_count"]:
+        if col in ch.columns:
+            ch[col] = pd.to_numeric(ch[col], errors="coerce").fillna(0).astype(int)
+        else:
+            ch[col] = 0
+
+    ch["total_chargers"] = (
+        ch.get("ev_level1_evse_num", 0)
+        + ch.get("ev_level2_evse_num", 0)
+        + ch.get("ev_dc_fast_count", 0)
+    )
+    ch["charger_flags"] = dtypes.pack_flags(
+        ch["ev_dc_fast_count"], ch["ev_level2_evse_num"], ch["ev_level1_evse_num"]
+    )
+
+    # Location columns
+    if {"longitude", "latitude"}.issubset(ch.columns):
+        ch["lon"] = ch["longitude"]
+        ch["lat"] = ch["latitude"]
+    elif {"lng", "lat"}.issubset(ch.columns):
+        # already fine
+        pass
+    elif "new_georeferenced_column" in ch.columns:
+        # WKT-like POINT (lon lat) column in the CT open data export
+        coords = ch["new_georeferenced_column"].astype(str).str.extract(
+            r"POINT\s*\(([-\d\.]+)\s+([-\d\.]+)\)"
+        )
+        ch["lon"] = pd.to_numeric(coords[0], errors="coerce")
+        ch["lat"] = pd.to_numeric(coords[1], errors="coerce")
+
+    # Map city → town → county
+    ch_match = gazetteer.resolve(ch.get("city", pd.Series("", index=ch.index)))
+    ch["town"] = ch_match.town
+    ch["county"] = ch_match.county
+    return ch
+
+
+def load_population(path, states=(DEFAULT_STATE,)):
+    """County population and electricity use from the 2016 energy profiles."""
+    county = energy_profiles.read_profiles(
+        path,
+        {
+            "county": "county_name",
+            "population_2016": "population",
+            **energy_profiles.ELECTRICITY_FIELDS,
+        },
+        states=list(states),
+    )
+    county["county"] = (
+        county["county"].str.replace(" County", "", regex=False).str.strip()
+    )
+    return county
+
+
+def station_summary(ch, by="county"):
+    """Stations and chargers per county (or town)."""
+    parts = pd.DataFrame(
+        {
+            by: ch[by],
+            "station": ch["station_name"] if "station_name" in ch.columns else ch["city"],
+            "total_chargers": ch["total_chargers"],
+            "fast": dtypes.has_flag(ch, dtypes.FLAG_DC_FAST),
+            "level2": dtypes.has_flag(ch, dtypes.FLAG_LEVEL2),
+            "level1": dtypes.has_flag(ch, dtypes.FLAG_LEVEL1),
+        }
+    )
+    summary = (
+        parts.groupby(by, observed=True)
+        .agg(
+            total_stations=("station", "count"),
+            total_chargers=("total_chargers", "sum"),
+            fast_chargers=("fast", "sum"),
+            level2_chargers=("level2", "sum"),
+            level1_chargers=("level1", "sum"),
+        )
+        .reset_index()
+    )
+    summary[by] = summary[by].astype(str)
+    return summary
+
+
+def build_county_table(ev_count_by_county, ch, health, population):
+    """One row per county: EVs, chargers, income, population and energy use."""
+    county_full = (
+        ev_count_by_county
+        .merge(station_summary(ch), on="county", how="outer")
+        .merge(health[["county", "median_income"]], on="county", how="left")
+    )
+
+    # Merge population and electricity use into county_full
+    county_full = county_full.merge(population, on="county", how="left")
+    return add_ratios(county_full)
+
+
+def add_ratios(county_full):
+    """(Re)compute EVs per charger and the per-capita metrics in place."""
+    county_full["evs_per_charger"] = (
+        county_full["ev_registrations"]
+        / county_full["total_chargers"].replace({0: np.nan})
+    )
+
+    # Per-capita metrics
+    county_full["evs_per_1k_people"] = (
+        county_full["ev_registrations"]
+        / (county_full["population_2016"] / 1000.0)
+    )
+    county_full["chargers_per_1k_people"] = (
+        county_full["total_chargers"]
+        / (county_full["population_2016"] / 1000.0)
+    )
+    return county_full
+
+
+def _load_stage(name, load, *args):
+    with instrument.stage(f"{name}.load") as s:
+        out = load(*args)
+        # Registrations come back as (ev_clean, ev_reg, counts)
+        s.rows = len(out[1] if isinstance(out, tuple) else out)
+    return out
+
+
+def load_concurrently(tasks, workers=None):
+    """Run independent loaders ({name: (func, *args)}) on a thread pool.
+
+    The CSV parsers spend most of their time outside the GIL, so the sources
+    parse side by side; `LOAD_WORKERS=1` runs them one after another.
+    """
+    workers = LOAD_WORKERS if workers is None else workers
+    if workers <= 1:
+        return {name: _load_stage(name, *task) for name, task in tasks.items()}
+    with ThreadPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = {
+            name: pool.submit(instrument.in_worker(_load_stage), name, *task)
+            for name, task in tasks.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def clean_sources(paths=SOURCE_PATHS, state=DEFAULT_STATE):
+    """Run every cleaning stage for `state`; returns a dict of the
+    `CACHED_FRAMES`."""
+    missing = [n for n in partitions.REQUIRED_SOURCES if paths.get(n) is None]
+    if missing:
+        raise KeyError(f"no {', '.join(missing)} data for state {state!r}")
+    towns = for_state(state)
+    with instrument.stage("sources.load"):
+        loaded = load_concurrently(
+            {
+                "health": (load_health, paths["health"], state),
+                "registrations": (load_registrations, paths["ev_reg"], towns, state),
+                "stations": (load_stations, paths["charge"], towns, state),
+                "population": (load_population, paths["pop"], (state,)),
+            }
+        )
+    health, population = loaded["health"], loaded["population"]
+    ev_clean, ev_reg, ev_count_by_county = loaded["registrations"]
+    ch = loaded["stations"]
+    with instrument.stage("frames.compact"):
+        compact = {
+            "ev_reg": dtypes.apply_plan(ev_reg, dtypes.REGISTRATION_PLAN),
+            "ch": dtypes.apply_plan(ch, dtypes.STATION_PLAN),
+        }
+        report = dtypes.memory_report({"ev_reg": ev_reg, "ch": ch}, compact)
+        ev_reg, ch = compact["ev_reg"], compact["ch"]
+    with instrument.stage("county.merge") as s:
+        county_full = build_county_table(ev_count_by_county, ch, health, population)
+        s.rows = len(county_full)
+    return {
+        "ch": ch,
+        "health": health,
+        "county_full": county_full,
+        "ev_reg": ev_reg,
+        "key_hashes": _key_hashes(ev_reg),
+        "memory_report": report,
+    }
+
+
+def _key_hashes(ev_reg):
+    key = ingest._key_column(ev_reg.columns)
+    hashes = ingest.hash_keys(ev_reg[key]) if key else np.empty(0, np.uint64)
+    return pd.DataFrame({"hash": np.unique(hashes)})
+
+
+def _add_to_counties(county_full, deltas):
+    """Add per-county `deltas` (county-indexed frame) to `county_full`'s
+    count columns in place; False when a county is not in the table."""
+    deltas = deltas[(deltas > 0).any(axis=1)]
+    pos = pd.Index(county_full["county"]).get_indexer(deltas.index.astype(str))
+    if (pos < 0).any():
+        return False
+    for col in deltas.columns:
+        values = county_full[col].to_numpy(dtype=np.float64, copy=True)
+        values[pos] = np.nan_to_num(values[pos]) + deltas[col].to_numpy()
+        if county_full[col].dtype.kind in "iu" and not np.isnan(values).any():
+            values = values.astype(county_full[col].dtype)
+        county_full[col] = values
+    return True
+
+
+def refresh_frames(frames, paths, state, offsets):
+    """Apply the rows appended to `state`'s registration / station partitions
+    after byte `offsets` to its previously cleaned `frames`.
+
+    Only the new rows are parsed, cleaned and aggregated. Returns the updated
+    frames, or None when the delta needs a full rebuild (a county the county
+    table does not have yet).
+    """
+    towns = for_state(state)
+    frames = dict(frames)
+    county_full = frames["county_full"].copy()
+
+    if "ev_reg" in offsets:
+        with instrument.stage("registrations.delta") as s:
+            new = ingest.read_registrations(
+                refresh.read_appended(paths["ev_reg"], offsets["ev_reg"]),
+                towns,
+                state=state,
+            )[1]
+            seen = frames["key_hashes"]["hash"].to_numpy()
+            key = ingest._key_column(new.columns)
+            if key is not None:
+                hashes = ingest.hash_keys(new[key])
+                fresh = ~ingest.seen_before(seen, hashes)
+                new = new[fresh]
+                seen = np.union1d(seen, hashes[fresh])
+            s.rows = len(new)
+
+            counts = new["county"].value_counts().to_frame("ev_registrations")
+            if not _add_to_counties(county_full, counts):
+                return None
+            old = frames["ev_reg"]
+            new = dtypes.apply_plan(new, dtypes.REGISTRATION_PLAN)
+            new.index = new.index + (int(old.index.max()) + 1 if len(old) else 0)
+            frames["ev_reg"] = dtypes.concat([old, new])
+            frames["key_hashes"] = pd.DataFrame({"hash": seen})
+
+    if "charge" in offsets:
+        with instrument.stage("stations.delta") as s:
+            new = load_stations(
+                refresh.read_appended(paths["charge"], offsets["charge"]), towns, state
+            )
+            s.rows = len(new)
+            summary = station_summary(new).set_index("county")[STATION_COUNT_COLUMNS]
+            if not _add_to_counties(county_full, summary):
+                return None
+            old = frames["ch"]
+            new = dtypes.apply_plan(new, dtypes.STATION_PLAN)
+            new.index = new.index + len(old)
+            frames["ch"] = dtypes.concat([old, new])
+
+    frames["county_full"] = add_ratios(county_full)
+    return frames
+
+
+def available_states(paths=SOURCE_PATHS):
+    """States with a gazetteer and registration, station and energy-profile
+    partitions (splits the sources on first use)."""
+    if not frame_cache.CACHE_ENABLED:
+        return [DEFAULT_STATE]
+    with instrument.stage("sources.partition"):
+        manifest = partitions.partition(paths)
+    return [
+        s for s in partitions.complete_states(manifest)
+        if s in gazetteer_states()
+    ]
+
+
+def source_stamp(paths=SOURCE_PATHS):
+    """(size, mtime) of every source file: a cheap check, meant to be polled,
+    of whether `load_and_clean_data` might return something new."""
+    stamp = {}
+    for name, path in paths.items():
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            stamp[name] = None
+        else:
+            stamp[name] = (stat.st_size, stat.st_mtime_ns)
+    return stamp
+
+
+def _cache_key(paths, state):
+    streaming = bool(paths["ev_reg"] and ingest.streaming_chunksize(paths["ev_reg"]))
+    return frame_cache.cache_key(paths, [PIPELINE_VERSION, streaming, state])
+
+
+def _fingerprints(paths):
+    return {
+        name: refresh.fingerprint(path)
+        for name, path in paths.items()
+        if path is not None and Path(path).exists()
+    }
+
+
+def _appended_offsets(paths, meta):
+    """{source: offset} for sources that only grew since the cached entry
+    described by `meta`; None when anything else changed."""
+    if meta.get("version") != PIPELINE_VERSION:
+        return None
+    old = meta.get("fingerprints", {})
+    if set(old) != {n for n, p in paths.items() if p is not None}:
+        return None
+    offsets = {}
+    for name, fingerprint in old.items():
+        offset = refresh.appended_offset(paths[name], fingerprint)
+        if offset is None:
+            return None
+        if offset < Path(paths[name]).stat().st_size:
+            if name not in partitions.APPENDABLE_SOURCES:
+                return None
+            offsets[name] = offset
+    return offsets
+
+
+def _refresh_latest(paths, state):
+    """`state`'s newest cached frames with appended rows applied, or None."""
+    prev = frame_cache.latest(state)
+    if prev is None:
+        return None
+    offsets = _appended_offsets(paths, frame_cache.load_meta(prev))
+    if not offsets:
+        return None
+    frames = frame_cache.load(prev, CACHED_FRAMES)
+    if frames is None:
+        return None
+    return refresh_frames(dict(zip(CACHED_FRAMES, frames)), paths, state, offsets)
+
+
+def _load_frames(paths, state, names=CACHED_FRAMES):
+    with instrument.stage("sources.partition"):
+        paths = partitions.state_paths(paths, state)
+    with instrument.stage("cache.load"):
+        key = _cache_key(paths, state)
+        frames = frame_cache.load(key, names)
+    if frames is not None:
+        return dict(zip(names, frames))
+
+    before = _fingerprints(paths)
+    with instrument.stage("sources.refresh"):
+        frames = _refresh_latest(paths, state)
+    if frames is None:
+        with instrument.stage("sources.clean"):
+            frames = clean_sources(paths, state)
+    meta = {"version": PIPELINE_VERSION}
+    if _fingerprints(paths) == before:
+        # Only record what the frames were built from if nothing moved meanwhile
+        meta["fingerprints"] = before
+    with instrument.stage("cache.store"):
+        frame_cache.store(key, frames, keep=CACHE_KEEP, meta=meta, tag=state)
+    return frames
+
+
+def data_version(paths=SOURCE_PATHS, state=DEFAULT_STATE):
+    """Identifier of `state`'s current source partitions + cleaning logic."""
+    return _cache_key(partitions.state_paths(paths, state), state)
+
+
+def load_and_clean_data(paths=SOURCE_PATHS, state=DEFAULT_STATE):
+    """`state`'s frames in `FRAME_NAMES` order, reusing the on-disk columnar
+    cache when no source changed."""
+    f = _load_frames(paths, state, LOADED_FRAMES)
+    return f["ev_reg"], f["ch"], f["health"], f["county_full"], f["ev_reg"]
+
+
+def memory_report(paths=SOURCE_PATHS, state=DEFAULT_STATE):
+    """Bytes per frame before/after the dtype plan (see `ctev.dtypes`)."""
+    return _load_frames(paths, state, ("memory_report",))["memory_report"]
+
+
+# ---------------------------------------------------------------
+# SQLite backend
+# ---------------------------------------------------------------
+BACKENDS = ("memory", "sqlite")
+BACKEND = os.environ.get("CTEV_BACKEND", "memory")
+SQL_DIR = frame_cache.CACHE_DIR / "sql"
+
+
+def build_sql_store(db_path, paths=SOURCE_PATHS, state=DEFAULT_STATE,
+                    chunksize=ingest.DEFAULT_CHUNKSIZE):
+    """Clean `state`'s sources into the SQLite file `db_path`.
+
+    Registrations are streamed through the same cleaning steps chunk by
+    chunk and never held in memory as a whole; the county counts come from
+    the database.
+    """
+    towns = for_state(state)
+    con = sqlstore.connect_for_build(db_path)
+    try:
+        with instrument.stage("registrations.load") as s:
+            writer = None
+            for chunk in ingest.iter_chunks(paths["ev_reg"], chunksize):
+                ev = ingest.clean_registrations(ingest.normalize_columns(chunk), state)
+                if writer is None:
+                    writer = sqlstore.RegistrationWriter(con, ingest._key_column(ev.columns))
+                writer.write(ingest.add_county(ingest.add_ev_category(ev), towns))
+            writer = writer or sqlstore.RegistrationWriter(con)
+            writer.close()
+            s.rows = writer.rows
+        with instrument.stage("sources.load"):
+            loaded = load_concurrently(
+                {
+                    "health": (load_health, paths["health"], state),
+                    "stations": (load_stations, paths["charge"], towns, state),
+                    "population": (load_population, paths["pop"], (state,)),
+                }
+            )
+        health, population = loaded["health"], loaded["population"]
+        ch = dtypes.apply_plan(loaded["stations"], dtypes.STATION_PLAN)
+        with instrument.stage("county.merge") as s:
+            counts = ingest.count_by_county(sqlstore.county_counts(con))
+            county_full = build_county_table(counts, ch, health, population)
+            s.rows = len(county_full)
+        with instrument.stage("sql.write"):
+            sqlstore.write_table(con, "stations", ch)
+            sqlstore.write_table(con, "health", health)
+            sqlstore.write_table(con, "counties", county_full)
+            sqlstore.create_indexes(con)
+    finally:
+        con.close()
+
+
+def sql_store(paths=SOURCE_PATHS, state=DEFAULT_STATE, keep=2):
+    """`SqlStore` over `state`'s database, (re)built when a source changed."""
+    with instrument.stage("sources.partition"):
+        paths = partitions.state_paths(paths, state)
+    db_path = SQL_DIR / f"{state}-{_cache_key(paths, state)}.sqlite"
+    if not db_path.exists():
+        SQL_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{state}-", suffix=".sqlite", dir=SQL_DIR)
+        os.close(fd)
+        try:
+            with instrument.stage("sql.build"):
+                build_sql_store(tmp, paths, state)
+            os.replace(tmp, db_path)
+        finally:
+            Path(tmp).unlink(missing_ok=True)
+        stale = sorted(SQL_DIR.glob(f"{state}-*.sqlite"), key=os.path.getmtime)
+        for old in stale[:-keep]:
+            old.unlink(missing_ok=True)
+    return sqlstore.SqlStore(db_path)
+
+
+# ---------------------------------------------------------------
+# Derived tables
+# ---------------------------------------------------------------
+def gap_table(county_full):
+    """Counties ranked by EVs per public charger (largest gap first)."""
+    return (
+        county_full.dropna(subset=["evs_per_charger"])
+        .loc[:, [c for c in GAP_COLUMNS if c in county_full.columns]]
+        .sort_values("evs_per_charger", ascending=False)
+    )
+
+
+def town_table(ev_reg, ch, gazetteer=CT_GAZETTEER):
+    """One row per town: county, EV registrations, stations and chargers."""
+    towns = gazetteer.table[["town", "county"]].copy()
+    ev_counts = ev_reg["town"].value_counts()
+    towns["ev_registrations"] = (
+        towns["town"].map(ev_counts).fillna(0).astype("int64")
+    )
+    towns = towns.merge(
+        station_summary(ch, by="town").drop(columns="county", errors="ignore"),
+        on="town",
+        how="left",
+    )
+    towns[STATION_COUNT_COLUMNS] = towns[STATION_COUNT_COLUMNS].fillna(0).astype("int64")
+    towns["evs_per_charger"] = (
+        towns["ev_registrations"] / towns["total_chargers"].replace({0: np.nan})
+    )
+    return towns
+
+
+def map_stations(ch, min_chargers=1):
+    """Stations with valid coordinates and at least `min_chargers` chargers.
+
+    Only `MAP_COLUMNS` are materialized; the packed charger flags are
+    expanded into 0/1 `has_*` columns for the deck layer's colour expression.
+    """
+    mask = ch["lat"].notna() & ch["lon"].notna()
+    mask &= ch["total_chargers"] >= min_chargers
+    mask = mask.to_numpy()
+    flags = ch["charger_flags"].to_numpy()[mask]
+    out = ch.loc[mask, [c for c in MAP_COLUMNS if c in ch.columns]]
+    return out.assign(
+        **{
+            name: ((flags & flag) > 0).astype(np.uint8)
+            for name, flag in dtypes.CHARGER_FLAGS.items()
+        }
+    )
+
+
+# ---------------------------------------------------------------
+# Batch export
+# ---------------------------------------------------------------
+EXPORT_FORMATS = ("csv", "parquet")
+
+
+def run(out_dir, paths=SOURCE_PATHS, fmt="csv", min_chargers=1, state=DEFAULT_STATE):
+    """Run the pipeline for `state` and write the derived tables to `out_dir`.
+
+    Returns a dict of table name -> written file path.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format: {fmt!r}")
+    ev_clean, ch, health, county_full, ev_reg = load_and_clean_data(paths, state)
+    with instrument.stage("tables.build"):
+        tables = {
+            "county_summary": county_full,
+            "town_summary": town_table(ev_reg, ch, for_state(state)),
+            "gap_ranking": gap_table(county_full),
+            "map_stations": map_stations(ch, min_chargers),
+        }
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = {}
+    for name, df in tables.items():
+        with instrument.stage(f"export.{name}", rows=len(df)):
+            _write_table(df, out_dir / f"{name}.{fmt}", fmt)
+        written[name] = out_dir / f"{name}.{fmt}"
+    return written
+
+
+def _write_table(df, path, fmt):
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
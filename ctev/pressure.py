@@ -0,0 +1,169 @@
+"""Town-level Charger Pressure Index (EVs per public charger).
+
+`TownPressure` lines the town registration cube up with per-town charger
+counts. EV counts for any (EV type, year range) come from cumulative sums
+along the year axis, so a filter change costs one subtraction per town, and
+`top_k` picks the most underserved towns with `np.partition` before
+sorting only those k rows.
+
+Chargers can be counted as ports or weighted by charging capacity, so a DC
+fast port counts for more than a Level 2 port.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+ChargerWeights = namedtuple("ChargerWeights", ["dc_fast", "level2", "level1"])
+
+# "capacity" is in Level 2 equivalents: ~50 kW DC fast and ~1.4 kW Level 1
+# against a 7.2 kW Level 2 port
+CHARGER_WEIGHTS = {
+    "ports": ChargerWeights(1.0, 1.0, 1.0),
+    "capacity": ChargerWeights(7.0, 1.0, 0.2),
+}
+
+PRESSURE_COLUMNS = [
+    "town",
+    "county",
+    "ev_registrations",
+    "total_chargers",
+    "fast_chargers",
+    "level2_chargers",
+    "level1_chargers",
+    "charger_capacity",
+    "evs_per_charger",
+]
+
+_PORT_COLUMNS = {
+    "fast_chargers": "ev_dc_fast_count",
+    "level2_chargers": "ev_level2_evse_num",
+    "level1_chargers": "ev_level1_evse_num",
+}
+
+
+class TownPressure:
+    def __init__(self, cube, ch, towns):
+        """`cube` is an `EvCube` grouped by town, `ch` the station frame and
+        `towns` the gazetteer table (`town`, `county`)."""
+        self.towns = towns[["town", "county"]].reset_index(drop=True)
+        town_index = pd.Index(self.towns["town"])
+        self.categories = list(cube.categories)
+        self.first_year = cube.first_year
+
+        # (towns, categories + all, years + 1) cumulative registrations; towns
+        # without registrations keep zeros
+        counts = cube.dense_counts()[:-1]
+        pos = town_index.get_indexer(cube.groups)
+        known = pos >= 0
+        n_years = counts.shape[2]
+        prefix = np.zeros(
+            (len(town_index), len(self.categories) + 1, n_years + 1), dtype=np.int64
+        )
+        prefix[pos[known], :-1, 1:] = np.cumsum(counts[known], axis=2)
+        prefix[:, -1] = prefix[:, :-1].sum(axis=1)
+        self._prefix = prefix
+        self._cat_pos = {c: i for i, c in enumerate(self.categories)}
+        county_codes, counties = pd.factorize(self.towns["county"])
+        self._county_codes = county_codes
+        self._county_pos = {c: i for i, c in enumerate(counties)}
+        self._capacity = {}
+
+        # Ports per town and charger type
+        station_pos = town_index.get_indexer(ch["town"].astype(object))
+        on_town = station_pos >= 0
+        self.ports = pd.DataFrame(
+            {
+                name: np.bincount(
+                    station_pos[on_town],
+                    ch[col].to_numpy(dtype=np.float64)[on_town],
+                    minlength=len(town_index),
+                ).astype(np.int64)
+                for name, col in _PORT_COLUMNS.items()
+            }
+        )
+        self.ports.insert(0, "total_chargers", self.ports.sum(axis=1))
+
+    def capacity(self, weights="ports"):
+        """Weighted charger count per town (`weights`: a `CHARGER_WEIGHTS`
+        name or a `ChargerWeights`)."""
+        if isinstance(weights, str):
+            weights = CHARGER_WEIGHTS[weights]
+        if weights not in self._capacity:
+            self._capacity[weights] = (
+                weights.dc_fast * self.ports["fast_chargers"].to_numpy()
+                + weights.level2 * self.ports["level2_chargers"].to_numpy()
+                + weights.level1 * self.ports["level1_chargers"].to_numpy()
+            )
+        return self._capacity[weights]
+
+    def ev_counts(self, category=None, years=None):
+        """Registrations per town for an EV type (None = all) and year range."""
+        if category is None:
+            p = self._prefix[:, -1]
+        elif category in self._cat_pos:
+            p = self._prefix[:, self._cat_pos[category]]
+        else:
+            return np.zeros(len(self.towns), dtype=np.int64)
+        n_years = p.shape[1] - 1
+        lo, hi = 0, n_years
+        if years is not None and self.first_year is not None:
+            lo = min(max(int(years[0]) - self.first_year, 0), n_years)
+            hi = min(max(int(years[1]) - self.first_year + 1, lo), n_years)
+        return p[:, hi] - p[:, lo]
+
+    def cpi(self, category=None, years=None, weights="ports"):
+        """EVs per (weighted) charger per town; NaN where a town has none."""
+        return self._cpi(self.ev_counts(category, years), self.capacity(weights))
+
+    @staticmethod
+    def _cpi(evs, capacity):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(capacity > 0, evs / capacity, np.nan)
+
+    def _table(self, rows, evs, capacity, cpi):
+        columns = {
+            "town": self.towns["town"].to_numpy()[rows],
+            "county": self.towns["county"].to_numpy()[rows],
+            "ev_registrations": evs[rows],
+        }
+        for name in self.ports.columns:
+            columns[name] = self.ports[name].to_numpy()[rows]
+        columns["charger_capacity"] = capacity[rows]
+        columns["evs_per_charger"] = cpi[rows]
+        return pd.DataFrame(columns, columns=PRESSURE_COLUMNS)
+
+    def table(self, category=None, years=None, weights="ports"):
+        """Every town with its registrations, chargers and CPI."""
+        capacity = self.capacity(weights)
+        evs = self.ev_counts(category, years)
+        cpi = self._cpi(evs, capacity)
+        return self._table(np.arange(len(self.towns)), evs, capacity, cpi)
+
+    def top_k(self, k, category=None, years=None, weights="ports", county=None):
+        """The `k` towns with the highest CPI, highest first.
+
+        Towns without a charger have no CPI and are left out (they show up in
+        the charging-desert view instead).
+        """
+        capacity = self.capacity(weights)
+        evs = self.ev_counts(category, years)
+        cpi = self._cpi(evs, capacity)
+        candidates = np.flatnonzero(~np.isnan(cpi))
+        if county is not None:
+            code = self._county_pos.get(county, -2)
+            candidates = candidates[self._county_codes[candidates] == code]
+        k = min(k, len(candidates))
+        if k == 0:
+            return self._table(candidates[:0], evs, capacity, cpi)
+        if k < len(candidates):
+            # Partial selection: the k largest in O(n), then sort only those.
+            # Ties at the cut-off are broken by town order, as a full sort would.
+            values = cpi[candidates]
+            kth = -np.partition(-values, k - 1)[k - 1]
+            above = candidates[values > kth]
+            ties = candidates[values == kth][: k - len(above)]
+            candidates = np.concatenate([above, ties])
+        rows = np.sort(candidates)
+        rows = rows[np.argsort(-cpi[rows], kind="stable")]
+        return self._table(rows, evs, capacity, cpi)
@@ -0,0 +1,85 @@
+"""Change detection for append-mostly source files.
+
+A fingerprint records a file's size, mtime, a SHA-256 of its whole content
+and hashes of its first and last `WINDOW` bytes. When the file later starts
+with exactly the old content (the head and tail windows are a cheap early
+reject; the prefix hash decides), it only grew: the new rows are the bytes
+after the old size, and `read_appended` hands them to the CSV parser behind
+the original header line. Anything else, including an edit in the middle of
+the file, counts as a rewrite.
+"""
+import hashlib
+import io
+import os
+
+WINDOW = 64 * 1024
+
+
+def _hash_range(f, start, end):
+    f.seek(start)
+    return hashlib.sha1(f.read(end - start)).hexdigest()
+
+
+def _prefix_digest(f, size, block_size=1 << 20):
+    """SHA-256 of the first `size` bytes."""
+    h = hashlib.sha256()
+    f.seek(0)
+    while size > 0:
+        block = f.read(min(block_size, size))
+        if not block:
+            break
+        h.update(block)
+        size -= len(block)
+    return h.hexdigest()
+
+
+def fingerprint(path):
+    """Dict with `size`, `mtime_ns`, `sha256`, `head`, `tail` and `eol` of
+    `path`."""
+    stat = os.stat(path)
+    size = stat.st_size
+    with open(path, "rb") as f:
+        head = _hash_range(f, 0, min(WINDOW, size))
+        tail = _hash_range(f, max(0, size - WINDOW), size)
+        f.seek(max(0, size - 1))
+        eol = f.read(1) in (b"\n", b"")
+        digest = _prefix_digest(f, size)
+    return {
+        "size": size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": digest,
+        "head": head,
+        "tail": tail,
+        "eol": eol,
+    }
+
+
+def appended_offset(path, old):
+    """Offset where new bytes start if `path` only grew since fingerprint
+    `old` (its old size; equal to the current size when nothing was added),
+    otherwise None."""
+    if not old or "sha256" not in old or not os.path.exists(path):
+        return None
+    if not old.get("eol"):
+        # A last row without a newline would be continued by the append
+        return None
+    old_size = old["size"]
+    if os.path.getsize(path) < old_size:
+        return None
+    with open(path, "rb") as f:
+        if _hash_range(f, 0, min(WINDOW, old_size)) != old["head"]:
+            return None
+        if _hash_range(f, max(0, old_size - WINDOW), old_size) != old["tail"]:
+            return None
+        # Same head and tail can still hide an edit in between
+        if _prefix_digest(f, old_size) != old["sha256"]:
+            return None
+    return old_size
+
+
+def read_appended(path, offset):
+    """Header line plus the bytes after `offset`, as a file-like CSV."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(offset)
+        return io.BytesIO(header + f.read())
@@ -0,0 +1,143 @@
+"""Adoption-driver regressions with bootstrap confidence intervals.
+
+EV registrations are regressed (OLS with an intercept) on public chargers,
+median household income (HDPulse, per $1,000) and population (per 1,000).
+Towns are fitted on chargers alone: the energy profiles have no town
+population, and income is only known per county, so giving each town its
+county's figure would pass 8 values off as 169 independent ones. Bootstrap
+resamples are drawn as multinomial row weights, so a batch of refits is one
+stacked (batch, p, p) weighted normal-equation solve; batches can be sharded
+across a process pool.
+"""
+import multiprocessing
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+Driver = namedtuple("Driver", ["label", "scale"])
+
+# Regressors, scaled so each coefficient reads "EVs per <label>"
+DRIVERS = {
+    "total_chargers": Driver("public charger", 1.0),
+    "median_income": Driver("$1,000 of median income", 1000.0),
+    "population_2016": Driver("1,000 residents", 1000.0),
+}
+
+LEVEL_DRIVERS = {
+    "county": ["total_chargers", "median_income", "population_2016"],
+    "town": ["total_chargers"],
+}
+
+# Resample counts from which `estimate` shards batches across processes
+PARALLEL_MIN_RESAMPLES = 20000
+
+# Resamples whose weighted X'X is this ill-conditioned (too few distinct
+# rows drawn) are dropped rather than solved
+MAX_CONDITION = 1e10
+
+Estimate = namedtuple("Estimate", ["table", "n_obs", "r_squared", "resamples"])
+
+
+def town_table(engine, category=None, years=None):
+    """Per-town EVs (for the filters) and chargers from a `TownPressure`."""
+    return pd.DataFrame(
+        {
+            "town": engine.towns["town"].to_numpy(),
+            "county": engine.towns["county"].to_numpy(),
+            "ev_registrations": engine.ev_counts(category, years),
+            "total_chargers": engine.ports["total_chargers"].to_numpy(),
+        }
+    )
+
+
+def design(table, drivers):
+    """Intercept + scaled drivers (X) and EV registrations (y), complete
+    rows only."""
+    cols = ["ev_registrations"] + list(drivers)
+    rows = table[cols].apply(pd.to_numeric, errors="coerce").dropna()
+    X = np.column_stack(
+        [np.ones(len(rows))]
+        + [rows[d].to_numpy(np.float64) / DRIVERS[d].scale for d in drivers]
+    )
+    return X, rows["ev_registrations"].to_numpy(np.float64)
+
+
+def _bootstrap_batch(args):
+    X, y, n, seed = args
+    rng = np.random.default_rng(seed)
+    n_obs = len(y)
+    # Row multiplicities of n resamples: (n, n_obs)
+    w = rng.multinomial(n_obs, np.full(n_obs, 1.0 / n_obs), size=n).astype(np.float64)
+    xtwx = np.einsum("bn,np,nq->bpq", w, X, X)
+    xtwy = np.einsum("bn,np,n->bp", w, X, y)
+    coef = np.full((n, X.shape[1]), np.nan)
+    ok = np.linalg.cond(xtwx) < MAX_CONDITION
+    coef[ok] = np.linalg.solve(xtwx[ok], xtwy[ok][..., None])[..., 0]
+    return coef
+
+
+def bootstrap(X, y, n_boot=2000, seed=0, workers=1, batch_size=2000):
+    """(n_boot, p) coefficients refitted on resampled rows; degenerate
+    resamples are NaN. Reproducible for a given seed whatever the number of
+    workers."""
+    sizes = [min(batch_size, n_boot - lo) for lo in range(0, n_boot, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(X, y, n, s) for n, s in zip(sizes, seeds)]
+    if workers and workers > 1 and len(jobs) > 1:
+        # Spawned, not forked: callers such as the Streamlit server are
+        # multithreaded, and a forked child can inherit a held lock
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            parts = list(pool.map(_bootstrap_batch, jobs))
+    else:
+        parts = [_bootstrap_batch(job) for job in jobs]
+    return np.concatenate(parts) if parts else np.zeros((0, X.shape[1]))
+
+
+def estimate(table, drivers=None, level="county", n_boot=2000, ci=0.95, seed=0,
+             workers=None):
+    """Coefficients with percentile bootstrap intervals.
+
+    `table` needs `ev_registrations` and the driver columns (a county table
+    or `town_table`). `workers=None` uses a process pool only from
+    `PARALLEL_MIN_RESAMPLES` resamples on.
+    """
+    drivers = LEVEL_DRIVERS[level] if drivers is None else drivers
+    X, y = design(table, drivers)
+    terms = ["intercept"] + list(drivers)
+    if len(y) <= X.shape[1]:
+        # Fewer rows than terms: nothing to estimate
+        empty = pd.DataFrame({"term": terms, "coefficient": np.nan})
+        return Estimate(empty, len(y), np.nan, 0)
+
+    coef = np.linalg.lstsq(X, y, rcond=None)[0]
+    resid = y - X @ coef
+    total = ((y - y.mean()) ** 2).sum()
+    r_squared = 1 - (resid**2).sum() / total if total > 0 else np.nan
+
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1) if n_boot >= PARALLEL_MIN_RESAMPLES else 1
+    boot = bootstrap(X, y, n_boot, seed, workers)
+    boot = boot[~np.isnan(boot).any(axis=1)]
+    tail = (1 - ci) / 2 * 100
+    if len(boot):
+        lo, hi = np.percentile(boot, [tail, 100 - tail], axis=0)
+        std = boot.std(axis=0, ddof=1) if len(boot) > 1 else np.full(len(terms), np.nan)
+    else:
+        lo = hi = std = np.full(len(terms), np.nan)
+
+    table = pd.DataFrame(
+        {
+            "term": terms,
+            "per": ["—"] + [DRIVERS[d].label for d in drivers],
+            "coefficient": coef,
+            "ci_low": lo,
+            "ci_high": hi,
+            "std_error": std,
+        }
+    )
+    return Estimate(table, len(y), r_squared, len(boot))
@@ -0,0 +1,189 @@
+"""Monte Carlo grid-headroom scenarios for EV charging load.
+
+Each scenario draws an EV growth rate, the share of EVs charging at the system
+peak, the home / DC fast charging mix and power, the county load factor and
+the capacity reserve margin. Draws come in seeded batches of scenario-level
+vectors. Future EVs and added MW are a county constant times a scenario
+factor, so their percentiles are the constant times the factor's. Headroom
+mixes two factors and is reduced one block of counties at a time (blocks can
+be sharded across a process pool), so no counties x scenarios array is kept.
+
+Baseline peak load comes from the 2016 energy-profile electricity
+consumption: `peak MW = annual MWh / 8760 / load factor`.
+"""
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ctev import energy_profiles
+
+HOURS_PER_YEAR = 8760
+
+# (low, high) bounds of the uniform draws
+ScenarioRanges = namedtuple(
+    "ScenarioRanges",
+    [
+        "growth",
+        "peak_share",
+        "home_kw",
+        "dcfc_share",
+        "dcfc_kw",
+        "load_factor",
+        "reserve_margin",
+        "ev_per_capita",
+    ],
+)
+
+DEFAULT_RANGES = ScenarioRanges(
+    growth=(0.10, 0.35),  # annual growth of the EV stock
+    peak_share=(0.05, 0.20),  # EVs charging during the system peak hour
+    home_kw=(6.6, 11.5),  # Level 2 charging power
+    dcfc_share=(0.02, 0.08),  # peak-hour sessions on DC fast chargers
+    dcfc_kw=(50.0, 150.0),
+    load_factor=(0.45, 0.60),  # average load / peak load
+    reserve_margin=(0.10, 0.20),  # capacity above today's peak
+    ev_per_capita=(0.005, 0.015),  # only used where EV counts are unknown
+)
+
+PERCENTILES = (10, 50, 90)
+
+# Per-scenario factors shared by every county
+Factors = namedtuple("Factors", ["ev_scale", "mw_per_ev", "capacity", "per_capita"])
+
+
+def _draw(rng, bounds, n):
+    lo, hi = bounds
+    return rng.uniform(lo, hi, n)
+
+
+def _draw_batch(args):
+    ranges, horizon_years, n, seed = args
+    rng = np.random.default_rng(seed)
+    r = ScenarioRanges(*ranges)
+
+    growth = _draw(rng, r.growth, n)
+    peak_share = _draw(rng, r.peak_share, n)
+    dcfc_share = _draw(rng, r.dcfc_share, n)
+    kw_per_ev = (1 - dcfc_share) * _draw(rng, r.home_kw, n) + (
+        dcfc_share * _draw(rng, r.dcfc_kw, n)
+    )
+    load_factor = _draw(rng, r.load_factor, n)
+    reserve = _draw(rng, r.reserve_margin, n)
+    per_capita = _draw(rng, r.ev_per_capita, n)
+
+    ev_scale = (1 + growth) ** horizon_years
+    return Factors(
+        ev_scale,
+        ev_scale * peak_share * kw_per_ev / 1000.0,  # added MW per EV today
+        reserve / load_factor,  # headroom MW per average MW
+        per_capita,
+    )
+
+
+def _headroom_block(args):
+    """Headroom percentiles and overload share for one block of counties."""
+    average_mw, base, known, f = args
+    # EVs today per county and scenario: (block, scenarios)
+    evs = np.where(known[:, None], base[:, None], base[:, None] * f.per_capita)
+    headroom_mw = average_mw[:, None] * f.capacity - evs * f.mw_per_ev
+    return (
+        np.percentile(headroom_mw, PERCENTILES, axis=1),
+        (headroom_mw < 0).mean(axis=1),
+    )
+
+
+def simulate(
+    counties,
+    n_scenarios=5000,
+    horizon_years=3,
+    ranges=DEFAULT_RANGES,
+    seed=0,
+    workers=1,
+    batch_size=1000,
+    block_size=256,
+):
+    """Distribution of added peak MW and headroom per county.
+
+    `counties` needs `county`, `ev_registrations` (may be NaN),
+    `population_2016` and one or more `*_mwh` consumption columns. Results are
+    reproducible for a given seed whatever the number of workers; memory
+    grows with `block_size` x `n_scenarios`, not with the county count.
+    """
+    mwh_cols = [c for c in counties.columns if c.endswith("_mwh")]
+    annual_mwh = counties[mwh_cols].fillna(0).sum(axis=1).to_numpy(np.float64)
+    ev_now = pd.to_numeric(counties["ev_registrations"], errors="coerce").to_numpy(
+        np.float64
+    )
+    population = counties["population_2016"].fillna(0).to_numpy(np.float64)
+
+    sizes = [
+        min(batch_size, n_scenarios - lo) for lo in range(0, n_scenarios, batch_size)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    parts = [
+        _draw_batch((tuple(ranges), horizon_years, n, s)) for n, s in zip(sizes, seeds)
+    ]
+    f = Factors(*(np.concatenate(draws) for draws in zip(*parts)))
+
+    # Where EV counts are unknown they are population x a drawn per-capita
+    # rate: fold the rate into that county group's scenario factors
+    known = ~np.isnan(ev_now)
+    base = np.where(known, ev_now, population)
+
+    out = pd.DataFrame({"county": counties["county"].to_numpy()})
+    out["ev_registrations"] = ev_now
+    out["baseline_peak_mw"] = (
+        annual_mwh / HOURS_PER_YEAR / np.mean(ranges.load_factor)
+    )
+    ev_p50 = np.empty(len(base))
+    added = np.empty((len(PERCENTILES), len(base)))
+    for group, per_ev in ((known, 1.0), (~known, f.per_capita)):
+        ev_p50[group] = base[group] * np.median(f.ev_scale * per_ev)
+        pct = np.percentile(f.mw_per_ev * per_ev, PERCENTILES)
+        added[:, group] = pct[:, None] * base[group]
+    out["ev_future_p50"] = ev_p50
+    for p, row in zip(PERCENTILES, added):
+        out[f"added_peak_mw_p{p}"] = row
+
+    average_mw = annual_mwh / HOURS_PER_YEAR
+    spans = [slice(lo, lo + block_size) for lo in range(0, len(base), block_size)]
+    jobs = [(average_mw[b], base[b], known[b], f) for b in spans]
+    if workers and workers > 1 and len(jobs) > 1:
+        # Spawned, not forked: the Streamlit server calling this is threaded
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            blocks = list(pool.map(_headroom_block, jobs))
+    else:
+        blocks = [_headroom_block(job) for job in jobs]
+    headroom = np.zeros((len(PERCENTILES), 0))
+    prob = np.zeros(0)
+    if blocks:
+        headroom = np.concatenate([b[0] for b in blocks], axis=1)
+        prob = np.concatenate([b[1] for b in blocks])
+    for p, row in zip(PERCENTILES, headroom):
+        out[f"headroom_mw_p{p}"] = row
+    out["prob_overload"] = prob
+    return out
+
+
+def us_counties(path, states=None):
+    """County inputs for `simulate` straight from the energy profiles file.
+
+    EV registrations are unknown outside the DMV export, so they are left NaN
+    and `simulate` falls back to `population x ev_per_capita`.
+    """
+    df = energy_profiles.read_profiles(
+        path,
+        {
+            "county": "county_state_name",
+            "population_2016": "population",
+            **energy_profiles.ELECTRICITY_FIELDS,
+        },
+        states=states,
+    )
+    df["ev_registrations"] = np.nan
+    return df.dropna(subset=["county"]).reset_index(drop=True)
@@ -0,0 +1,109 @@
+"""Read-only frames shared by every Streamlit session.
+
+The cleaned frames live once per process (`st.cache_resource`) instead of
+being unpickled into a fresh copy for each session. `freeze` wraps a frame so
+that column assignment, deletion, `.loc`/`.iloc`/`.at`/`.iat` writes and
+`inplace=True` methods raise `SharedFrameError`; the underlying buffers are
+also marked read-only. Anything derived from a frozen frame (filters, slices,
+merges) is an ordinary, writable DataFrame.
+"""
+import numpy as np
+import pandas as pd
+
+
+class SharedFrameError(TypeError):
+    pass
+
+
+def _refuse(*args, **kwargs):
+    raise SharedFrameError(
+        "cached frames are shared between sessions and read-only; "
+        "work on a filtered result or an explicit .copy()"
+    )
+
+
+class _ReadOnlyIndexer:
+    """`.loc` / `.iloc` / `.at` / `.iat` that can read but not assign."""
+
+    def __init__(self, indexer):
+        self._indexer = indexer
+
+    def __getitem__(self, key):
+        return self._indexer[key]
+
+    def __setitem__(self, key, value):
+        _refuse()
+
+    def __call__(self, *args, **kwargs):
+        return _ReadOnlyIndexer(self._indexer(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._indexer, name)
+
+
+class FrozenFrame(pd.DataFrame):
+    @property
+    def _constructor(self):
+        # Derived results are plain, writable frames
+        return pd.DataFrame
+
+    __setitem__ = _refuse
+    __delitem__ = _refuse
+    insert = _refuse
+    pop = _refuse
+    update = _refuse
+
+    def _update_inplace(self, *args, **kwargs):
+        _refuse()
+
+    def _set_value(self, *args, **kwargs):
+        _refuse()
+
+    @property
+    def loc(self):
+        return _ReadOnlyIndexer(super().loc)
+
+    @property
+    def iloc(self):
+        return _ReadOnlyIndexer(super().iloc)
+
+    @property
+    def at(self):
+        return _ReadOnlyIndexer(super().at)
+
+    @property
+    def iat(self):
+        return _ReadOnlyIndexer(super().iat)
+
+    def __setattr__(self, name, value):
+        if name in ("columns", "index") and "_mgr" in self.__dict__:
+            _refuse()
+        super().__setattr__(name, value)
+
+
+def _lock(values):
+    if isinstance(values, np.ndarray):
+        values.flags.writeable = False
+        return
+    # Extension arrays keep their data in one or more NumPy buffers
+    for attr in ("_ndarray", "_codes", "_data", "_mask"):
+        buf = getattr(values, attr, None)
+        if isinstance(buf, np.ndarray):
+            buf.flags.writeable = False
+
+
+def freeze(df):
+    """Read-only `FrozenFrame` over `df`'s data (no copy)."""
+    if isinstance(df, FrozenFrame):
+        return df
+    frozen = FrozenFrame(df)
+    for values in frozen._mgr.arrays:
+        _lock(values)
+    _lock(frozen.index.values)
+    return frozen
+
+
+def head_where(df, mask, n):
+    """First `n` rows where `mask` holds, materializing only those rows."""
+    pos = np.flatnonzero(np.asarray(mask, dtype=bool))[:n]
+    return df.iloc[pos]
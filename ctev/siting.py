@@ -0,0 +1,184 @@
+"""Where to put new chargers: greedy maximum coverage of unserved EVs.
+
+Demand points are town centroids weighted by the EVs that existing ports of
+the chosen type, within the drive radius, don't already serve. Candidate
+sites are town centroids or the cells of a regular grid. `Coverage` holds,
+per candidate, the demand points within the radius as a sparse (CSR) row
+list built from one `GridIndex` radius search. `lazy_greedy` then picks the
+sites with a priority queue of stale gains, re-scoring only the candidate at
+the top of the heap.
+"""
+import heapq
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from ctev.lod import KM_PER_DEG
+from ctev.spatial import GridIndex
+
+SiteType = namedtuple("SiteType", ["port_column", "radius_km", "evs_per_port"])
+
+# Defaults per site type: the ports counted as existing supply, how far a
+# driver goes to use one, and how many EVs one port serves
+SITE_TYPES = {
+    "level2": SiteType("ev_level2_evse_num", 5.0, 25.0),
+    "dc_fast": SiteType("ev_dc_fast_count", 25.0, 200.0),
+}
+
+SitingPlan = namedtuple("SitingPlan", ["sites", "evs", "unserved_evs", "covered_evs"])
+
+PLAN_COLUMNS = [
+    "rank",
+    "site",
+    "county",
+    "lat",
+    "lon",
+    "evs_covered",
+    "cumulative_evs_covered",
+    "share_of_unserved",
+]
+
+
+# ---------------------------------------------------------------
+# Demand and candidates
+# ---------------------------------------------------------------
+def town_points(towns):
+    """Towns with coordinates (`town`, `county`, `lat`, `lon`)."""
+    points = towns.dropna(subset=["lat", "lon"])[["town", "county", "lat", "lon"]]
+    return points.reset_index(drop=True)
+
+
+def town_candidates(towns):
+    """A candidate site at every town centroid."""
+    return town_points(towns).rename(columns={"town": "site"})
+
+
+def grid_candidates(points, cell_km=2.0):
+    """Cell centres of a `cell_km` grid over the bounding box of `points`,
+    each named after (and in the county of) its nearest point."""
+    lat, lon = points["lat"].to_numpy(), points["lon"].to_numpy()
+    dlat = cell_km / KM_PER_DEG
+    dlon = cell_km / (KM_PER_DEG * math.cos(math.radians(lat.mean())))
+    grid_lat, grid_lon = np.meshgrid(
+        np.arange(lat.min(), lat.max() + dlat, dlat),
+        np.arange(lon.min(), lon.max() + dlon, dlon),
+        indexing="ij",
+    )
+    grid_lat, grid_lon = grid_lat.ravel(), grid_lon.ravel()
+    _, near = GridIndex(lat, lon).nearest(grid_lat, grid_lon)
+    return pd.DataFrame(
+        {
+            "site": "cell near " + points["town"].to_numpy()[near].astype(object),
+            "county": points["county"].to_numpy()[near],
+            "lat": grid_lat,
+            "lon": grid_lon,
+        }
+    )
+
+
+def existing_ports(points, stations, port_column, radius_km):
+    """Ports of one type within `radius_km` of each point (a station counts
+    for every point it reaches)."""
+    stations = stations.dropna(subset=["lat", "lon"])
+    stations = stations[stations[port_column] > 0]
+    index = GridIndex(stations["lat"], stations["lon"])
+    return index.count_within(
+        points["lat"].to_numpy(), points["lon"].to_numpy(), radius_km,
+        weights=stations[port_column],
+    )
+
+
+def unserved_demand(evs, ports, evs_per_port):
+    """EVs left over once nearby ports each serve `evs_per_port`."""
+    return np.maximum(np.asarray(evs, dtype=np.float64) - ports * evs_per_port, 0.0)
+
+
+# ---------------------------------------------------------------
+# Coverage and selection
+# ---------------------------------------------------------------
+class Coverage:
+    def __init__(self, candidates, points, radius_km):
+        """Demand points (rows of `points`) within `radius_km` of each
+        candidate; both frames need `lat` / `lon`."""
+        cand, point = GridIndex(points["lat"], points["lon"]).pairs_within(
+            candidates["lat"].to_numpy(), candidates["lon"].to_numpy(), radius_km
+        )
+        # Pairs come ordered by candidate: CSR row pointers from the counts
+        self.indptr = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cand, minlength=len(candidates)), out=self.indptr[1:])
+        self.indices = point
+        self.n_points = len(points)
+        self.radius_km = radius_km
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def row(self, candidate):
+        return self.indices[self.indptr[candidate]:self.indptr[candidate + 1]]
+
+    def gains(self, weights):
+        """Total weight within reach of every candidate."""
+        rows = np.repeat(np.arange(len(self)), np.diff(self.indptr))
+        return np.bincount(rows, weights[self.indices], minlength=len(self))
+
+
+def lazy_greedy(coverage, weights, budget):
+    """Up to `budget` candidates maximizing the weight of points covered at
+    least once; returns the picks and the weight each one added.
+
+    Coverage is submodular, so a candidate's gain only shrinks as sites are
+    picked: a stale gain in the heap is an upper bound, and a candidate whose
+    re-scored gain still tops the heap is the best pick.
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    covered = np.zeros(coverage.n_points, dtype=bool)
+    heap = [(-g, c) for c, g in enumerate(coverage.gains(weights)) if g > 0]
+    heapq.heapify(heap)
+    picks, gains = [], []
+    while heap and len(picks) < budget:
+        _, c = heapq.heappop(heap)
+        rows = coverage.row(c)
+        rows = rows[~covered[rows]]
+        gain = weights[rows].sum()
+        if gain <= 0:
+            continue
+        if heap and gain < -heap[0][0]:
+            heapq.heappush(heap, (-gain, c))
+            continue
+        covered[rows] = True
+        picks.append(c)
+        gains.append(gain)
+    return np.array(picks, dtype=np.int64), np.array(gains, dtype=np.float64)
+
+
+def plan_sites(points, evs, candidates, stations, budget, site_type="level2",
+               radius_km=None, evs_per_port=None, coverage=None):
+    """Choose `budget` new sites covering the most unserved EVs.
+
+    `points` are demand points (`lat`, `lon`) with `evs` EVs each,
+    `candidates` possible sites (`site`, `county`, `lat`, `lon`) and
+    `stations` the cleaned station frame. A precomputed `coverage` for the
+    same candidates, points and radius can be passed in.
+    """
+    kind = SITE_TYPES[site_type]
+    radius_km = kind.radius_km if radius_km is None else radius_km
+    evs_per_port = kind.evs_per_port if evs_per_port is None else evs_per_port
+    evs = np.asarray(evs, dtype=np.float64)
+
+    ports = existing_ports(points, stations, kind.port_column, radius_km)
+    unserved = unserved_demand(evs, ports, evs_per_port)
+    if coverage is None:
+        coverage = Coverage(candidates, points, radius_km)
+    picks, gains = lazy_greedy(coverage, unserved, budget)
+
+    total_unserved = unserved.sum()
+    sites = candidates.iloc[picks][["site", "county", "lat", "lon"]].reset_index(drop=True)
+    sites.insert(0, "rank", np.arange(1, len(picks) + 1))
+    sites["evs_covered"] = gains
+    sites["cumulative_evs_covered"] = np.cumsum(gains)
+    sites["share_of_unserved"] = (
+        sites["cumulative_evs_covered"] / total_unserved if total_unserved > 0 else 0.0
+    )
+    return SitingPlan(sites[PLAN_COLUMNS], evs.sum(), total_unserved, gains.sum())
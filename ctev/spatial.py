@@ -0,0 +1,242 @@
+"""Spatial index over charging stations.
+
+`GridIndex` buckets points into a uniform grid on equirectangular-projected
+coordinates. Radius counts and nearest-neighbour searches gather candidate
+points from neighbouring cells for a whole batch of query points at once and
+score them with a vectorized haversine — there is no per-point Python loop.
+"""
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Projected distances slightly underestimate great-circle ones; keep a margin
+# when deciding that a nearest-neighbour search is complete.
+_SLACK = 0.98
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; inputs broadcast like NumPy arrays."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GridIndex:
+    def __init__(self, lat, lon, cell_km=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+
+        # Scale x by the smallest cos(lat) so projected distances never exceed
+        # true ones and ring searches stay exact.
+        max_abs_lat = np.abs(self.lat).max() if len(self.lat) else 0.0
+        self._kx = EARTH_RADIUS_KM * np.cos(np.radians(min(max_abs_lat, 89.0)))
+        self._ky = EARTH_RADIUS_KM
+
+        x, y = self._project(self.lat, self.lon)
+        self._x0 = x.min() if len(x) else 0.0
+        self._y0 = y.min() if len(y) else 0.0
+        if cell_km is None:
+            # Aim for a handful of points per occupied cell
+            area = (np.ptp(x) + 1.0) * (np.ptp(y) + 1.0) if len(x) else 1.0
+            cell_km = np.clip(np.sqrt(4.0 * area / max(len(x), 1)), 0.5, 200.0)
+        self.cell_km = float(cell_km)
+        cx, cy = self._cell(x, y)
+        self._nx = int(cx.max()) + 1 if len(cx) else 1
+        self._ny = int(cy.max()) + 1 if len(cy) else 1
+
+        cell_id = cx * self._ny + cy
+        self._order = np.argsort(cell_id, kind="stable")
+        self._starts = np.searchsorted(
+            cell_id[self._order], np.arange(self._nx * self._ny + 1)
+        )
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _project(self, lat, lon):
+        return np.radians(lon) * self._kx, np.radians(lat) * self._ky
+
+    def _cell(self, x, y):
+        cx = np.floor((x - self._x0) / self.cell_km).astype(np.int64)
+        cy = np.floor((y - self._y0) / self.cell_km).astype(np.int64)
+        return cx, cy
+
+    def _candidates(self, qlat, qlon, rings):
+        """(query, point) index pairs for all points within `rings` cells."""
+        qx, qy = self._project(qlat, qlon)
+        qcx, qcy = self._cell(qx, qy)
+        offsets = np.arange(-rings, rings + 1)
+        dx, dy = np.meshgrid(offsets, offsets, indexing="ij")
+        cx = qcx[:, None] + dx.ravel()[None, :]
+        cy = qcy[:, None] + dy.ravel()[None, :]
+        inside = (cx >= 0) & (cx < self._nx) & (cy >= 0) & (cy < self._ny)
+        cell = np.where(inside, cx * self._ny + cy, 0)
+
+        start = self._starts[cell].ravel()
+        length = np.where(inside, self._starts[cell + 1] - self._starts[cell], 0)
+        length = length.ravel()
+        total = int(length.sum())
+
+        q_idx = np.repeat(np.repeat(np.arange(len(qlat)), cell.shape[1]), length)
+        seg_begin = np.repeat(np.cumsum(length) - length, length)
+        within = np.arange(total) - seg_begin
+        p_idx = self._order[np.repeat(start, length) + within]
+        return q_idx, p_idx
+
+    def count_within(self, qlat, qlon, radius_km, weights=None, batch_size=2048):
+        """Number (or weighted sum) of points within `radius_km` of each query."""
+        qlat = np.atleast_1d(np.asarray(qlat, dtype=np.float64))
+        qlon = np.atleast_1d(np.asarray(qlon, dtype=np.float64))
+        out = np.zeros(len(qlat))
+        if not len(self) or not len(qlat):
+            return out
+        rings = int(np.ceil(radius_km / self.cell_km))
+        w = None if weights is None else np.asarray(weights, dtype=np.float64)
+
+        for lo in range(0, len(qlat), batch_size):
+            hi = min(lo + batch_size, len(qlat))
+            q_idx, p_idx = self._candidates(qlat[lo:hi], qlon[lo:hi], rings)
+            d = haversine_km(
+                qlat[lo:hi][q_idx], qlon[lo:hi][q_idx], self.lat[p_idx], self.lon[p_idx]
+            )
+            hit = d <= radius_km
+            out[lo:hi] = np.bincount(
+                q_idx[hit],
+                weights=None if w is None else w[p_idx[hit]],
+                minlength=hi - lo,
+            )
+        return out
+
+    def pairs_within(self, qlat, qlon, radius_km, batch_size=2048):
+        """(query, point) index pairs within `radius_km`, ordered by query."""
+        qlat = np.atleast_1d(np.asarray(qlat, dtype=np.float64))
+        qlon = np.atleast_1d(np.asarray(qlon, dtype=np.float64))
+        q_out, p_out = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        if not len(self) or not len(qlat):
+            return q_out[0], p_out[0]
+        rings = int(np.ceil(radius_km / self.cell_km))
+
+        for lo in range(0, len(qlat), batch_size):
+            hi = min(lo + batch_size, len(qlat))
+            q_idx, p_idx = self._candidates(qlat[lo:hi], qlon[lo:hi], rings)
+            d = haversine_km(
+                qlat[lo:hi][q_idx], qlon[lo:hi][q_idx], self.lat[p_idx], self.lon[p_idx]
+            )
+            hit = d <= radius_km
+            q_out.append(q_idx[hit] + lo)
+            p_out.append(p_idx[hit])
+        return np.concatenate(q_out), np.concatenate(p_out)
+
+    def nearest(self, qlat, qlon, max_km=None, batch_size=2048):
+        """Distance (km) and index of the nearest point to each query.
+
+        Queries with no point within `max_km` get `inf` and index -1.
+        """
+        qlat = np.atleast_1d(np.asarray(qlat, dtype=np.float64))
+        qlon = np.atleast_1d(np.asarray(qlon, dtype=np.float64))
+        best_d = np.full(len(qlat), np.inf)
+        best_i = np.full(len(qlat), -1, dtype=np.int64)
+        if not len(self):
+            return best_d, best_i
+
+        for lo in range(0, len(qlat), batch_size):
+            hi = min(lo + batch_size, len(qlat))
+            best_d[lo:hi], best_i[lo:hi] = self._nearest_batch(
+                qlat[lo:hi], qlon[lo:hi], max_km
+            )
+        return best_d, best_i
+
+    def _nearest_batch(self, qlat, qlon, max_km):
+        best_d = np.full(len(qlat), np.inf)
+        best_i = np.full(len(qlat), -1, dtype=np.int64)
+
+        # Rings needed before the search square covers the whole grid
+        qcx, qcy = self._cell(*self._project(qlat, qlon))
+        outside = np.maximum.reduce([
+            -qcx, qcx - (self._nx - 1), -qcy, qcy - (self._ny - 1),
+            np.zeros_like(qcx),
+        ])
+        max_rings = max(self._nx, self._ny) + int(outside.max())
+
+        pending = np.arange(len(qlat))
+        rings = 1
+        while len(pending):
+            q_idx, p_idx = self._candidates(qlat[pending], qlon[pending], rings)
+            d = haversine_km(
+                qlat[pending][q_idx], qlon[pending][q_idx],
+                self.lat[p_idx], self.lon[p_idx],
+            )
+            if len(d):
+                order = np.lexsort((d, q_idx))
+                first = order[np.unique(q_idx[order], return_index=True)[1]]
+                best_d[pending[q_idx[first]]] = d[first]
+                best_i[pending[q_idx[first]]] = p_idx[first]
+
+            # Anything outside the searched square is at least this far away
+            searched_km = rings * self.cell_km * _SLACK
+            done = (best_d[pending] <= searched_km) | (rings >= max_rings)
+            if max_km is not None:
+                done |= searched_km >= max_km
+            pending = pending[~done]
+            rings *= 2
+
+        if max_km is not None:
+            too_far = best_d > max_km
+            best_d[too_far] = np.inf
+            best_i[too_far] = -1
+        return best_d, best_i
+
+
+def station_access(towns, stations, radius_km=10.0):
+    """Per-town access metrics from station coordinates.
+
+    `towns` needs `lat`/`lon`; `stations` needs `lat`, `lon`, `total_chargers`,
+    `ev_dc_fast_count` and `ev_level2_evse_num`. Adds the distance to the
+    nearest DC-fast and Level 2 site and the charger totals within the radius.
+    """
+    stations = stations.dropna(subset=["lat", "lon"])
+    out = towns.copy()
+    qlat, qlon = out["lat"].to_numpy(), out["lon"].to_numpy()
+
+    all_idx = GridIndex(stations["lat"], stations["lon"])
+    out["chargers_within_r"] = all_idx.count_within(
+        qlat, qlon, radius_km, weights=stations["total_chargers"]
+    )
+    out["stations_within_r"] = all_idx.count_within(qlat, qlon, radius_km)
+
+    for col, label in (("ev_dc_fast_count", "dc_fast"), ("ev_level2_evse_num", "level2")):
+        subset = stations[stations[col] > 0]
+        idx = GridIndex(subset["lat"], subset["lon"])
+        out[f"nearest_{label}_km"] = idx.nearest(qlat, qlon)[0]
+        out[f"{label}_within_r"] = idx.count_within(
+            qlat, qlon, radius_km, weights=subset[col]
+        )
+    return out
+
+
+def charging_deserts(access, ev_counts, max_evs_per_charger=100.0):
+    """Rank towns by EVs per charger reachable within the access radius.
+
+    `ev_counts` is a town -> registrations Series. A town is a charging desert
+    when it has EVs but no charger within the radius, or more than
+    `max_evs_per_charger` EVs per nearby charger.
+    """
+    out = access.copy()
+    out["ev_registrations"] = (
+        out["town"].map(ev_counts).fillna(0).astype("int64")
+    )
+    nearby = out["chargers_within_r"].replace({0: np.nan})
+    out["evs_per_nearby_charger"] = out["ev_registrations"] / nearby
+    out["charging_desert"] = (out["ev_registrations"] > 0) & (
+        out["chargers_within_r"].eq(0)
+        | (out["evs_per_nearby_charger"] > max_evs_per_charger)
+    )
+    return out.sort_values(
+        ["charging_desert", "evs_per_nearby_charger", "ev_registrations"],
+        ascending=False,
+        na_position="first",
+    ).reset_index(drop=True)
@@ -0,0 +1,91 @@
+"""Bounded LRU cache of serialized chart and map specs.
+
+Entries are JSON strings keyed by the normalized filter state plus the data
+version, so a view that any session already rendered ("All CT", all EV types)
+is served without rebuilding or re-serializing the chart. The cache evicts
+least-recently-used entries once their total UTF-8 size exceeds `max_bytes`;
+it is thread-safe so one instance can be shared by every session.
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+DEFAULT_MAX_BYTES = int(os.environ.get("CTEV_SPEC_CACHE_MB", "64")) * 2**20
+
+CacheStats = namedtuple(
+    "CacheStats", ["hits", "misses", "evictions", "entries", "bytes", "max_bytes"]
+)
+
+
+class SpecCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, spec):
+        # Bytes, not characters: labels such as "🏛️" or "≥" take 3-4 each
+        size = len(spec.encode())
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                # Larger than the whole budget: serve it but don't keep it
+                return
+            self._entries[key] = (spec, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def get_or_build(self, key, build):
+        """Cached spec for `key`, or `build()` (a JSON string) stored under it."""
+        spec = self.get(key)
+        if spec is None:
+            spec = build()
+            self.put(key, spec)
+        return spec
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(
+                self.hits,
+                self.misses,
+                self.evictions,
+                len(self._entries),
+                self._bytes,
+                self.max_bytes,
+            )
+
+
+class DeckSpec:
+    """Pre-serialized stand-in for a `pydeck.Deck` accepted by `st.pydeck_chart`."""
+
+    layers = None
+    mapbox_key = None
+    width = None
+
+    def __init__(self, json, tooltip=None):
+        self._json = json
+        self._tooltip = tooltip
+
+    def to_json(self):
+        return self._json
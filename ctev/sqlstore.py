@@ -0,0 +1,189 @@
+"""Embedded SQLite store for the cleaned tables (`CTEV_BACKEND=sqlite`).
+
+The pipeline writes one database file per state and data version holding
+`registrations`, `stations`, `counties` and `health`. Registrations are
+inserted chunk by chunk, so the store can hold exports far larger than RAM;
+the app then never loads them: sidebar filters become `WHERE` clauses on the
+(county, ev_category, vehicle_year) indexes and only counts, group-bys and
+sample rows come back to Python. Everything runs in-process, no server.
+"""
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+from ctev import dtypes
+
+# Registration columns stored (when present), with their SQLite types
+REGISTRATION_COLUMNS = {
+    "id": "INTEGER",
+    "vin": "TEXT",
+    "primary_customer_city": "TEXT",
+    "vehicle_make": "TEXT",
+    "vehicle_model": "TEXT",
+    "vehicle_type": "TEXT",
+    "vehicle_year": "INTEGER",
+    "fuel_code": "TEXT",
+    "ev_category": "TEXT",
+    "town": "TEXT",
+    "county": "TEXT",
+}
+
+INDEXES = {
+    "registrations_filter": "registrations (county, ev_category, vehicle_year)",
+    "registrations_category": "registrations (ev_category, vehicle_year)",
+    "registrations_year": "registrations (vehicle_year)",
+    "registrations_town": "registrations (town, ev_category, vehicle_year)",
+    "stations_county": "stations (county)",
+}
+
+
+# ---------------------------------------------------------------
+# Writing
+# ---------------------------------------------------------------
+class RegistrationWriter:
+    """Appends cleaned registration chunks; the first row per key wins."""
+
+    def __init__(self, con, key=None):
+        self.con = con
+        self.key = key
+        self.columns = None
+        self.rows = 0
+
+    def _create(self, columns):
+        self.columns = [c for c in REGISTRATION_COLUMNS if c in columns]
+        defs = []
+        for c in self.columns:
+            unique = " UNIQUE" if c == self.key else ""
+            defs.append(f"{c} {REGISTRATION_COLUMNS[c]}{unique}")
+        self.con.execute(f"CREATE TABLE registrations ({', '.join(defs)})")
+
+    def write(self, ev):
+        if self.columns is None:
+            self._create(ev.columns)
+        values = ev[self.columns].astype(object)
+        values = values.where(values.notna(), None)
+        placeholders = ", ".join("?" * len(self.columns))
+        before = self.con.total_changes
+        self.con.executemany(
+            f"INSERT OR IGNORE INTO registrations ({', '.join(self.columns)}) "
+            f"VALUES ({placeholders})",
+            values.itertuples(index=False, name=None),
+        )
+        self.rows += self.con.total_changes - before
+
+    def close(self):
+        if self.columns is None:
+            # Nothing matched: an empty table with every known column
+            self._create(REGISTRATION_COLUMNS)
+        self.con.commit()
+
+
+def connect_for_build(path):
+    con = sqlite3.connect(path)
+    # Bulk load into a fresh file: no journal, no fsync per batch
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    return con
+
+
+def write_table(con, name, df):
+    """Replace table `name` with `df` (categoricals stored as text)."""
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+    df.to_sql(name, con, if_exists="replace", index=False)
+
+
+def create_indexes(con):
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master")}
+    for name, target in INDEXES.items():
+        if target.split()[0] in tables:
+            con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    con.execute("ANALYZE")
+    con.commit()
+
+
+def county_counts(con):
+    """Registrations per county (unmatched rows excluded)."""
+    return pd.read_sql(
+        "SELECT county, COUNT(*) AS n FROM registrations "
+        "WHERE county IS NOT NULL GROUP BY county",
+        con,
+    ).set_index("county")["n"]
+
+
+# ---------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------
+def _where(county=None, category=None, years=None, group="county"):
+    clauses, params = [], []
+    if county is not None:
+        clauses.append(f"{group} = ?")
+        params.append(county)
+    if category is not None:
+        clauses.append("ev_category = ?")
+        params.append(category)
+    if years is not None:
+        clauses.append("vehicle_year BETWEEN ? AND ?")
+        params.extend(int(y) for y in years)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+class SqlStore:
+    """Read-only queries against one store file (thread-safe)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _con(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            self._local.con = con
+        return con
+
+    def query(self, sql, params=()):
+        return pd.read_sql(sql, self._con(), params=list(params))
+
+    def count(self, county=None, category=None, years=None):
+        where, params = _where(county, category, years)
+        return int(self._con().execute(
+            f"SELECT COUNT(*) FROM registrations{where}", params
+        ).fetchone()[0])
+
+    def sample(self, n, county=None, category=None, years=None):
+        """First `n` registrations matching the filters."""
+        where, params = _where(county, category, years)
+        df = self.query(
+            f"SELECT * FROM registrations{where} ORDER BY rowid LIMIT ?", params + [n]
+        )
+        return df.astype({"vehicle_year": "Int16"}) if "vehicle_year" in df else df
+
+    def group_counts(self, group="county"):
+        """Registrations per (group, ev_category, vehicle_year)."""
+        return self.query(
+            f"SELECT {group}, ev_category, vehicle_year, COUNT(*) AS n "
+            f"FROM registrations GROUP BY {group}, ev_category, vehicle_year"
+        )
+
+    def unmatched_cities(self):
+        """Raw city strings (with row counts) that did not resolve to a town."""
+        df = self.query(
+            "SELECT primary_customer_city AS city, COUNT(*) AS n FROM registrations "
+            "WHERE town IS NULL AND primary_customer_city IS NOT NULL "
+            "GROUP BY primary_customer_city ORDER BY n DESC"
+        )
+        return df.set_index("city")["n"].rename("count")
+
+    def size_bytes(self):
+        return os.path.getsize(self.path)
+
+    def table(self, name):
+        return self.query(f"SELECT * FROM {name}")
+
+    def stations(self):
+        return dtypes.apply_plan(self.table("stations"), dtypes.STATION_PLAN)
@@ -0,0 +1,111 @@
+"""Text clean-up that scales with the number of distinct values.
+
+City, make and model columns repeat a few hundred to a few thousand strings
+across millions of rows. `TextNormalizer` factorizes a column, cleans only
+the values it has not seen before (trimmed, title case, then the make / model
+aliases from `data/vehicle_aliases.csv`, matched ignoring commas, periods and
+extra spaces, e.g. "TESLA, INC." -> "Tesla") and rebuilds the column as a
+categorical from the factor codes. One normalizer per field lives for the
+process, so later chunks, refreshes and states only pay for spellings that are
+new. The lookup is not written to disk: the cleaned frames themselves are
+(`ctev.frame_cache`), so only a rebuild starts from an empty table.
+"""
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ALIASES_PATH = Path(__file__).parent / "data" / "vehicle_aliases.csv"
+
+# Registration columns -> normalizer field
+REGISTRATION_FIELDS = {
+    "primary_customer_city": "city",
+    "vehicle_make": "make",
+    "vehicle_model": "model",
+}
+
+
+def clean_text(value):
+    """`" TESLA   INC "` -> `"Tesla Inc"`."""
+    return " ".join(str(value).split()).title()
+
+
+def alias_key(value):
+    """Cleaned text without periods or commas, which alias lookups ignore.
+
+    >>> alias_key(" TESLA, INC. "), alias_key("Tesla Inc"), alias_key("id.4")
+    ('Tesla Inc', 'Tesla Inc', 'Id4')
+    """
+    return clean_text(str(value).replace(".", "").replace(",", " "))
+
+
+def load_aliases(path=ALIASES_PATH):
+    """field -> {alias key: canonical name}, canonical names included."""
+    aliases = {}
+    if Path(path).exists():
+        for field, alias, name in pd.read_csv(path).itertuples(index=False):
+            table = aliases.setdefault(field, {})
+            table[alias_key(alias)] = name
+            table.setdefault(alias_key(name), name)
+    return aliases
+
+
+class TextNormalizer:
+    """Cleans and de-aliases values, remembering each raw spelling.
+
+    >>> norm = TextNormalizer(load_aliases()["make"])
+    >>> [norm.normalize_value(v) for v in ("Tesla, Inc.", "TESLA MOTORS,INC", " tesla ")]
+    ['Tesla', 'Tesla', 'Tesla']
+    >>> [norm.normalize_value(v) for v in ("bmw", "B.M.W.", "Rivian  Automotive")]
+    ['BMW', 'BMW', 'Rivian Automotive']
+    """
+
+    def __init__(self, aliases=None):
+        # `aliases`: alias key -> canonical name
+        self.aliases = aliases or {}
+        self.lookup = {}
+
+    def __len__(self):
+        return len(self.lookup)
+
+    def normalize_value(self, value):
+        if value not in self.lookup:
+            cleaned = clean_text(value)
+            self.lookup[value] = self.aliases.get(alias_key(cleaned), cleaned)
+        return self.lookup[value]
+
+    def normalize(self, values):
+        """Categorical of the cleaned `values` (missing values stay missing)."""
+        codes, uniques = pd.factorize(values)
+        cleaned = [self.normalize_value(u) for u in uniques]
+        # Raw spellings that clean to the same text share one category
+        merged, categories = pd.factorize(pd.Index(cleaned, dtype=object))
+        codes = np.where(codes >= 0, merged[codes], -1)
+        return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def unique_mask(values, keep):
+    """Rows whose value passes `keep`, called once per distinct value
+    (missing values never pass)."""
+    codes, uniques = pd.factorize(values)
+    # Missing values have code -1, i.e. the trailing False
+    passed = np.array([bool(keep(u)) for u in uniques] + [False])
+    return passed[codes]
+
+
+_NORMALIZERS = {}
+_NORMALIZERS_LOCK = threading.Lock()
+
+
+def normalizer(field):
+    """The process-wide normalizer for `field` ("city", "make", "model")."""
+    with _NORMALIZERS_LOCK:
+        if field not in _NORMALIZERS:
+            _NORMALIZERS[field] = TextNormalizer(load_aliases().get(field))
+        return _NORMALIZERS[field]
+
+
+def normalize_column(values, field):
+    """`values` cleaned with the shared `field` normalizer, as a Series."""
+    return pd.Series(normalizer(field).normalize(values), index=values.index, name=values.name)